@@ -3,7 +3,6 @@ from dotenv import load_dotenv
 load_dotenv()
 
 import os
-import requests
 
 from vulnerability_map import VULNERABILITY_MAP
 from config import AgentConfig
@@ -12,34 +11,24 @@ from monitors.windows_monitors import (
     disk_usage_pct,
     top_cpu_processes,
 )
+from monitors.cpu_sampler import get_cpu_sampler
+from monitors.backend_health import probe_backend_health as check_backend_health
 from actions.windows_actions import clear_temp, try_backend_recover
 from templates.email_template import build_email
 from email_tool import send_email
 
 # ✅ Gemini diagnosis + email drafting
-from llm.gemini_client import diagnose_and_draft
+from llm.gemini_client import GEMINI_TIMEOUT_SECONDS, GEMINI_QUEUE_TIMEOUT_SECONDS
+from llm.follow_up import start_follow_up
 
 # ✅ NEW: KB loader (Excel from GitHub raw or any direct URL)
 from kb.kb_loader import load_kb, lookup_vuln
+from services.paths import data_path
 
 
 print(">>> RUNNING agent.py from:", __file__, flush=True)
 
 
-def check_backend_health(base_url: str) -> dict:
-    """
-    Checks GET {base_url}/health
-    Returns: {"ok": bool, "status_code": int|None, "details": str}
-    """
-    try:
-        r = requests.get(f"{base_url}/health", timeout=3)
-        if r.status_code == 200:
-            return {"ok": True, "status_code": 200, "details": r.text}
-        return {"ok": False, "status_code": r.status_code, "details": r.text}
-    except Exception as e:
-        return {"ok": False, "status_code": None, "details": f"Unreachable: {e}"}
-
-
 def get_vuln_mapping_fallback(incident_type: str) -> dict:
     """
     Old fallback: uses local python dict mapping.
@@ -117,6 +106,8 @@ def decide_and_act(cfg: AgentConfig):
     # -------------------------
     # Scenario 2: CPU Spike (demo)
     # -------------------------
+    # One-shot run: the sampler may have started only seconds ago
+    get_cpu_sampler().wait_for_coverage(cfg.cpu_duration_seconds)
     if cpu_high_for(cfg.cpu_duration_seconds, cfg.cpu_threshold_pct):
         tops = top_cpu_processes(5)
         incident = {
@@ -185,6 +176,9 @@ def decide_and_act(cfg: AgentConfig):
 def main():
     cfg = AgentConfig()
 
+    # Start sampling CPU right away so history builds up while the KB loads
+    get_cpu_sampler()
+
     # -------------------------
     # ✅ KB Config (from ENV)
     # -------------------------
@@ -192,11 +186,12 @@ def main():
     # KB_URL=https://raw.githubusercontent.com/<user>/<repo>/main/CWE_Knowledge_Base.xlsx
     kb_url = os.getenv("KB_URL", "").strip()
     kb_refresh = os.getenv("KB_REFRESH", "false").strip().lower() in ("1", "true", "yes")
-    kb_cache_dir = os.getenv("KB_CACHE_DIR", ".kb_cache").strip() or ".kb_cache"
+    kb_cache_dir = os.getenv("KB_CACHE_DIR", "").strip() or data_path("kb_cache")
     kb_filename = os.getenv("KB_FILENAME", "CWE_Knowledge_Base.xlsx").strip() or "CWE_Knowledge_Base.xlsx"
 
     kb_mapping = {}
-    kb_status = {"enabled": False, "ok": False, "error": None, "source": None}
+    kb_index = None
+    kb_status = {"enabled": False, "ok": False, "error": None, "source": None, "snapshot": False, "load_ms": None, "ingest": None}
 
     if kb_url:
         kb_status["enabled"] = True
@@ -209,7 +204,11 @@ def main():
         kb_status["ok"] = kb_res.ok
         kb_status["error"] = kb_res.error
         kb_status["source"] = kb_res.source
+        kb_status["snapshot"] = kb_res.from_snapshot
+        kb_status["load_ms"] = kb_res.load_ms
+        kb_status["ingest"] = kb_res.ingest
         kb_mapping = kb_res.mapping if kb_res.ok else {}
+        kb_index = kb_res.index if kb_res.ok else None
 
     print("\n========== SRE AI Agent Execution ==========", flush=True)
     print(f"Target Host       : {cfg.host_label}", flush=True)
@@ -222,6 +221,17 @@ def main():
         print("\n[KB Status]", flush=True)
         if kb_status["ok"]:
             print(f"- KB loaded OK from: {kb_status['source']}", flush=True)
+            loaded_from = "snapshot" if kb_status["snapshot"] else "Excel parse"
+            print(f"- KB load time: {kb_status['load_ms']} ms ({loaded_from})", flush=True)
+            if kb_status["ingest"]:
+                ing = kb_status["ingest"]
+                print(
+                    f"- KB ingest: {ing['rows']} rows -> {ing['entries']} entries, "
+                    f"read {ing['read_ms']} ms, ingest {ing['ingest_ms']} ms ({ing['rows_per_sec']} rows/s)",
+                    flush=True,
+                )
+            if kb_status["error"]:
+                print(f"- KB warning: {kb_status['error']}", flush=True)
         else:
             print(f"- KB load FAILED: {kb_status['error']}", flush=True)
 
@@ -230,8 +240,15 @@ def main():
 
     # ✅ Pick vuln mapping: KB first, else fallback python map
     if kb_mapping:
-        vuln = lookup_vuln(incident.get("type", "Unknown Incident"), kb_mapping)
+        vuln = lookup_vuln(
+            incident.get("type", "Unknown Incident"),
+            kb_mapping,
+            details=incident.get("details"),
+            index=kb_index,
+        )
         vuln_source = "KB"
+        if vuln.get("match"):
+            vuln_source = f"KB, matched '{vuln['match']['key']}' on {', '.join(vuln['match']['reasons'])}"
     else:
         vuln = get_vuln_mapping_fallback(incident.get("type", "Unknown Incident"))
         vuln_source = "LOCAL_MAP"
@@ -263,54 +280,57 @@ def main():
         print(f"- {step}", flush=True)
 
     # ---------------------------------------------------------
-    # Gemini diagnosis + email drafting (with fallback)
+    # Template alert first: time-to-notify never waits on the LLM
     # ---------------------------------------------------------
-    print("\n[LLM Diagnosis + Email Drafting]", flush=True)
-
-    subject = None
-    body_html = None
-
-    try:
-        draft = diagnose_and_draft(
-            incident=incident,
-            evidence=evidence,
-            attempts=attempts,
-            status=status,
-            next_steps=next_steps,
-            vulnerability=vuln,  # ✅ now coming from KB (or fallback)
-            style="concise",
-        )
-
-        subject = draft.get("email_subject")
-        body_html = draft.get("email_body_html")
-
-        print("\n[LLM Diagnosis]", flush=True)
-        print(draft.get("diagnosis", "(no diagnosis text returned)"), flush=True)
-
-        if not subject or not body_html or len(body_html.strip()) < 50:
-            raise RuntimeError("Gemini returned empty/invalid subject or email body.")
-
-    except Exception:
-        import traceback
-
-        print("Gemini drafting failed -> falling back to template.", flush=True)
-        traceback.print_exc()
-
-        subject, body_html = build_email(
-            subject_prefix="[SRE-AI]",
-            host=cfg.host_label,
-            incident=incident,
-            attempts=attempts,
-            status=status,
-            next_steps=next_steps,
-            vuln=vuln,
-        )
+    subject, body_html = build_email(
+        subject_prefix="[SRE-AI]",
+        host=cfg.host_label,
+        incident=incident,
+        attempts=attempts,
+        status=status,
+        next_steps=next_steps,
+        vuln=vuln,
+    )
 
     print("\n[Notification]", flush=True)
     print("Sending email...", flush=True)
     send_email(cfg.to_email, subject, body_html, html=True)
     print("Email sent successfully.", flush=True)
 
+    # ---------------------------------------------------------
+    # Gemini diagnosis follows as a threaded reply + annotation
+    # ---------------------------------------------------------
+    print("\n[LLM Diagnosis + Email Drafting] (background)", flush=True)
+
+    def annotate(fields):
+        incident.update(fields)
+        print("\n[LLM Diagnosis]", flush=True)
+        print(fields.get("llm_diagnosis") or "(no diagnosis text returned)", flush=True)
+
+    def send_follow_up(follow_subject, follow_body, headers):
+        # The "Re:" subject threads the reply; headers are extra, and older email_tool builds don't take them
+        try:
+            send_email(cfg.to_email, follow_subject, follow_body, html=True, headers=headers)
+        except TypeError:
+            send_email(cfg.to_email, follow_subject, follow_body, html=True)
+        print(f"Follow-up sent: {follow_subject}", flush=True)
+
+    follow_up = start_follow_up(
+        incident=incident,
+        evidence=evidence,
+        attempts=attempts,
+        status=status,
+        next_steps=next_steps,
+        vulnerability=vuln,
+        alert_subject=subject,
+        send=send_follow_up,
+        annotate=annotate,
+        style="concise",
+    )
+
+    # One-shot run: give the follow-up its deadline before the process exits
+    follow_up.join(timeout=GEMINI_TIMEOUT_SECONDS + GEMINI_QUEUE_TIMEOUT_SECONDS + 5)
+
     print("\n========== Execution Completed ==========\n", flush=True)
 
 
@@ -1,113 +1,346 @@
 from datetime import datetime
-from ..services.storage import INCIDENTS, AGENT_RUNNING
+from ..services.storage import AGENT_RUNNING, get_incident_store
 from .detector import detect_cpu_issue
 from .remediator import remediate
-from .notifier import send_email
-from ..monitors.http_monitors import monitor_endpoints
-import requests
+from .notifier import send_email, send_digest
+from .digest import DigestBatcher
+from ..templates.email_template import build_digest_email
+from .scheduler import Check, MonitorScheduler
+from .dispatch import NotificationDispatcher, priority_for
+from .sharding import ShardedAgent
+from .suppression import IncidentCoalescer
+from ..monitors.http_monitors import ProbeEngine, monitor_endpoints, monitor_endpoints_async
+from ..monitors.cpu_sampler import get_cpu_sampler
+from ..services.tsdb import get_tsdb
+from ..services.outbox import get_outbox, stop_outbox
+from ..llm.batcher import diagnose_batch
+from ..llm.resilience import LLMUnavailableError
+from functools import partial
+from typing import Optional
 import os
 import threading
 import time
 
+ENDPOINTS = [
+    "http://18.237.102.97:9081/users",
+    "http://18.237.102.97:9082/orders",
+    "http://18.237.102.97:9083/products",
+    "http://18.237.102.97:9084/notifications"
+]
+
+CHECK_INTERVAL_SECONDS = 60
+CHECK_JITTER_SECONDS = 5
+CHECK_DEADLINE_SECONDS = 15
+
+SCHEDULER = None
+SHARDED = None
+_CPU_METRICS_ATTACHED = False
+
+# Built on first use, not at import, so importing this module opens no stores
+COALESCER: Optional[IncidentCoalescer] = None
+DISPATCHER: Optional[NotificationDispatcher] = None
+DIGEST: Optional[DigestBatcher] = None
+DIAGNOSIS_BATCHER: Optional[DigestBatcher] = None
+_COMPONENTS_LOCK = threading.Lock()
+
+def get_coalescer() -> IncidentCoalescer:
+    """Repeats of an open incident notify at most once per SUPPRESSION_WINDOW_SECONDS."""
+    global COALESCER
+    with _COMPONENTS_LOCK:
+        if COALESCER is None:
+            COALESCER = IncidentCoalescer(
+                get_incident_store(), window=float(os.getenv("SUPPRESSION_WINDOW_SECONDS", "900"))
+            )
+        return COALESCER
+
+def get_dispatcher() -> NotificationDispatcher:
+    global DISPATCHER
+    with _COMPONENTS_LOCK:
+        if DISPATCHER is None:
+            DISPATCHER = NotificationDispatcher(
+                workers=int(os.getenv("DISPATCH_WORKERS", "4")),
+                maxsize=int(os.getenv("DISPATCH_QUEUE_SIZE", "1000")),
+                overflow=os.getenv("DISPATCH_OVERFLOW_POLICY", "drop_low"),
+            )
+        return DISPATCHER
+
 def trigger_power_automate(incident: dict):
-    """Trigger Power Automate flow with incident data."""
+    """Queue a Power Automate flow trigger; the outbox delivers it with retries."""
     pa_url = os.getenv("POWER_AUTOMATE_WEBHOOK_URL")
     if pa_url:
-        try:
-            requests.post(pa_url, json=incident, timeout=10)
-        except Exception as e:
-            print(f"Failed to trigger Power Automate: {e}")
-
-def monitor_loop():
-    while AGENT_RUNNING:
-        # Check CPU
-        incident = detect_cpu_issue()
-        if incident:
-            action, exit_code = remediate(incident)
-            email_status = send_email(incident)
-            full_incident = {
-                "host": "linux-server-01",
-                "type": "CPU 100%",
-                "severity": "Critical",
-                "detected_at": datetime.now().isoformat(),
-                "decision": "Auto Remediation",
-                "remediation": action,
-                "exit_code": exit_code,
-                "email_sent": email_status
-            }
-            INCIDENTS.append(full_incident)
-            trigger_power_automate(full_incident)
-
-        # Check HTTP endpoints
-        endpoints = [
-            "http://18.237.102.97:9081/users",
-            "http://18.237.102.97:9082/orders",
-            "http://18.237.102.97:9083/products",
-            "http://18.237.102.97:9084/notifications"
-        ]
-        http_incidents = monitor_endpoints(endpoints)
-        for inc in http_incidents:
-            full_incident = {
-                "host": "ec2-instance",
+        # Same incident + occurrence count -> same key, so redeliveries can be de-duplicated.
+        # detected_at keeps keys distinct if incident ids restart after a store reset.
+        key = f"incident-{incident.get('id')}-{incident.get('occurrences', 1)}-{incident.get('detected_at', '')}"
+        get_outbox().enqueue(pa_url, incident, key=key)
+
+def _mark_email_sent(full_incident: dict, email_status) -> None:
+    if "email_sent" in full_incident:
+        full_incident["email_sent"] = email_status
+        get_incident_store().update(full_incident["id"], email_sent=email_status)
+
+def send_digest_batch(incidents: list, window_start: str, window_end: str):
+    """One email for a batch of non-critical incidents."""
+    subject, body = build_digest_email("[SRE Agent]", incidents, window_start, window_end)
+    email_status = send_digest(subject, body, incidents)
+    for full_incident in incidents:
+        _mark_email_sent(full_incident, email_status)
+
+# Non-critical emails are batched; EMAIL_DIGEST_WINDOW_SECONDS=0 sends each one as before
+DIGEST_WINDOW_SECONDS = float(os.getenv("EMAIL_DIGEST_WINDOW_SECONDS", "60"))
+
+def get_digest() -> DigestBatcher:
+    global DIGEST
+    with _COMPONENTS_LOCK:
+        if DIGEST is None:
+            DIGEST = DigestBatcher(
+                send_digest_batch,
+                window=DIGEST_WINDOW_SECONDS,
+                max_batch=int(os.getenv("EMAIL_DIGEST_MAX_BATCH", "25")),
+            )
+        return DIGEST
+
+def notify(full_incident: dict, email_payload: dict):
+    """Runs on a dispatcher worker, never on the detection path."""
+    if DIGEST_WINDOW_SECONDS > 0 and str(full_incident.get("severity", "")).upper() != "CRITICAL":
+        get_digest().add(full_incident)
+    else:
+        _mark_email_sent(full_incident, send_email(email_payload))
+    trigger_power_automate(full_incident)
+
+def annotate_diagnoses(batch: list, window_start: str, window_end: str):
+    """One LLM call for a burst of new incidents; each gets its own annotation."""
+    try:
+        results = diagnose_batch(batch)
+    except LLMUnavailableError as e:
+        print(f"[LLM] batch of {len(batch)} skipped: {e}")
+        return
+    diagnosed_at = datetime.now().isoformat()
+    for item, result in zip(batch, results):
+        if result is not None:
+            get_incident_store().update(
+                item["incident"]["id"],
+                llm_diagnosis=result["diagnosis"],
+                llm_next_steps=result["next_steps"],
+                llm_diagnosed_at=diagnosed_at,
+            )
+
+# Opt-in: incidents opened within the window share one Gemini round trip
+LLM_DIAGNOSIS_ENABLED = os.getenv("LLM_DIAGNOSIS_ENABLED", "false").strip().lower() in ("1", "true", "yes")
+
+def get_diagnosis_batcher() -> DigestBatcher:
+    global DIAGNOSIS_BATCHER
+    with _COMPONENTS_LOCK:
+        if DIAGNOSIS_BATCHER is None:
+            DIAGNOSIS_BATCHER = DigestBatcher(
+                annotate_diagnoses,
+                window=float(os.getenv("LLM_BATCH_WINDOW_SECONDS", "2")),
+                max_batch=int(os.getenv("LLM_BATCH_MAX_INCIDENTS", "8")),
+                name="llm-diagnosis",
+            )
+        return DIAGNOSIS_BATCHER
+
+def request_diagnosis(full_incident: dict, evidence: dict):
+    if LLM_DIAGNOSIS_ENABLED:
+        get_diagnosis_batcher().add({
+            "incident": full_incident,
+            "evidence": evidence,
+            "status": full_incident.get("decision", ""),
+            "attempts": [full_incident["remediation"]] if full_incident.get("remediation") else [],
+        })
+
+def dispatch_notification(full_incident: dict, email_payload: dict):
+    priority = priority_for(full_incident["severity"], full_incident.get("decision", ""))
+    if not get_dispatcher().submit(priority, notify, full_incident, email_payload):
+        print(f"[Dispatch] dropped notification for {full_incident['type']} ({full_incident['severity']})")
+
+def handle_cpu_incident(incident):
+    if not incident:
+        # A clean check closes the open CPU incident, if any
+        get_coalescer().resolve("linux-server-01", "CPU 100%", "cpu")
+        return
+    action, exit_code = remediate(incident)
+    full_incident = {
+        "host": "linux-server-01",
+        "type": "CPU 100%",
+        "target": "cpu",
+        "severity": "Critical",
+        "detected_at": datetime.now().isoformat(),
+        "decision": "Auto Remediation",
+        "remediation": action,
+        "exit_code": exit_code,
+        "email_sent": False
+    }
+    full_incident, should_notify = get_coalescer().record(full_incident)
+    if should_notify:
+        dispatch_notification(full_incident, {**incident, "occurrences": full_incident.get("occurrences", 1)})
+        if full_incident.get("occurrences", 1) == 1:
+            request_diagnosis(full_incident, incident)
+
+def handle_http_incidents(http_incidents):
+    for inc in http_incidents:
+        full_incident = {
+            "host": "ec2-instance",
+            "type": inc["type"],
+            "target": inc.get("target"),
+            "severity": inc["severity"],
+            "detected_at": inc["timestamp"].isoformat(),
+            "decision": "Monitor Only",
+            "details": inc["details"]
+        }
+        full_incident, should_notify = get_coalescer().record(full_incident)
+        if should_notify:
+            dispatch_notification(full_incident, {
                 "type": inc["type"],
+                "details": inc["details"],
                 "severity": inc["severity"],
-                "detected_at": inc["timestamp"].isoformat(),
-                "decision": "Monitor Only",
-                "details": inc["details"]
-            }
-            INCIDENTS.append(full_incident)
-            send_email({"type": inc["type"], "details": inc["details"], "severity": inc["severity"]})
-            trigger_power_automate(full_incident)
+                "occurrences": full_incident.get("occurrences", 1),
+            })
+            if full_incident.get("occurrences", 1) == 1:
+                request_diagnosis(full_incident, {})
+
+def record_probe(result: dict):
+    """Keep probe latency and up/down history in the metrics store; a healthy probe closes its incident."""
+    record_probes([result])
+
+def record_probes(results: list):
+    """Bulk form of record_probe: all points go to the metrics store in one append."""
+    now = time.time()
+    points = []
+    coalescer = get_coalescer()
+    for result in results:
+        if result["status"] == "healthy":
+            coalescer.resolve("ec2-instance", "HTTP Endpoint Down", result["url"])
+        if "response_time" in result:
+            points.append((f"http.response_time_ms:{result['url']}", now, result["response_time"]))
+        points.append((f"http.up:{result['url']}", now, 1.0 if result["status"] == "healthy" else 0.0))
+    if points:
+        get_tsdb().append_many(points)
+
+def attach_cpu_metrics():
+    global _CPU_METRICS_ATTACHED
+    if not _CPU_METRICS_ATTACHED:
+        tsdb = get_tsdb()
+        get_cpu_sampler().add_listener(lambda ts, pct: tsdb.append("cpu.percent", ts, pct))
+        _CPU_METRICS_ATTACHED = True
 
-        time.sleep(60)  # Monitor every 60 seconds
+def build_checks(config: dict, engine: ProbeEngine, include_endpoints: bool = True) -> list:
+    """
+    One check for CPU plus one per endpoint, each with its own interval,
+    jitter and deadline so a dead endpoint only delays itself. Endpoint
+    checks share the engine's keep-alive pool.
+    """
+    config = config or {}
+    interval = float(config.get("interval_seconds", CHECK_INTERVAL_SECONDS))
+    jitter = float(config.get("jitter_seconds", CHECK_JITTER_SECONDS))
+    deadline = float(config.get("deadline_seconds", CHECK_DEADLINE_SECONDS))
+
+    checks = [
+        Check(
+            name="cpu",
+            func=detect_cpu_issue,
+            interval=interval,
+            jitter=jitter,
+            deadline=deadline,
+            on_result=handle_cpu_incident,
+        )
+    ]
+    if not include_endpoints:
+        return checks
+    for url in config.get("endpoints", ENDPOINTS):
+        checks.append(Check(
+            name=f"http:{url}",
+            func=partial(monitor_endpoints_async, [url], engine, record_probe),
+            interval=interval,
+            jitter=jitter,
+            deadline=deadline,
+            on_result=handle_http_incidents,
+        ))
+    return checks
 
 def start_agent(config):
-    global AGENT_RUNNING
+    """
+    Start monitoring. config["mode"] == "sharded" spreads endpoint checks over
+    config["workers"] processes (default: CPU count); CPU checks always run
+    in this process.
+    """
+    global AGENT_RUNNING, SCHEDULER, SHARDED
     if not AGENT_RUNNING:
         AGENT_RUNNING = True
-        thread = threading.Thread(target=monitor_loop, daemon=True)
-        thread.start()
+        config = config or {}
+        sharded = config.get("mode") == "sharded"
+        get_cpu_sampler().start()
+        attach_cpu_metrics()
+        get_outbox().start()  # resume anything left undelivered by a previous run
+        SCHEDULER = MonitorScheduler()
+        engine = ProbeEngine(
+            limit=int(config.get("max_connections", 256)),
+            limit_per_host=int(config.get("max_connections_per_host", 8)),
+        )
+        for check in build_checks(config, engine, include_endpoints=not sharded):
+            SCHEDULER.add_check(check)
+        SCHEDULER.add_shutdown_hook(engine.close)
+        SCHEDULER.start()
+        if sharded:
+            SHARDED = ShardedAgent(
+                config.get("endpoints", ENDPOINTS),
+                on_incidents=handle_http_incidents,
+                workers=int(config.get("workers") or os.cpu_count() or 2),
+                config=config,
+                on_probes=record_probes,
+            )
+            SHARDED.start()
 
 def stop_agent():
-    global AGENT_RUNNING
+    global AGENT_RUNNING, SCHEDULER, SHARDED
     AGENT_RUNNING = False
+    if SCHEDULER is not None:
+        SCHEDULER.stop()
+        SCHEDULER = None
+    if SHARDED is not None:
+        SHARDED.stop()
+        SHARDED = None
+    # Nothing to flush if they were never built
+    for batcher in (DIGEST, DIAGNOSIS_BATCHER):
+        if batcher is not None:
+            batcher.flush()
+    # Drain queued notifications first: they may still enqueue webhook deliveries
+    if DISPATCHER is not None:
+        DISPATCHER.stop()
+    stop_outbox()
+
+def scale_agent(workers: int) -> dict:
+    """Grow or shrink the shard pool to `workers` processes."""
+    if SHARDED is None:
+        return {"error": "Agent is not running in sharded mode"}
+    workers = max(1, int(workers))
+    while len(SHARDED.stats()["workers"]) < workers:
+        SHARDED.add_worker()
+    while len(SHARDED.stats()["workers"]) > workers:
+        if SHARDED.remove_worker() is None:
+            break
+    return SHARDED.stats()
+
+def agent_status() -> dict:
+    if SCHEDULER is None:
+        return {"running": False, "checks": {}}
+    status = SCHEDULER.stats()
+    if SHARDED is not None:
+        status["shards"] = SHARDED.stats()
+    return status
+
+def agent_metrics() -> dict:
+    return {
+        "scheduler": agent_status(),
+        "dispatch": get_dispatcher().stats(),
+        "suppression": get_coalescer().stats(),
+        "digest": get_digest().stats(),
+        "webhooks": get_outbox().stats(),
+        "llm_batches": get_diagnosis_batcher().stats(),
+    }
 
 def simulate_incident():
     # Check CPU
-    incident = detect_cpu_issue()
-    if incident:
-        action, exit_code = remediate(incident)
-        email_status = send_email(incident)
-        full_incident = {
-            "host": "linux-server-01",
-            "type": "CPU 100%",
-            "severity": "Critical",
-            "detected_at": datetime.now().isoformat(),
-            "decision": "Auto Remediation",
-            "remediation": action,
-            "exit_code": exit_code,
-            "email_sent": email_status
-        }
-        INCIDENTS.append(full_incident)
-        trigger_power_automate(full_incident)
+    handle_cpu_incident(detect_cpu_issue())
 
     # Check HTTP endpoints
-    endpoints = [
-        "http://18.237.102.97:9081/users",
-        "http://18.237.102.97:9082/orders",
-        "http://18.237.102.97:9083/products",
-        "http://18.237.102.97:9084/notifications"
-    ]
-    http_incidents = monitor_endpoints(endpoints)
-    for inc in http_incidents:
-        full_incident = {
-            "host": "ec2-instance",
-            "type": inc["type"],
-            "severity": inc["severity"],
-            "detected_at": inc["timestamp"].isoformat(),
-            "decision": "Monitor Only",
-            "details": inc["details"]
-        }
-        INCIDENTS.append(full_incident)
-        send_email({"type": inc["type"], "details": inc["details"], "severity": inc["severity"]})
-        trigger_power_automate(full_incident)
+    handle_http_incidents(monitor_endpoints(ENDPOINTS))
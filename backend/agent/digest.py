@@ -0,0 +1,123 @@
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, List, Optional
+
+
+class DigestBatcher:
+    """
+    Collects items and hands them to `send(batch, window_start, window_end)`
+    as one batch, either `window` seconds after the first item of a batch
+    arrived or as soon as `max_batch` items are waiting, whichever is first.
+
+    A background thread does the flushing, so add() never blocks on delivery.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[List[Any], str, str], None],
+        window: float = 60.0,
+        max_batch: int = 25,
+        name: str = "email-digest",
+    ):
+        self.send = send
+        self.window = window
+        self.max_batch = max_batch
+        self.name = name
+        self._items: List[Any] = []
+        self._opened_at: Optional[float] = None
+        self._opened_iso: Optional[str] = None
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = False
+        self.batches = 0
+        self.items_sent = 0
+        self.failed = 0
+
+    def start(self) -> None:
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop = False
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop the flusher; anything still pending goes out first."""
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    def add(self, item: Any) -> None:
+        self.start()
+        with self._cond:
+            if not self._items:
+                self._opened_at = time.monotonic()
+                self._opened_iso = datetime.now().isoformat(timespec="seconds")
+            self._items.append(item)
+            if len(self._items) >= self.max_batch:
+                self._cond.notify_all()
+
+    def _due(self) -> bool:
+        if not self._items:
+            return False
+        return len(self._items) >= self.max_batch or time.monotonic() - self._opened_at >= self.window
+
+    def _take(self):
+        batch, self._items = self._items[:self.max_batch], self._items[self.max_batch:]
+        start, end = self._opened_iso, datetime.now().isoformat(timespec="seconds")
+        if self._items:
+            # Leftovers start the next window
+            self._opened_at, self._opened_iso = time.monotonic(), end
+        return batch, start, end
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._stop and not self._due():
+                    timeout = None
+                    if self._items:
+                        timeout = max(0.0, self.window - (time.monotonic() - self._opened_at))
+                    self._cond.wait(timeout)
+                if not self._items:
+                    return  # stopping with nothing left
+                batch, start, end = self._take()
+                stopping = self._stop
+            self._deliver(batch, start, end)
+            if stopping:
+                with self._cond:
+                    if not self._items:
+                        return
+
+    def _deliver(self, batch: List[Any], start: str, end: str) -> None:
+        try:
+            self.send(batch, start, end)
+            self.batches += 1
+            self.items_sent += len(batch)
+        except Exception as e:
+            self.failed += len(batch)
+            print(f"[Digest] failed to send batch of {len(batch)}: {e}")
+
+    def flush(self) -> None:
+        """Send whatever is pending right now, on the caller's thread."""
+        while True:
+            with self._cond:
+                if not self._items:
+                    return
+                batch, start, end = self._take()
+            self._deliver(batch, start, end)
+
+    def stats(self) -> dict:
+        with self._cond:
+            pending = len(self._items)
+        return {
+            "window_seconds": self.window,
+            "max_batch": self.max_batch,
+            "pending": pending,
+            "batches": self.batches,
+            "items_sent": self.items_sent,
+            "failed": self.failed,
+        }
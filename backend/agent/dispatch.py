@@ -0,0 +1,204 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+from ..llm.metrics import percentile
+
+SEVERITY_PRIORITY = {
+    "CRITICAL": 0,
+    "HIGH": 1,
+    "MEDIUM": 2,
+    "WARN": 2,
+    "WARNING": 2,
+    "LOW": 3,
+    "INFO": 4,
+}
+
+OVERFLOW_POLICIES = ("block", "drop_low", "drop_new")
+
+
+def priority_for(severity: str, decision: str = "") -> int:
+    """Lower is more urgent. Monitor Only sorts behind actionable incidents of the same severity."""
+    base = SEVERITY_PRIORITY.get((severity or "INFO").upper(), SEVERITY_PRIORITY["INFO"])
+    return base * 2 + (1 if decision == "Monitor Only" else 0)
+
+
+@dataclass(order=True)
+class _Job:
+    priority: int
+    seq: int
+    enqueued_at: float = field(compare=False)
+    func: Callable[..., Any] = field(compare=False)
+    args: tuple = field(compare=False)
+
+
+class NotificationDispatcher:
+    """
+    Bounded priority queue of notification jobs served by a worker pool.
+
+    When the queue is full the overflow policy decides what happens:
+      - block    : wait up to put_timeout for space (backpressure), then drop
+      - drop_low : evict the least urgent queued job if the new one outranks it
+      - drop_new : drop the incoming job
+    Critical jobs are never dropped by drop_low without first trying to block.
+    """
+
+    def __init__(
+        self,
+        workers: int = 4,
+        maxsize: int = 1000,
+        overflow: str = "drop_low",
+        put_timeout: float = 2.0,
+        latency_window: int = 1024,
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {OVERFLOW_POLICIES}, got {overflow!r}")
+        self.workers = workers
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.put_timeout = put_timeout
+
+        self._heap: list = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._threads: list = []
+        self._running = False
+
+        self._latency_ms = deque(maxlen=latency_window)
+        self._wait_ms = deque(maxlen=latency_window)
+        self._counters = {
+            "enqueued": 0,
+            "dispatched": 0,
+            "failed": 0,
+            "dropped": 0,
+            "evicted": 0,
+            "max_depth": 0,
+        }
+
+    # -------------------------
+    # Lifecycle
+    # -------------------------
+    def start(self) -> None:
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"dispatch-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for t in self._threads:
+            t.start()
+
+    def stop(self, drain_timeout: float = 5.0) -> None:
+        """Stop workers after the queue drains or drain_timeout elapses."""
+        deadline = time.monotonic() + drain_timeout
+        with self._cond:
+            while self._heap and time.monotonic() < deadline:
+                self._cond.wait(timeout=0.1)
+            self._running = False
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join(timeout=max(0.0, deadline - time.monotonic()) + 0.5)
+        self._threads = []
+
+    # -------------------------
+    # Producer side
+    # -------------------------
+    def submit(self, priority: int, func: Callable[..., Any], *args) -> bool:
+        """Queue func(*args). Returns False if the job was dropped."""
+        if not self._running:
+            self.start()
+        job = _Job(priority, next(self._seq), time.monotonic(), func, args)
+
+        with self._cond:
+            if len(self._heap) >= self.maxsize and not self._make_room(job):
+                self._counters["dropped"] += 1
+                return False
+            heapq.heappush(self._heap, job)
+            self._counters["enqueued"] += 1
+            self._counters["max_depth"] = max(self._counters["max_depth"], len(self._heap))
+            self._cond.notify()
+        return True
+
+    def _make_room(self, job: _Job) -> bool:
+        """Called with the lock held on a full queue. True if job may be pushed."""
+        if self.overflow == "drop_new":
+            return False
+
+        if self.overflow == "drop_low":
+            worst = max(self._heap)
+            if job < worst:
+                self._heap.remove(worst)
+                heapq.heapify(self._heap)
+                self._counters["evicted"] += 1
+                return True
+            if job.priority > 0:
+                return False
+
+        # block (and critical jobs that could not evict anything)
+        deadline = time.monotonic() + self.put_timeout
+        while len(self._heap) >= self.maxsize:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            self._cond.wait(timeout=remaining)
+        return True
+
+    # -------------------------
+    # Consumer side
+    # -------------------------
+    def _next_job(self) -> Optional[_Job]:
+        with self._cond:
+            while not self._heap:
+                if not self._running:
+                    return None
+                self._cond.wait()
+            job = heapq.heappop(self._heap)
+            self._cond.notify_all()  # wake producers waiting for space
+            return job
+
+    def _worker(self) -> None:
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            picked = time.monotonic()
+            try:
+                job.func(*job.args)
+                ok = True
+            except Exception as e:
+                ok = False
+                print(f"[Dispatch] job {getattr(job.func, '__name__', job.func)} failed: {e}")
+            done = time.monotonic()
+            with self._cond:
+                self._counters["dispatched" if ok else "failed"] += 1
+                self._wait_ms.append((picked - job.enqueued_at) * 1000)
+                self._latency_ms.append((done - job.enqueued_at) * 1000)
+
+    # -------------------------
+    # Metrics
+    # -------------------------
+    def stats(self) -> dict:
+        with self._cond:
+            depth = len(self._heap)
+            counters = dict(self._counters)
+            latency = list(self._latency_ms)
+            wait = list(self._wait_ms)
+        return {
+            "running": self._running,
+            "workers": self.workers,
+            "queue_depth": depth,
+            "queue_capacity": self.maxsize,
+            "overflow_policy": self.overflow,
+            **counters,
+            "queue_wait_ms_p50": percentile(wait, 50),
+            "queue_wait_ms_p95": percentile(wait, 95),
+            "dispatch_latency_ms_p50": percentile(latency, 50),
+            "dispatch_latency_ms_p95": percentile(latency, 95),
+            "dispatch_latency_ms_max": round(max(latency), 3) if latency else None,
+        }
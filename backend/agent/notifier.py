@@ -1,3 +1,8 @@
 def send_email(incident):
     # SMTP mocked for demo
     return True
+
+
+def send_digest(subject, html_body, incidents):
+    # SMTP mocked for demo; one message covers every incident in the batch
+    return True
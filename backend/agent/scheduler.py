@@ -0,0 +1,223 @@
+import asyncio
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+
+@dataclass
+class Check:
+    """
+    One scheduled check.
+
+    func may be a plain callable (run on the scheduler's thread pool) or a
+    coroutine function (awaited on the event loop). Every run is bounded by
+    `deadline` seconds; `jitter` adds a random 0..jitter delay to each start
+    so checks sharing an interval do not fire in lockstep.
+    """
+    name: str
+    func: Callable[[], Any]
+    interval: float = 60.0
+    jitter: float = 0.0
+    deadline: float = 30.0
+    on_result: Optional[Callable[[Any], None]] = None
+    on_error: Optional[Callable[[BaseException], None]] = None
+
+
+class MonitorScheduler:
+    """
+    Runs every Check as its own asyncio task, so a slow or hung check only
+    delays itself. Blocking work (sync checks and result callbacks) goes to
+    a bounded thread pool and never runs on the loop thread.
+    """
+
+    def __init__(self, max_workers: int = 32, lag_probe_interval: float = 0.5):
+        self._checks: Dict[str, Check] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._stats: Dict[str, dict] = {}
+        self._max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lag_probe_interval = lag_probe_interval
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopped: Optional[asyncio.Event] = None
+        self._thread: Optional[threading.Thread] = None
+        self._started = threading.Event()
+        self._shutdown_hooks: list = []
+        self._lock = threading.Lock()
+        self.loop_lag_ms = 0.0
+        self.max_loop_lag_ms = 0.0
+
+    # -------------------------
+    # Public API (thread-safe)
+    # -------------------------
+    def add_check(self, check: Check) -> None:
+        with self._lock:
+            self._checks[check.name] = check
+            self._stats.setdefault(check.name, {
+                "runs": 0, "failures": 0, "timeouts": 0,
+                "last_run": None, "last_duration_ms": None, "last_error": None,
+            })
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._spawn, check)
+
+    def remove_check(self, name: str) -> None:
+        with self._lock:
+            self._checks.pop(name, None)
+            self._stats.pop(name, None)
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._cancel, name)
+
+    def check_names(self) -> list:
+        with self._lock:
+            return list(self._checks)
+
+    def start(self) -> None:
+        """Run the event loop on a daemon thread and return immediately."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._started.clear()
+        self._thread = threading.Thread(target=self.run, name="monitor-scheduler", daemon=True)
+        self._thread.start()
+        self._started.wait(timeout=5)
+
+    def run(self) -> None:
+        """Run the event loop in the calling thread until stop() is called."""
+        asyncio.run(self._main())
+
+    def stop(self, timeout: float = 5.0) -> None:
+        loop = self._loop
+        if loop is not None and self._stopped is not None:
+            loop.call_soon_threadsafe(self._stopped.set)
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=timeout)
+        self._thread = None
+
+    def add_shutdown_hook(self, coro_func: Callable[[], Any]) -> None:
+        """Await coro_func on the loop before it closes (e.g. to close pools)."""
+        self._shutdown_hooks.append(coro_func)
+
+    def call_soon(self, coro_func: Callable[[], Any]) -> None:
+        """Schedule a coroutine function on the scheduler loop from any thread."""
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(coro_func(), self._loop)
+
+    def stats(self) -> dict:
+        with self._lock:
+            checks = {k: dict(v) for k, v in self._stats.items()}
+        return {
+            "running": self._loop is not None,
+            "checks": checks,
+            "loop_lag_ms": round(self.loop_lag_ms, 3),
+            "max_loop_lag_ms": round(self.max_loop_lag_ms, 3),
+        }
+
+    # -------------------------
+    # Loop internals
+    # -------------------------
+    async def _main(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        self._executor = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix="check")
+        with self._lock:
+            checks = list(self._checks.values())
+        for check in checks:
+            self._spawn(check)
+        lag_task = asyncio.create_task(self._measure_lag())
+        self._started.set()
+        try:
+            await self._stopped.wait()
+        finally:
+            lag_task.cancel()
+            for name in list(self._tasks):
+                self._cancel(name)
+            await asyncio.gather(lag_task, return_exceptions=True)
+            for hook in self._shutdown_hooks:
+                try:
+                    await hook()
+                except Exception as e:
+                    print(f"[Scheduler] shutdown hook failed: {e}")
+            self._loop = None
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _spawn(self, check: Check) -> None:
+        self._cancel(check.name)
+        self._tasks[check.name] = asyncio.create_task(self._run_check(check), name=check.name)
+
+    def _cancel(self, name: str) -> None:
+        task = self._tasks.pop(name, None)
+        if task is not None:
+            task.cancel()
+
+    async def _run_check(self, check: Check) -> None:
+        loop = asyncio.get_running_loop()
+        # Spread first runs so checks added together do not all fire at t=0
+        await asyncio.sleep(random.uniform(0, check.jitter) if check.jitter else 0)
+        next_run = loop.time()
+
+        while True:
+            await self._execute(check)
+
+            # Fixed-rate schedule: a slow run eats into its own slack, it
+            # never shifts later runs. Missed slots are skipped, not queued.
+            next_run += check.interval
+            now = loop.time()
+            if next_run < now:
+                missed = int((now - next_run) // check.interval) + 1
+                next_run += missed * check.interval
+            delay = next_run - now
+            if check.jitter:
+                delay += random.uniform(0, check.jitter)
+            await asyncio.sleep(max(0.0, delay))
+
+    async def _execute(self, check: Check) -> None:
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        error: Optional[BaseException] = None
+        result = None
+        try:
+            if asyncio.iscoroutinefunction(check.func):
+                result = await asyncio.wait_for(check.func(), timeout=check.deadline)
+            else:
+                result = await asyncio.wait_for(
+                    loop.run_in_executor(self._executor, check.func), timeout=check.deadline
+                )
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError as e:
+            error = e
+        except Exception as e:
+            error = e
+
+        duration_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            st = self._stats.get(check.name)
+            if st is not None:
+                st["runs"] += 1
+                st["last_run"] = time.time()
+                st["last_duration_ms"] = round(duration_ms, 3)
+                if error is not None:
+                    st["failures"] += 1
+                    st["last_error"] = repr(error)
+                    if isinstance(error, asyncio.TimeoutError):
+                        st["timeouts"] += 1
+
+        callback, arg = (check.on_error, error) if error is not None else (check.on_result, result)
+        if callback is None:
+            if error is not None:
+                print(f"[Scheduler] check {check.name} failed: {error!r}")
+            return
+        try:
+            await loop.run_in_executor(self._executor, callback, arg)
+        except Exception as e:
+            print(f"[Scheduler] callback for {check.name} failed: {e}")
+
+    async def _measure_lag(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self._lag_probe_interval
+            await asyncio.sleep(self._lag_probe_interval)
+            lag = max(0.0, (loop.time() - expected) * 1000)
+            self.loop_lag_ms = lag
+            self.max_loop_lag_ms = max(self.max_loop_lag_ms, lag)
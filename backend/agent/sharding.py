@@ -0,0 +1,317 @@
+import bisect
+import hashlib
+import multiprocessing as mp
+import queue
+import threading
+from functools import partial
+from typing import Callable, Dict, Iterable, List, Optional
+
+from .scheduler import Check, MonitorScheduler
+from ..monitors.http_monitors import ProbeEngine, monitor_endpoints_async
+
+
+class HashRing:
+    """
+    Consistent-hash ring with virtual nodes. Adding or removing a node only
+    moves the targets that hashed to that node's arcs (~1/N of them).
+    """
+
+    def __init__(self, nodes: Iterable[str] = (), vnodes: int = 64):
+        self.vnodes = vnodes
+        self._keys: List[int] = []
+        self._owners: Dict[int, str] = {}
+        self._nodes: set = set()
+        for node in nodes:
+            self.add_node(node)
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+    @property
+    def nodes(self) -> List[str]:
+        return sorted(self._nodes)
+
+    def add_node(self, node: str) -> None:
+        if node in self._nodes:
+            return
+        self._nodes.add(node)
+        for i in range(self.vnodes):
+            h = self._hash(f"{node}#{i}")
+            self._owners[h] = node
+            bisect.insort(self._keys, h)
+
+    def remove_node(self, node: str) -> None:
+        if node not in self._nodes:
+            return
+        self._nodes.discard(node)
+        for i in range(self.vnodes):
+            h = self._hash(f"{node}#{i}")
+            if self._owners.get(h) == node:
+                del self._owners[h]
+                idx = bisect.bisect_left(self._keys, h)
+                if idx < len(self._keys) and self._keys[idx] == h:
+                    self._keys.pop(idx)
+
+    def node_for(self, key: str) -> Optional[str]:
+        if not self._keys:
+            return None
+        idx = bisect.bisect(self._keys, self._hash(key)) % len(self._keys)
+        return self._owners[self._keys[idx]]
+
+    def assign(self, keys: Iterable[str]) -> Dict[str, List[str]]:
+        out: Dict[str, List[str]] = {node: [] for node in self._nodes}
+        for key in keys:
+            node = self.node_for(key)
+            if node is not None:
+                out[node].append(key)
+        return out
+
+
+def shard_worker(worker_id: str, targets: list, control_q, result_q, config: dict) -> None:
+    """
+    Worker process entry point (top-level so it pickles under spawn).
+    Runs its own scheduler and probe engine over its share of targets and
+    ships incidents back to the parent through result_q. Probe results are
+    buffered and shipped as one message per batch, not one per probe.
+    """
+    scheduler = MonitorScheduler()
+    engine = ProbeEngine(
+        limit=int(config.get("max_connections", 256)),
+        limit_per_host=int(config.get("max_connections_per_host", 8)),
+    )
+    scheduler.add_shutdown_hook(engine.close)
+
+    def report(incidents):
+        if incidents:
+            result_q.put((worker_id, "incidents", incidents))
+
+    batch_size = int(config.get("result_batch_size", 256))
+    batch_seconds = float(config.get("result_batch_seconds", 1.0))
+    pending: list = []
+    pending_lock = threading.Lock()
+    stopped = threading.Event()
+
+    def flush():
+        with pending_lock:
+            if not pending:
+                return
+            batch = pending[:]
+            pending.clear()
+        result_q.put((worker_id, "probes", batch))
+
+    def record(result):
+        with pending_lock:
+            pending.append(result)
+            full = len(pending) >= batch_size
+        if full:
+            flush()
+
+    def flusher():
+        while not stopped.wait(batch_seconds):
+            flush()
+
+    def make_check(url):
+        return Check(
+            name=f"http:{url}",
+            func=partial(monitor_endpoints_async, [url], engine, record),
+            interval=float(config.get("interval_seconds", 60)),
+            jitter=float(config.get("jitter_seconds", 5)),
+            deadline=float(config.get("deadline_seconds", 15)),
+            on_result=report,
+        )
+
+    def apply(new_targets):
+        wanted = {f"http:{u}": u for u in new_targets}
+        current = set(scheduler.check_names())
+        for name in current - set(wanted):
+            scheduler.remove_check(name)
+        for name in set(wanted) - current:
+            scheduler.add_check(make_check(wanted[name]))
+
+    def control():
+        while True:
+            cmd, payload = control_q.get()
+            if cmd == "assign":
+                apply(payload)
+            elif cmd == "stop":
+                scheduler.stop()
+                return
+
+    apply(targets)
+    threading.Thread(target=control, name=f"{worker_id}-control", daemon=True).start()
+    threading.Thread(target=flusher, name=f"{worker_id}-flusher", daemon=True).start()
+    try:
+        scheduler.run()
+    finally:
+        stopped.set()
+        flush()
+
+
+class ShardedAgent:
+    """
+    Spreads endpoint targets across N worker processes via a HashRing.
+    Incidents and probe results from workers are handed to on_incidents and
+    on_probes in the parent, so the central incident store, metrics store and
+    notification path stay single-writer. The collector drains whatever has
+    queued up and hands it over in bulk, one call per kind per drain.
+    """
+
+    def __init__(
+        self,
+        targets: Iterable[str],
+        on_incidents: Callable[[list], None],
+        workers: int = 2,
+        config: Optional[dict] = None,
+        on_probes: Optional[Callable[[list], None]] = None,
+        max_drain: int = 1000,
+    ):
+        self.targets = list(dict.fromkeys(targets))
+        self.on_incidents = on_incidents
+        self.on_probes = on_probes
+        self.max_drain = max(1, int(max_drain))
+        self.config = dict(config or {})
+        self._ctx = mp.get_context("spawn")
+        self._result_q = self._ctx.Queue()
+        self._procs: Dict[str, mp.process.BaseProcess] = {}
+        self._controls: Dict[str, object] = {}
+        self._assignment: Dict[str, List[str]] = {}
+        self._ring = HashRing()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._collector: Optional[threading.Thread] = None
+        self._running = False
+        self._initial_workers = max(1, int(workers))
+        self.incidents_received = 0
+        self.probes_received = 0
+        self.batches_received = 0
+
+    def start(self) -> None:
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+        for _ in range(self._initial_workers):
+            self.add_worker()
+        self._collector = threading.Thread(target=self._collect, name="shard-collector", daemon=True)
+        self._collector.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        with self._lock:
+            self._running = False
+            workers = list(self._procs)
+        for worker_id in workers:
+            self._retire(worker_id, timeout)
+        if self._collector:
+            self._collector.join(timeout=2)
+            self._collector = None
+
+    def add_worker(self) -> str:
+        with self._lock:
+            worker_id = f"shard-{self._next_id}"
+            self._next_id += 1
+            self._ring.add_node(worker_id)
+            assignment = self._ring.assign(self.targets)
+            control_q = self._ctx.Queue()
+            proc = self._ctx.Process(
+                target=shard_worker,
+                args=(worker_id, assignment[worker_id], control_q, self._result_q, self.config),
+                name=worker_id,
+                daemon=True,
+            )
+            proc.start()
+            self._procs[worker_id] = proc
+            self._controls[worker_id] = control_q
+            self._assignment[worker_id] = assignment[worker_id]
+            self._rebalance(assignment)
+        return worker_id
+
+    def remove_worker(self, worker_id: Optional[str] = None) -> Optional[str]:
+        with self._lock:
+            if len(self._procs) <= 1:
+                return None
+            worker_id = worker_id or sorted(self._procs)[-1]
+            if worker_id not in self._procs:
+                return None
+            self._ring.remove_node(worker_id)
+            self._rebalance(self._ring.assign(self.targets))
+        self._retire(worker_id)
+        return worker_id
+
+    def set_targets(self, targets: Iterable[str]) -> None:
+        with self._lock:
+            self.targets = list(dict.fromkeys(targets))
+            self._rebalance(self._ring.assign(self.targets))
+
+    def _rebalance(self, assignment: Dict[str, List[str]]) -> None:
+        """Called with the lock held. Only workers whose share changed are told."""
+        for worker_id, share in assignment.items():
+            if self._assignment.get(worker_id) != share and worker_id in self._controls:
+                self._controls[worker_id].put(("assign", share))
+        self._assignment = assignment
+
+    def _retire(self, worker_id: str, timeout: float = 5.0) -> None:
+        with self._lock:
+            proc = self._procs.pop(worker_id, None)
+            control_q = self._controls.pop(worker_id, None)
+            self._assignment.pop(worker_id, None)
+        if control_q is not None:
+            control_q.put(("stop", None))
+        if proc is not None:
+            proc.join(timeout=timeout)
+            if proc.is_alive():
+                proc.terminate()
+
+    def _drain(self) -> list:
+        """Block briefly for one message, then take whatever else is already queued."""
+        messages = [self._result_q.get(timeout=0.5)]
+        while len(messages) < self.max_drain:
+            try:
+                messages.append(self._result_q.get_nowait())
+            except queue.Empty:
+                break
+        return messages
+
+    def _collect(self) -> None:
+        while self._running or not self._result_q.empty():
+            try:
+                messages = self._drain()
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                return
+            incidents: list = []
+            probes: list = []
+            for _, kind, payload in messages:
+                if kind == "incidents":
+                    incidents.extend(payload)
+                elif kind == "probes":
+                    probes.extend(payload)
+            self.batches_received += len(messages)
+            if incidents:
+                self.incidents_received += len(incidents)
+                self._deliver("incidents", self.on_incidents, incidents)
+            if probes:
+                self.probes_received += len(probes)
+                if self.on_probes is not None:
+                    self._deliver("probes", self.on_probes, probes)
+
+    @staticmethod
+    def _deliver(kind: str, handler: Callable[[list], None], items: list) -> None:
+        try:
+            handler(items)
+        except Exception as e:
+            print(f"[Shard] failed to record {len(items)} {kind}: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": {
+                    wid: {"alive": p.is_alive(), "pid": p.pid, "targets": len(self._assignment.get(wid, []))}
+                    for wid, p in self._procs.items()
+                },
+                "targets": len(self.targets),
+                "incidents_received": self.incidents_received,
+                "probes_received": self.probes_received,
+                "batches_received": self.batches_received,
+            }
@@ -0,0 +1,117 @@
+import hashlib
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from ..services.storage import IncidentStore
+
+
+def fingerprint(host: Optional[str], type: Optional[str], target: Optional[str]) -> str:
+    """Stable identity of a problem: same host, same incident type, same target."""
+    key = f"{host or ''}|{type or ''}|{target or ''}".lower()
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+class IncidentCoalescer:
+    """
+    Folds repeats of an ongoing problem into one open incident.
+
+    The first detection opens an incident (occurrences=1, first_seen); later
+    detections with the same fingerprint bump occurrences and last_seen on
+    that row instead of adding a new one. A notification goes out when the
+    incident opens and then at most once per `window` seconds while it stays
+    open. resolve() closes it, so the next failure opens a fresh incident.
+    """
+
+    def __init__(self, store: IncidentStore, window: float = 900.0):
+        self.store = store
+        self.window = window
+        self._open: Optional[Dict[str, int]] = None  # fingerprint -> incident id, loaded on first use
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.coalesced = 0
+        self.suppressed = 0
+        self.resolved = 0
+
+    def _open_ids(self) -> Dict[str, int]:
+        # Seeded from the store once, so incidents left open before a restart keep coalescing
+        if self._open is None:
+            self._open = self.store.open_fingerprints()
+        return self._open
+
+    def _lookup(self, fp: str) -> Optional[dict]:
+        incident_id = self._open_ids().get(fp)
+        if incident_id is None:
+            return None
+        current = self.store.get(incident_id)
+        if current is None or current.get("status") != "open":
+            # Closed or trimmed by retention behind our back
+            self._open.pop(fp, None)
+            return None
+        return current
+
+    def record(self, incident: dict) -> Tuple[dict, bool]:
+        """
+        Store a detection. Returns (stored incident, notify) where notify is
+        False while the fingerprint is inside its suppression window.
+        """
+        fp = fingerprint(incident.get("host"), incident.get("type"), incident.get("target"))
+        seen_at = incident.get("detected_at") or datetime.now().isoformat()
+        now = time.time()
+        with self._lock:
+            current = self._lookup(fp)
+            if current is None:
+                incident.update(
+                    fingerprint=fp,
+                    status="open",
+                    occurrences=1,
+                    first_seen=seen_at,
+                    last_seen=seen_at,
+                    last_notified_ts=now,
+                )
+                self.store.append(incident)
+                self._open_ids()[fp] = incident["id"]
+                self.opened += 1
+                return incident, True
+
+            self.coalesced += 1
+            notify = now - float(current.get("last_notified_ts") or 0) >= self.window
+            fields = {
+                "occurrences": int(current.get("occurrences") or 1) + 1,
+                "last_seen": seen_at,
+            }
+            # Carry the latest evidence forward without touching identity fields
+            for key in ("details", "severity", "remediation", "exit_code"):
+                if key in incident:
+                    fields[key] = incident[key]
+            if notify:
+                fields["last_notified_ts"] = now
+            else:
+                self.suppressed += 1
+            updated = self.store.update(current["id"], **fields)
+            return updated or current, notify
+
+    def resolve(self, host: Optional[str], type: Optional[str], target: Optional[str]) -> Optional[dict]:
+        """Close the open incident for this fingerprint, if there is one."""
+        fp = fingerprint(host, type, target)
+        with self._lock:
+            if fp not in self._open_ids():
+                return None  # the common, healthy case costs a dict lookup
+            current = self._lookup(fp)
+            self._open.pop(fp, None)
+            if current is None:
+                return None
+            self.resolved += 1
+            return self.store.update(current["id"], status="resolved", resolved_at=datetime.now().isoformat())
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "window_seconds": self.window,
+                "open": len(self._open or {}),
+                "opened": self.opened,
+                "coalesced": self.coalesced,
+                "suppressed": self.suppressed,
+                "resolved": self.resolved,
+            }
@@ -0,0 +1,295 @@
+# kb/kb_index.py
+from __future__ import annotations
+
+import math
+import re
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from in is it of on or the to was were with "
+    "than this that over under via not no".split()
+)
+# Longest suffix first; only stripped from tokens long enough to keep a stem
+_SUFFIXES = ("ing", "ed", "es", "s")
+
+# Score weights: an incident type phrase beats a keyword, which beats loose token overlap
+TYPE_PHRASE_WEIGHT = 3.0
+KEYWORD_WEIGHT = 2.0
+TOKEN_WEIGHT = 2.0
+# Below this nothing is reported: one keyword hit, or a near-perfect token match
+MIN_MATCH_SCORE = 2.0
+# Score carried by an exact type match (flagged with exact=True): finite so results stay
+# JSON-safe, and above MIN_MATCH_SCORE and a typical phrase-plus-token fuzzy score
+EXACT_MATCH_SCORE = TYPE_PHRASE_WEIGHT * 2 + TOKEN_WEIGHT
+# Details beyond this are not scanned; the signal is nearly always up front
+MAX_TEXT_CHARS = 4000
+# Incident types that mean "nothing to map"; these never get a fuzzy match
+NO_MATCH_TYPES = frozenset({"", "no incident", "none", "unknown", "unknown incident"})
+# A negation cue hides the next few words: "no threshold breach detected"
+_NEGATIONS = frozenset("no not without never none zero".split())
+NEGATION_WINDOW = 3
+_CLAUSE_RE = re.compile(r"[.,;:!?\n]+|\bbut\b")
+
+
+def _stem(token: str) -> str:
+    for suffix in _SUFFIXES:
+        if len(token) > len(suffix) + 3 and token.endswith(suffix):
+            return token[: -len(suffix)]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase, split on non-alphanumerics, drop stopwords and bare numbers, light-stem."""
+    return [
+        _stem(t) for t in _TOKEN_RE.findall((text or "").lower())
+        if t not in _STOPWORDS and not t.isdigit()
+    ]
+
+
+def _normalize_phrase(text: str) -> str:
+    return " ".join(_TOKEN_RE.findall((text or "").lower()))
+
+
+def _scan_text(text: str) -> Tuple[List[str], set]:
+    """
+    Normalized words of text plus the indexes of negated ones: the
+    NEGATION_WINDOW words after a cue, cut short at the end of the clause.
+    """
+    words: List[str] = []
+    negated = set()
+    for clause in _CLAUSE_RE.split((text or "").lower()):
+        clause_words = _TOKEN_RE.findall(clause)
+        base = len(words)
+        for i, word in enumerate(clause_words):
+            if word in _NEGATIONS:
+                negated.update(range(base + i + 1, base + min(len(clause_words), i + 1 + NEGATION_WINDOW)))
+        words.extend(clause_words)
+    return words, negated
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick matcher: finds every occurrence of every pattern in one pass
+    over the text, however many patterns there are. Patterns and text are
+    matched on their normalized form (lowercase words joined by single
+    spaces), and a hit only counts on word boundaries.
+    """
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+        self.patterns: List[str] = []
+        self._ids: Dict[str, int] = {}
+        self._built = False
+
+    def add(self, pattern: str) -> Optional[int]:
+        """Register a pattern; returns its id (shared by equal phrases), or None if it normalizes to nothing."""
+        phrase = _normalize_phrase(pattern)
+        if not phrase:
+            return None
+        if phrase in self._ids:
+            return self._ids[phrase]
+        node = 0
+        for ch in phrase:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        pattern_id = len(self.patterns)
+        self.patterns.append(phrase)
+        self._ids[phrase] = pattern_id
+        self._out[node].append(pattern_id)
+        self._built = False
+        return pattern_id
+
+    def build(self) -> None:
+        """Compute failure links breadth-first and merge outputs along them."""
+        queue = deque()
+        for nxt in self._goto[0].values():
+            self._fail[nxt] = 0
+            queue.append(nxt)
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+        self._built = True
+
+    def to_state(self) -> Dict[str, Any]:
+        """Built trie as plain lists and dicts (marshal-safe); see from_state()."""
+        if not self._built:
+            self.build()
+        return {"goto": self._goto, "fail": self._fail, "out": self._out, "patterns": self.patterns}
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> "KeywordAutomaton":
+        automaton = cls()
+        automaton._goto = state["goto"]
+        automaton._fail = state["fail"]
+        automaton._out = state["out"]
+        automaton.patterns = state["patterns"]
+        automaton._ids = {phrase: i for i, phrase in enumerate(automaton.patterns)}
+        automaton._built = True
+        return automaton
+
+    def search(self, text: str) -> Iterable[Tuple[int, int]]:
+        """Yield (pattern id, start offset in the normalized text) for each whole-word occurrence."""
+        if not self._built:
+            self.build()
+        phrase = _normalize_phrase(text)
+        goto, fail, out, patterns = self._goto, self._fail, self._out, self.patterns
+        node = 0
+        for i, ch in enumerate(phrase):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                end = i + 1
+                if end < len(phrase) and phrase[end] != " ":
+                    continue
+                for pattern_id in out[node]:
+                    start = end - len(patterns[pattern_id])
+                    if start == 0 or phrase[start - 1] == " ":
+                        yield pattern_id, start
+
+
+@dataclass
+class KBMatch:
+    key: str  # incident type key in the KB mapping
+    score: float
+    reasons: List[str] = field(default_factory=list)
+    exact: bool = False  # the incident type named this entry; score is EXACT_MATCH_SCORE
+
+
+class KBIndex:
+    """
+    Built once per KB mapping. Ranks KB entries for an incident by:
+      - incident-type phrases and keywords found in the incident's type and
+        details (one Aho-Corasick pass over the text),
+      - IDF-weighted cosine similarity of stemmed tokens against each
+        entry's type, keywords and title (the fuzzy part: catches reworded
+        types), scaled to at most TOKEN_WEIGHT.
+    Words just after a negation ("no breach detected") are ignored, and
+    matches scoring under MIN_MATCH_SCORE are dropped.
+    """
+
+    def __init__(self, mapping: Dict[str, Dict[str, Any]]):
+        self.mapping = mapping
+        self.keys: List[str] = [k for k in mapping if k != "Unknown Incident"]
+        self._exact: Dict[str, str] = {_normalize_phrase(k): k for k in self.keys}
+
+        self._automaton = KeywordAutomaton()
+        # pattern id -> [(entry idx, weight)]
+        self._pattern_entries: Dict[int, List[Tuple[int, float]]] = {}
+        postings: Dict[str, List[int]] = {}
+
+        for idx, key in enumerate(self.keys):
+            entry = mapping[key]
+            self._add_pattern(key, idx, TYPE_PHRASE_WEIGHT)
+            for kw in entry.get("keywords") or []:
+                self._add_pattern(kw, idx, KEYWORD_WEIGHT)
+            text = " ".join([key, " ".join(entry.get("keywords") or []), entry.get("title") or ""])
+            for token in set(tokenize(text)):
+                postings.setdefault(token, []).append(idx)
+        self._automaton.build()
+
+        n = max(1, len(self.keys))
+        self._idf: Dict[str, float] = {t: math.log(1 + n / len(ids)) for t, ids in postings.items()}
+        self._postings = postings
+        weights = [0.0] * len(self.keys)
+        for token, ids in postings.items():
+            for idx in ids:
+                weights[idx] += self._idf[token] ** 2
+        self._norms = [math.sqrt(w) or 1.0 for w in weights]
+
+    def to_state(self) -> Dict[str, Any]:
+        """
+        Everything match() needs except the mapping, as plain lists and dicts,
+        so KB snapshots can store the built index (see kb_loader.save_snapshot).
+        """
+        return {
+            "keys": self.keys,
+            "automaton": self._automaton.to_state(),
+            "pattern_entries": self._pattern_entries,
+            "idf": self._idf,
+            "postings": self._postings,
+            "norms": self._norms,
+        }
+
+    @classmethod
+    def from_state(cls, mapping: Dict[str, Dict[str, Any]], state: Dict[str, Any]) -> "KBIndex":
+        """Rebuild from to_state() output without re-scanning the mapping."""
+        index = cls.__new__(cls)
+        index.mapping = mapping
+        index.keys = state["keys"]
+        index._exact = {_normalize_phrase(k): k for k in index.keys}
+        index._automaton = KeywordAutomaton.from_state(state["automaton"])
+        index._pattern_entries = state["pattern_entries"]
+        index._idf = state["idf"]
+        index._postings = state["postings"]
+        index._norms = state["norms"]
+        return index
+
+    def _add_pattern(self, pattern: str, idx: int, weight: float) -> None:
+        pattern_id = self._automaton.add(pattern)
+        if pattern_id is not None:
+            self._pattern_entries.setdefault(pattern_id, []).append((idx, weight))
+
+    def match(self, incident_type: str, details: str = "", top_k: int = 3) -> List[KBMatch]:
+        """Ranked KB entries for the incident, best first; empty if nothing scores."""
+        normalized_type = _normalize_phrase(incident_type)
+        exact = self._exact.get(normalized_type)
+        if exact is not None:
+            return [KBMatch(exact, EXACT_MATCH_SCORE, ["exact type"], exact=True)]
+        if normalized_type in NO_MATCH_TYPES:
+            return []
+
+        words, negated = _scan_text(f"{incident_type or ''}. {(details or '')[:MAX_TEXT_CHARS]}")
+        text = " ".join(words)
+        scores: Dict[int, float] = {}
+        reasons: Dict[int, List[str]] = {}
+
+        seen = set()
+        for pattern_id, start in self._automaton.search(text):
+            if pattern_id in seen or text.count(" ", 0, start) in negated:
+                continue
+            seen.add(pattern_id)
+            phrase = self._automaton.patterns[pattern_id]
+            # Multi-word phrases are more specific than single words
+            length_bonus = 1.0 + 0.25 * phrase.count(" ")
+            for idx, weight in self._pattern_entries[pattern_id]:
+                scores[idx] = scores.get(idx, 0.0) + weight * length_bonus
+                reasons.setdefault(idx, []).append(f"'{phrase}'")
+
+        overlap: Dict[int, float] = {}
+        query_norm = 0.0
+        kept = " ".join(w for i, w in enumerate(words) if i not in negated)
+        for token in set(tokenize(kept)):
+            idf = self._idf.get(token)
+            if idf is None:
+                continue
+            query_norm += idf * idf
+            for idx in self._postings[token]:
+                overlap[idx] = overlap.get(idx, 0.0) + idf * idf
+        query_norm = math.sqrt(query_norm) or 1.0
+        for idx, dot in overlap.items():
+            scores[idx] = scores.get(idx, 0.0) + TOKEN_WEIGHT * dot / (self._norms[idx] * query_norm)
+
+        ranked = sorted(
+            ((idx, score) for idx, score in scores.items() if score >= MIN_MATCH_SCORE),
+            key=lambda item: item[1],
+            reverse=True,
+        )[:top_k]
+        return [KBMatch(self.keys[idx], round(score, 4), reasons.get(idx, ["token overlap"])) for idx, score in ranked]
@@ -1,19 +1,38 @@
 # kb/kb_loader.py
 from __future__ import annotations
 
+import hashlib
+import json
+import marshal
 import os
 import re
-from dataclasses import dataclass
-from typing import Any, Dict, List, Optional, Tuple
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
 
 import requests
 
-try:
+from .kb_index import KBIndex
+
+if TYPE_CHECKING:
     import pandas as pd
-except Exception as e:
-    raise RuntimeError(
-        "pandas is required for KB Excel loading. Please install: pip install pandas openpyxl"
-    ) from e
+
+# Bump when the snapshot's shape changes so old snapshots are ignored
+SNAPSHOT_VERSION = 3
+SNAPSHOT_DIR = "snapshots"
+
+
+def _pandas():
+    # Imported lazily: warm starts load the snapshot and never need pandas
+    try:
+        import pandas as pd
+    except Exception as e:
+        raise RuntimeError(
+            "pandas is required for KB Excel loading. Please install: pip install pandas openpyxl"
+        ) from e
+    return pd
 
 
 @dataclass
@@ -22,6 +41,12 @@ class KBResult:
     mapping: Dict[str, Dict[str, Any]]
     error: Optional[str] = None
     source: Optional[str] = None  # local path used
+    sha256: Optional[str] = None
+    from_snapshot: bool = False  # mapping came from the compiled snapshot, not the Excel file
+    downloaded: bool = False  # a new copy was fetched (False on 304 / cached)
+    load_ms: float = 0.0
+    ingest: Optional[Dict[str, Any]] = None  # load_kb_from_excel stats when the sheet was parsed
+    index: Optional[KBIndex] = field(default=None, repr=False)  # for lookup_vuln(..., index=)
 
 
 def _normalize_col(s: str) -> str:
@@ -55,36 +80,194 @@ def _guess_sheet(excel: pd.ExcelFile) -> str:
     return excel.sheet_names[0]
 
 
-def download_file(url: str, dest_path: str, timeout: int = 30) -> None:
+def _meta_path(dest_path: str) -> str:
+    return dest_path + ".meta.json"
+
+
+def _read_meta(dest_path: str) -> Dict[str, Any]:
+    try:
+        with open(_meta_path(dest_path), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _atomic_write(path: str, data: bytes) -> None:
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def download_file(url: str, dest_path: str, timeout: int = 30) -> bool:
+    """
+    Conditional download into dest_path. Returns True if a new copy was
+    written, False if the server answered 304 Not Modified.
+
+    ETag / Last-Modified from the previous download are kept in a sidecar
+    <dest>.meta.json and sent back as If-None-Match / If-Modified-Since,
+    but only while the local file still matches the recorded sha256. The
+    body streams to a temp file next to dest_path, is checked against
+    Content-Length, and replaces the old copy atomically, so a failed or
+    partial download never leaves a broken KB behind.
+    """
     # Works for GitHub raw (public) and general direct-download URLs
     headers = {
         "User-Agent": "sre-agent-kb-loader/1.0",
         "Accept": "*/*",
     }
+    os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
+    meta = _read_meta(dest_path)
+    if os.path.exists(dest_path) and meta.get("sha256") == file_sha256(dest_path):
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
     with requests.get(url, headers=headers, stream=True, timeout=timeout) as r:
+        if r.status_code == 304:
+            return False
         r.raise_for_status()
-        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
-        with open(dest_path, "wb") as f:
-            for chunk in r.iter_content(chunk_size=1024 * 64):
-                if chunk:
-                    f.write(chunk)
+
+        h = hashlib.sha256()
+        size = 0
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(dest_path) or ".", prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in r.iter_content(chunk_size=1024 * 64):
+                    if chunk:
+                        f.write(chunk)
+                        h.update(chunk)
+                        size += len(chunk)
+            expected = r.headers.get("Content-Length")
+            # Skip the length check for compressed transfers; requests decodes them
+            if expected and not r.headers.get("Content-Encoding") and int(expected) != size:
+                raise IOError(f"KB download truncated: got {size} of {expected} bytes")
+            os.replace(tmp, dest_path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    meta = {
+        "url": url,
+        "etag": r.headers.get("ETag"),
+        "last_modified": r.headers.get("Last-Modified"),
+        "sha256": h.hexdigest(),
+        "size": size,
+        "downloaded_at": time.time(),
+    }
+    _atomic_write(_meta_path(dest_path), json.dumps(meta, indent=2).encode("utf-8"))
+    return True
+
+
+def _snapshot_path(cache_dir: str, sha256: str) -> str:
+    # marshal's format is only guaranteed within one Python version, so the
+    # interpreter and marshal format are part of the key
+    py = "{}{}".format(*sys.version_info[:2])
+    return os.path.join(
+        cache_dir, SNAPSHOT_DIR, f"{sha256}.v{SNAPSHOT_VERSION}.py{py}.m{marshal.version}.marshal"
+    )
+
+
+def load_snapshot(cache_dir: str, sha256: str) -> Optional[Tuple[Dict[str, Dict[str, Any]], KBIndex]]:
+    """Parsed mapping and its built KBIndex for the KB file with this sha256, if one was compiled."""
+    try:
+        with open(_snapshot_path(cache_dir, sha256), "rb") as f:
+            snapshot = marshal.loads(f.read())  # much faster than marshal.load(f) on big files
+        return snapshot["mapping"], KBIndex.from_state(snapshot["mapping"], snapshot["index"])
+    except (OSError, EOFError, ValueError, TypeError, KeyError):
+        return None
+
+
+def save_snapshot(cache_dir: str, sha256: str, mapping: Dict[str, Dict[str, Any]], index: KBIndex) -> str:
+    """
+    Write the parsed mapping and the built index as a marshal snapshot
+    (plain dicts, lists and strings only) and drop snapshots of older KB
+    files, so a warm start skips both the sheet parse and the index build.
+    """
+    path = _snapshot_path(cache_dir, sha256)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    _atomic_write(path, marshal.dumps({"mapping": mapping, "index": index.to_state()}))
+    for name in os.listdir(os.path.dirname(path)):
+        if name.endswith(".marshal") and os.path.join(os.path.dirname(path), name) != path:
+            try:
+                os.remove(os.path.join(os.path.dirname(path), name))
+            except OSError:
+                pass
+    return path
+
+
+def _excel_engine() -> Optional[str]:
+    # calamine (Rust) reads large sheets several times faster than openpyxl
+    try:
+        import python_calamine  # noqa: F401
+    except ImportError:
+        return None
+    return "calamine"
+
+
+def _text_column(df: pd.DataFrame, col: Optional[str]) -> pd.Series:
+    """Column as stripped strings, with missing cells (and a missing column) as ""."""
+    pd = _pandas()
+    if not col:
+        return pd.Series("", index=df.index, dtype=object)
+    return df[col].astype(object).where(df[col].notna(), "").astype(str).str.strip()
+
+
+def _list_column(df: pd.DataFrame, col: Optional[str]) -> List[List[str]]:
+    """
+    Vectorized _parse_csv_like_list: collapse any run of separators (and the
+    whitespace around it) to one comma and trim the ends, so a plain split
+    yields already-stripped, non-empty items. Each distinct cell is split
+    once; rows with the same text share the resulting list.
+    """
+    pd = _pandas()
+    text = _text_column(df, col)
+    # Whitespace between separators is absorbed too, so "a ,  , b" splits to ["a", "b"]
+    text = text.str.replace(r"[\s,;|]*[,\n;|][\s,;|]*", ",", regex=True).str.strip(",").str.strip()
+    codes, uniques = pd.factorize(text)
+    parsed = [v.split(",") if v else [] for v in uniques.tolist()]
+    return [parsed[c] for c in codes.tolist()]
 
 
 def load_kb_from_excel(
     excel_path: str,
+    stats: Optional[Dict[str, Any]] = None,
 ) -> Dict[str, Dict[str, Any]]:
     """
     Reads the Excel file and returns a mapping:
       incident_type -> {cwe, title, description, example_cves, keywords, ...}
 
-    The loader tries to be forgiving about column names.
+    The loader tries to be forgiving about column names. Rows are ingested
+    column-wise with pandas string ops; when an incident type appears in
+    several rows the last one wins. If `stats` is given it is filled with
+    rows, entries, read_ms, ingest_ms and rows_per_sec.
     """
-    xls = pd.ExcelFile(excel_path)
+    pd = _pandas()
+    read_start = time.perf_counter()
+    xls = pd.ExcelFile(excel_path, engine=_excel_engine())
     sheet = _guess_sheet(xls)
     df = pd.read_excel(xls, sheet_name=sheet)
+    read_ms = (time.perf_counter() - read_start) * 1000
+    ingest_start = time.perf_counter()
 
     # Drop completely empty rows
     df = df.dropna(how="all")
+    total_rows = len(df)
 
     # Column detection (flexible)
     cols = list(df.columns)
@@ -136,39 +319,42 @@ def load_kb_from_excel(
         )
 
     # Build incident mapping
-    mapping: Dict[str, Dict[str, Any]] = {}
-
-    for _, row in df.iterrows():
-        cwe_code = str(row.get(col_cwe, "")).strip()
-        if not cwe_code or cwe_code.lower() == "nan":
-            continue
+    source = f"{os.path.basename(excel_path)}::{sheet}"
+    cwe = _text_column(df, col_cwe)
+    keep = (cwe != "") & (cwe.str.lower() != "nan")
+    df = df[keep]
+
+    frame = pd.DataFrame({
+        "cwe": cwe[keep],
+        "title": _text_column(df, col_title).replace("", "N/A"),
+        "description": _text_column(df, col_desc).replace("", "N/A"),
+        # Incident types can be a single value or list-like
+        "incident": _list_column(df, col_incident),
+        "row": range(len(df)),
+    }, index=df.index)
+    cves = _list_column(df, col_cves)
+    keywords = _list_column(df, col_keywords)
 
-        title = str(row.get(col_title, "")).strip() if col_title else ""
-        desc = str(row.get(col_desc, "")).strip() if col_desc else ""
-        cves = _parse_csv_like_list(row.get(col_cves)) if col_cves else []
-        keywords = _parse_csv_like_list(row.get(col_keywords)) if col_keywords else []
+    # If no explicit incident types, we still store under a generic key
+    frame["incident"] = [v or ["Unknown Incident"] for v in frame["incident"]]
+    frame = frame.explode("incident").drop_duplicates("incident", keep="last")
 
-        # Incident types can be a single value or list-like
-        incidents: List[str] = []
-        if col_incident:
-            incidents = _parse_csv_like_list(row.get(col_incident))
-        # If no explicit incident types, we still store under a generic key
-        if not incidents:
-            incidents = ["Unknown Incident"]
-
-        for inc in incidents:
-            inc_key = str(inc).strip() if inc else "Unknown Incident"
-            if not inc_key:
-                inc_key = "Unknown Incident"
-
-            mapping[inc_key] = {
-                "cwe": cwe_code,
-                "title": title or "N/A",
-                "description": desc or "N/A",
-                "example_cves": cves,
-                "keywords": keywords,
-                "source": f"{os.path.basename(excel_path)}::{sheet}",
-            }
+    mapping: Dict[str, Dict[str, Any]] = {}
+    for inc_key, cwe_code, title, desc, row in zip(
+        frame["incident"].tolist(),
+        frame["cwe"].tolist(),
+        frame["title"].tolist(),
+        frame["description"].tolist(),
+        frame["row"].tolist(),
+    ):
+        mapping[inc_key] = {
+            "cwe": cwe_code,
+            "title": title,
+            "description": desc,
+            "example_cves": cves[row],
+            "keywords": keywords[row],
+            "source": source,
+        }
 
     # Ensure a fallback exists
     if "Unknown Incident" not in mapping:
@@ -178,9 +364,18 @@ def load_kb_from_excel(
             "description": "Unable to classify incident type with available evidence.",
             "example_cves": [],
             "keywords": [],
-            "source": f"{os.path.basename(excel_path)}::{sheet}",
+            "source": source,
         }
 
+    if stats is not None:
+        ingest_ms = (time.perf_counter() - ingest_start) * 1000
+        stats.update({
+            "rows": total_rows,
+            "entries": len(mapping),
+            "read_ms": round(read_ms, 2),
+            "ingest_ms": round(ingest_ms, 2),
+            "rows_per_sec": round(total_rows / (ingest_ms / 1000)) if ingest_ms > 0 else None,
+        })
     return mapping
 
 
@@ -194,17 +389,51 @@ def load_kb(
     Downloads KB from kb_url into cache (unless cached), then loads mapping.
 
     - refresh=False: use cached file if present
-    - refresh=True : always re-download
+    - refresh=True : revalidate with a conditional GET (cheap 304 when unchanged);
+                     if the server can't be reached the cached copy is used
+
+    The parsed mapping and its KBIndex are kept as a snapshot keyed by the
+    file's sha256, so only a changed KB file is parsed and indexed again.
     """
+    start = time.perf_counter()
     try:
         os.makedirs(cache_dir, exist_ok=True)
         local_path = os.path.join(cache_dir, cache_filename)
 
+        downloaded = False
+        refresh_error = None
         if refresh or not os.path.exists(local_path):
-            download_file(kb_url, local_path)
-
-        mapping = load_kb_from_excel(local_path)
-        return KBResult(ok=True, mapping=mapping, source=local_path)
+            try:
+                downloaded = download_file(kb_url, local_path)
+            except Exception as e:
+                if not os.path.exists(local_path):
+                    raise
+                refresh_error = f"refresh failed, using cached copy: {e}"
+
+        sha256 = file_sha256(local_path)
+        snapshot = load_snapshot(cache_dir, sha256)
+        from_snapshot = snapshot is not None
+        ingest = None
+        if snapshot is None:
+            ingest = {}
+            mapping = load_kb_from_excel(local_path, stats=ingest)
+            index = KBIndex(mapping)
+            save_snapshot(cache_dir, sha256, mapping, index)
+        else:
+            mapping, index = snapshot
+
+        return KBResult(
+            ok=True,
+            mapping=mapping,
+            error=refresh_error,
+            source=local_path,
+            sha256=sha256,
+            from_snapshot=from_snapshot,
+            downloaded=downloaded,
+            ingest=ingest,
+            index=index,
+            load_ms=round((time.perf_counter() - start) * 1000, 2),
+        )
 
     except Exception as e:
         return KBResult(ok=False, mapping={}, error=str(e), source=None)
@@ -213,12 +442,28 @@ def load_kb(
 def lookup_vuln(
     incident_type: str,
     kb_mapping: Dict[str, Dict[str, Any]],
+    details: Optional[str] = None,
+    index: Optional[KBIndex] = None,
 ) -> Dict[str, Any]:
     """
-    Exact match first; else Unknown Incident.
+    Exact match first; else the best-ranked entry from `index` (keyword and
+    fuzzy token match over the type and `details`, ignoring negated words,
+    and only above MIN_MATCH_SCORE); else Unknown Incident. "No Incident"
+    and Unknown types are never fuzzy-matched.
+
+    Index matches come back as a copy of the KB entry with a "match" field
+    ({key, score, reasons, exact}) saying why it was picked.
     """
     if incident_type in kb_mapping:
         return kb_mapping[incident_type]
+    if index is not None:
+        matches = index.match(incident_type, details or "", top_k=1)
+        if matches and matches[0].key in kb_mapping:
+            best = matches[0]
+            return {
+                **kb_mapping[best.key],
+                "match": {"key": best.key, "score": best.score, "reasons": best.reasons, "exact": best.exact},
+            }
     if "Unknown Incident" in kb_mapping:
         return kb_mapping["Unknown Incident"]
     return {
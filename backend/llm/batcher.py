@@ -0,0 +1,99 @@
+# llm/batcher.py
+from typing import Any, Dict, List, Optional
+
+from .diagnosis_cache import diagnosis_fingerprint, get_diagnosis_cache
+from .gemini_client import GEMINI_PROMPT_TOKEN_BUDGET, generate_json
+from .prompt_builder import build_input_block
+from .structured import BatchResponse
+
+# Cache entries for batch results are keyed separately from full email drafts
+_BATCH_STYLE = "batch"
+
+
+def _key(item: Dict[str, Any]) -> str:
+    return diagnosis_fingerprint(
+        item.get("incident") or {},
+        item.get("evidence") or {},
+        item.get("status", ""),
+        item.get("vulnerability"),
+        style=_BATCH_STYLE,
+    )
+
+
+def _build_batch_prompt(items: List[Dict[str, Any]]) -> str:
+    # Share the token budget across the batch so a burst doesn't blow it up
+    per_item_budget = max(200, GEMINI_PROMPT_TOKEN_BUDGET // len(items))
+    sections = []
+    for idx, item in enumerate(items):
+        block, _ = build_input_block(
+            item.get("incident") or {},
+            item.get("evidence") or {},
+            item.get("attempts") or [],
+            item.get("status", ""),
+            item.get("next_steps") or [],
+            item.get("vulnerability"),
+            per_item_budget,
+        )
+        sections.append(f"[{idx}]\n{block}")
+    joined = "\n\n".join(sections)
+
+    return f"""
+You are an SRE assistant. Several incidents fired at the same time; they may share a root cause.
+
+You MUST return ONLY valid JSON (no markdown, no triple backticks, no extra text).
+
+For EACH incident below, write a short diagnosis (1-2 lines) and up to 3 next steps.
+If incidents look related, say so in their diagnosis.
+
+INCIDENTS (use these facts only; do not hallucinate; "…" marks summarized values):
+{joined}
+
+Return STRICT JSON with one entry per incident id, in any order:
+{{
+  "results": [
+    {{"id": 0, "diagnosis": "...", "next_steps": ["..."]}}
+  ]
+}}
+"""
+
+
+def _results(response: Optional[BatchResponse], count: int) -> List[Optional[Dict[str, Any]]]:
+    results: List[Optional[Dict[str, Any]]] = [None] * count
+    for entry in response.results if response is not None else []:
+        if 0 <= entry.id < count and entry.diagnosis:
+            results[entry.id] = {"diagnosis": entry.diagnosis[:600], "next_steps": entry.next_steps[:3]}
+    return results
+
+
+def diagnose_batch(items: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+    """
+    Diagnose several incidents with one Gemini call.
+
+    Each item is a dict with incident, evidence, status and optionally
+    attempts, next_steps and vulnerability. Returns one entry per item, in
+    order: {"diagnosis", "next_steps"} or None if the model skipped it.
+    Items already in the diagnosis cache are answered without the LLM.
+    Raises LLMUnavailableError when the call can't be made.
+    """
+    cache = get_diagnosis_cache()
+    keys = [_key(item) for item in items]
+    results: List[Optional[Dict[str, Any]]] = [cache.get(k) for k in keys]
+
+    # Identical incidents in one burst are asked about once
+    pending: Dict[str, List[int]] = {}
+    for idx, (key, result) in enumerate(zip(keys, results)):
+        if result is None:
+            pending.setdefault(key, []).append(idx)
+    if not pending:
+        return results
+
+    unique = [items[positions[0]] for positions in pending.values()]
+    answers = _results(generate_json(_build_batch_prompt(unique), BatchResponse), len(unique))
+
+    for (key, positions), answer in zip(pending.items(), answers):
+        if answer is None:
+            continue
+        cache.put(key, answer)
+        for idx in positions:
+            results[idx] = dict(answer)
+    return results
@@ -0,0 +1,202 @@
+# llm/diagnosis_cache.py
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+def _shape(value: Any) -> Any:
+    """Structure of a value without its contents: keys and types, first list element only."""
+    if isinstance(value, dict):
+        return {str(k): _shape(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_shape(value[0])] if value else []
+    return type(value).__name__
+
+
+def _normalize_text(text: Any) -> str:
+    # Numbers (ports, pids, percentages, timestamps) vary between otherwise identical incidents
+    return re.sub(r"\d+", "#", str(text or "")).strip().lower()
+
+
+def diagnosis_fingerprint(
+    incident: Dict[str, Any],
+    evidence: Dict[str, Any],
+    status: str,
+    vulnerability: Optional[Dict[str, Any]] = None,
+    style: str = "concise",
+) -> str:
+    """
+    Cache key for a draft: incident type, final status, the incident details
+    with numbers masked, the shape of the evidence and the mapped CWE.
+    """
+    key = {
+        "type": str(incident.get("type", "")).lower(),
+        "details": _normalize_text(incident.get("details")),
+        "status": str(status or "").upper(),
+        "evidence": _shape(evidence or {}),
+        "cwe": (vulnerability or {}).get("cwe"),
+        "style": style,
+    }
+    blob = json.dumps(key, sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class DiagnosisCache:
+    """
+    TTL + LRU cache of LLM diagnoses, persisted to SQLite so a restart keeps
+    the warm set. Values hold only incident-independent fields (diagnosis,
+    recommendations); callers render the email from the current incident.
+
+    get_or_compute() is single-flight: while one caller computes a key,
+    concurrent callers for the same key wait on its result instead of
+    issuing their own LLM call.
+    """
+
+    def __init__(self, path: Optional[str], ttl: float = 3600.0, max_entries: int = 512):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        if path:
+            self._open(path)
+
+    # -------------------------
+    # Persistence
+    # -------------------------
+    def _open(self, path: str) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS drafts (key TEXT PRIMARY KEY, expires_ts REAL NOT NULL, value TEXT NOT NULL)"
+        )
+        now = time.time()
+        self._conn.execute("DELETE FROM drafts WHERE expires_ts <= ?", (now,))
+        rows = self._conn.execute(
+            "SELECT key, expires_ts, value FROM drafts ORDER BY expires_ts DESC LIMIT ?", (self.max_entries,)
+        ).fetchall()
+        # Oldest first, so the freshest end up most-recently-used
+        for key, expires_ts, value in reversed(rows):
+            self._entries[key] = (expires_ts, json.loads(value))
+
+    def _persist(self, key: str, expires_ts: float, value: Dict[str, Any]) -> None:
+        if self._conn is not None:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO drafts (key, expires_ts, value) VALUES (?, ?, ?)",
+                (key, expires_ts, json.dumps(value)),
+            )
+
+    def _forget(self, keys) -> None:
+        if self._conn is not None and keys:
+            self._conn.executemany("DELETE FROM drafts WHERE key = ?", [(k,) for k in keys])
+
+    # -------------------------
+    # Cache operations
+    # -------------------------
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._entries[key]
+                self._forget([key])
+                return None
+            self._entries.move_to_end(key)
+            return dict(entry[1])
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        expires_ts = time.time() + self.ttl
+        with self._lock:
+            self._entries[key] = (expires_ts, dict(value))
+            self._entries.move_to_end(key)
+            evicted = []
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._entries.popitem(last=False)[0])
+            self.evictions += len(evicted)
+            self._persist(key, expires_ts, value)
+            self._forget(evicted)
+
+    def get_or_compute(
+        self, key: str, compute: Callable[[], Tuple[Dict[str, Any], bool]]
+    ) -> Dict[str, Any]:
+        """
+        Return the cached value, or run compute() once for all concurrent
+        callers of this key. compute returns (value, cacheable); fallbacks
+        should be returned with cacheable=False so the next call retries.
+        """
+        cached = self.get(key)
+        if cached is not None:
+            with self._lock:
+                self.hits += 1
+            return cached
+
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return dict(future.result())
+
+        try:
+            value, cacheable = compute()
+            if cacheable:
+                self.put(key, value)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "hit_rate": round((self.hits + self.coalesced) / lookups, 3) if lookups else 0.0,
+            }
+
+
+_CACHE: Optional[DiagnosisCache] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_diagnosis_cache() -> DiagnosisCache:
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            # Same DATA_DIR root as services.paths; llm/ stays importable without the services package
+            _CACHE = DiagnosisCache(
+                os.getenv("LLM_CACHE_PATH") or os.path.join(os.getenv("DATA_DIR", "").strip() or ".data", "llm_cache.db"),
+                ttl=float(os.getenv("LLM_CACHE_TTL_SECONDS", "3600")),
+                max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "512")),
+            )
+        return _CACHE
@@ -0,0 +1,93 @@
+# llm/follow_up.py
+import threading
+import time
+from datetime import datetime
+from email.utils import make_msgid
+from typing import Any, Callable, Dict, List, Optional
+
+from .gemini_client import diagnose_and_draft, LLMUnavailableError
+
+
+def follow_up_subject(alert_subject: str) -> str:
+    """Reply-style subject so mail clients thread the diagnosis under the alert."""
+    return alert_subject if alert_subject.lower().startswith("re:") else f"Re: {alert_subject}"
+
+
+def new_message_id() -> str:
+    """Message-ID to send the alert with, so the follow-up can reference it."""
+    return make_msgid(domain="sre-agent")
+
+
+def reply_headers(alert_message_id: Optional[str]) -> Dict[str, str]:
+    """Headers that make mail clients thread a message under the alert (RFC 5322 3.6.4)."""
+    headers = {"Message-ID": new_message_id()}
+    if alert_message_id:
+        headers["In-Reply-To"] = alert_message_id
+        headers["References"] = alert_message_id
+    return headers
+
+
+def start_follow_up(
+    incident: Dict[str, Any],
+    evidence: Dict[str, Any],
+    attempts: List[Any],
+    status: str,
+    next_steps: List[str],
+    vulnerability: Optional[Dict[str, Any]],
+    alert_subject: str,
+    send: Callable[[str, str, Dict[str, str]], Any],
+    annotate: Optional[Callable[[Dict[str, Any]], Any]] = None,
+    style: str = "concise",
+    alert_message_id: Optional[str] = None,
+) -> threading.Thread:
+    """
+    Run the Gemini diagnosis off the alert path.
+
+    The template alert has already gone out; when the draft arrives,
+    annotate(fields) records the diagnosis on the incident and
+    send(subject, html, headers) mails it as a reply to the original alert
+    (In-Reply-To/References point at alert_message_id). If the LLM is
+    unavailable, or its output was unusable and only the template came
+    back, nothing is sent — the alert already covered it.
+    Returns the started thread so one-shot callers can wait for it.
+    """
+
+    def run() -> None:
+        start = time.perf_counter()
+        try:
+            draft = diagnose_and_draft(
+                incident=incident,
+                evidence=evidence,
+                attempts=attempts,
+                status=status,
+                next_steps=next_steps,
+                vulnerability=vulnerability,
+                style=style,
+            )
+        except LLMUnavailableError as e:
+            print(f"[LLM Follow-up] skipped: {e}", flush=True)
+            return
+        except Exception as e:
+            print(f"[LLM Follow-up] failed: {e}", flush=True)
+            return
+
+        if draft.get("fallback"):
+            print("[LLM Follow-up] Gemini output unusable; no follow-up email sent.", flush=True)
+            return
+
+        if annotate is not None:
+            annotate({
+                "llm_diagnosis": draft.get("diagnosis", ""),
+                "llm_diagnosed_at": datetime.now().isoformat(),
+                "llm_latency_ms": round((time.perf_counter() - start) * 1000, 1),
+            })
+
+        body_html = draft.get("email_body_html") or ""
+        if len(body_html.strip()) < 50:
+            print("[LLM Follow-up] draft body empty; no follow-up email sent.", flush=True)
+            return
+        send(follow_up_subject(alert_subject), body_html, reply_headers(alert_message_id))
+
+    thread = threading.Thread(target=run, name="llm-follow-up", daemon=True)
+    thread.start()
+    return thread
@@ -3,9 +3,231 @@ import os
 import json
 import re
 import html
-from typing import Any, Dict, List, Optional
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type, TypeVar
 
 from google import genai
+from google.genai import errors, types
+from pydantic import BaseModel, ValidationError
+
+from .diagnosis_cache import diagnosis_fingerprint, get_diagnosis_cache
+from .metrics import LLM_METRICS
+from .prompt_builder import build_input_block, estimate_tokens
+from .resilience import CircuitBreaker, LLMUnavailableError
+from .structured import DraftResponse, StructuredOutputError, parse_stream
+
+# Per-request deadline, concurrent calls, and how long a caller may wait for a slot
+GEMINI_TIMEOUT_SECONDS = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "20"))
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "4"))
+GEMINI_QUEUE_TIMEOUT_SECONDS = float(os.getenv("GEMINI_QUEUE_TIMEOUT_SECONDS", "2"))
+# Token budget for the INPUT DATA block; evidence is summarized to fit
+GEMINI_PROMPT_TOKEN_BUDGET = int(os.getenv("GEMINI_PROMPT_TOKEN_BUDGET", "2000"))
+# Opt-in: ask for schema-constrained JSON (response_schema + JSON MIME type, streamed)
+# instead of extracting JSON from free text. Off by default so existing models and
+# prompts behave as before; turn on once the configured model supports response_schema.
+GEMINI_STRUCTURED_OUTPUT = os.getenv("GEMINI_STRUCTURED_OUTPUT", "false").strip().lower() in ("1", "true", "yes")
+
+T = TypeVar("T", bound=BaseModel)
+
+BREAKER = CircuitBreaker(
+    failure_threshold=int(os.getenv("GEMINI_BREAKER_FAILURES", "3")),
+    cooldown=float(os.getenv("GEMINI_BREAKER_COOLDOWN_SECONDS", "60")),
+)
+
+_CLIENT: Optional[genai.Client] = None
+_CLIENT_KEY: Optional[str] = None
+_CLIENT_LOCK = threading.Lock()
+_SLOTS = threading.BoundedSemaphore(GEMINI_MAX_CONCURRENCY)
+# Limiter counters for llm_status(): calls holding a slot, callers turned away
+_LIMITER_LOCK = threading.Lock()
+_IN_FLIGHT = 0
+_SLOT_REJECTIONS = 0
+
+
+def get_client() -> genai.Client:
+    """One long-lived client (and connection pool) per API key."""
+    global _CLIENT, _CLIENT_KEY
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        raise LLMUnavailableError("GOOGLE_API_KEY is not set")
+    with _CLIENT_LOCK:
+        if _CLIENT is None or _CLIENT_KEY != api_key:
+            _CLIENT = genai.Client(
+                api_key=api_key,
+                http_options=types.HttpOptions(timeout=int(GEMINI_TIMEOUT_SECONDS * 1000)),
+            )
+            _CLIENT_KEY = api_key
+        return _CLIENT
+
+
+def _retry_after(exc: Exception) -> Optional[float]:
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _usage(resp) -> Tuple[Optional[int], Optional[int]]:
+    usage = getattr(resp, "usage_metadata", None)
+    if usage is None:
+        return None, None
+    return usage.prompt_token_count, usage.candidates_token_count
+
+
+def _record_failure(start: float, prompt: str, compacted: bool) -> None:
+    LLM_METRICS.record((time.perf_counter() - start) * 1000, estimate_tokens(prompt), ok=False, compacted=compacted)
+
+
+def _config(deadline: Optional[float], schema: Optional[Type[BaseModel]] = None) -> types.GenerateContentConfig:
+    http_options = types.HttpOptions(timeout=int((deadline or GEMINI_TIMEOUT_SECONDS) * 1000))
+    if schema is None:
+        return types.GenerateContentConfig(http_options=http_options)
+    return types.GenerateContentConfig(
+        http_options=http_options,
+        response_mime_type="application/json",
+        response_schema=schema,
+    )
+
+
+def _guarded_call(prompt: str, compacted: bool, call: Callable[[genai.Client], Tuple[Any, str, Any]]) -> Any:
+    """
+    Run call(client) behind the concurrency limit and circuit breaker.
+    call returns (result, output_text, usage_source); usage_source is the
+    response (or last stream chunk) carrying usage metadata, if any.
+    Raises LLMUnavailableError instead of waiting when either says no.
+    Every attempted call is recorded in LLM_METRICS.
+    """
+    global _IN_FLIGHT, _SLOT_REJECTIONS
+    client = get_client()
+    # Breaker first: while it is open, callers fall back at once instead of queueing for a slot
+    if not BREAKER.allow():
+        raise LLMUnavailableError("Gemini circuit breaker is open")
+    if not _SLOTS.acquire(timeout=GEMINI_QUEUE_TIMEOUT_SECONDS):
+        BREAKER.release()
+        with _LIMITER_LOCK:
+            _SLOT_REJECTIONS += 1
+        raise LLMUnavailableError(f"all {GEMINI_MAX_CONCURRENCY} Gemini slots busy")
+    with _LIMITER_LOCK:
+        _IN_FLIGHT += 1
+    try:
+        start = time.perf_counter()
+        try:
+            result, output_text, usage_source = call(client)
+        except errors.APIError as e:
+            _record_failure(start, prompt, compacted)
+            if e.code == 429 or e.code >= 500:
+                BREAKER.record_failure(rate_limited=e.code == 429, retry_after=_retry_after(e))
+            else:
+                BREAKER.record_success()  # the service answered; the request itself was bad
+            raise LLMUnavailableError(f"Gemini API error {e.code}: {e.message}") from e
+        except Exception as e:
+            # Timeouts and connection errors from the HTTP layer
+            _record_failure(start, prompt, compacted)
+            BREAKER.record_failure()
+            raise LLMUnavailableError(f"Gemini call failed: {e}") from e
+        prompt_tokens, output_tokens = _usage(usage_source)
+        LLM_METRICS.record(
+            (time.perf_counter() - start) * 1000,
+            prompt_tokens if prompt_tokens is not None else estimate_tokens(prompt),
+            output_tokens if output_tokens is not None else estimate_tokens(output_text),
+            compacted=compacted,
+        )
+        BREAKER.record_success()
+        return result
+    finally:
+        with _LIMITER_LOCK:
+            _IN_FLIGHT -= 1
+        _SLOTS.release()
+
+
+def _generate(model: str, prompt: str, deadline: Optional[float] = None, compacted: bool = False):
+    """generate_content through _guarded_call; returns the raw response."""
+    def call(client):
+        resp = client.models.generate_content(model=model, contents=prompt, config=_config(deadline))
+        return resp, resp.text or "", resp
+
+    return _guarded_call(prompt, compacted, call)
+
+
+def _generate_structured(
+    model: str,
+    prompt: str,
+    schema: Type[T],
+    deadline: Optional[float] = None,
+    compacted: bool = False,
+) -> Optional[T]:
+    """
+    Schema-constrained call: JSON MIME type plus response_schema, streamed
+    through StreamingJSONParser and validated against `schema`. Returns the
+    validated model, or None when the output didn't parse (counted in
+    LLM_METRICS parsing stats; the service still answered, so the breaker
+    sees a success).
+    """
+    def call(client):
+        received: List[str] = []
+        last = {"chunk": None}
+
+        def texts():
+            stream = client.models.generate_content_stream(
+                model=model, contents=prompt, config=_config(deadline, schema)
+            )
+            try:
+                for chunk in stream:
+                    if getattr(chunk, "usage_metadata", None) is not None:
+                        last["chunk"] = chunk
+                    text = chunk.text or ""
+                    received.append(text)
+                    yield text
+            finally:
+                # Stop reading as soon as the object is complete
+                close = getattr(stream, "close", None)
+                if close is not None:
+                    close()
+
+        chunks = texts()
+        try:
+            result = parse_stream(chunks, schema)
+        except StructuredOutputError as e:
+            print(f"[LLM] structured output rejected: {e}", flush=True)
+            result = None
+        finally:
+            chunks.close()
+        return result, "".join(received), last["chunk"]
+
+    result = _guarded_call(prompt, compacted, call)
+    LLM_METRICS.record_parse("structured", result is not None)
+    return result
+
+
+def generate_json(
+    prompt: str,
+    schema: Type[T],
+    model: Optional[str] = None,
+    deadline: Optional[float] = None,
+    compacted: bool = False,
+) -> Optional[T]:
+    """
+    One Gemini call whose answer must be a JSON object matching `schema`.
+    Schema-constrained when GEMINI_STRUCTURED_OUTPUT is on, otherwise the
+    object is extracted from free text; either way the parse outcome is
+    counted in LLM_METRICS. Returns None when the output didn't parse.
+    Raises LLMUnavailableError when the call can't be made.
+    """
+    model = model or os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+    if GEMINI_STRUCTURED_OUTPUT:
+        return _generate_structured(model, prompt, schema, deadline, compacted)
+    resp = _generate(model, prompt, deadline, compacted)
+    parsed = _extract_json((resp.text or "").strip())
+    result = None
+    if parsed is not None:
+        try:
+            result = schema.model_validate(parsed)
+        except ValidationError as e:
+            print(f"[LLM] text output did not match {schema.__name__}: {e}", flush=True)
+    LLM_METRICS.record_parse("text", result is not None)
+    return result
 
 
 def _severity_badge(severity: str) -> str:
@@ -90,6 +312,7 @@ def _build_fallback_html(
     status: str,
     next_steps: List[str],
     vulnerability: Optional[Dict[str, Any]] = None,
+    diagnosis: str = "",
 ) -> str:
     inc_type = incident.get("type", "Incident")
     details = incident.get("details", "")
@@ -128,6 +351,13 @@ def _build_fallback_html(
     else:
         ns_items = "<li style='margin:4px 0;'>No next steps</li>"
 
+    diagnosis_html = ""
+    if diagnosis:
+        diagnosis_html = f"""
+        <h3 style="margin:18px 0 8px 0;">Diagnosis</h3>
+        <p style="margin:0;white-space:pre-wrap;">{html.escape(str(diagnosis))}</p>
+        """
+
     # Vulnerability mapping table
     vuln_html = ""
     if vulnerability:
@@ -183,6 +413,8 @@ def _build_fallback_html(
           </tr>
         </table>
 
+        {diagnosis_html}
+
         <h3 style="margin:18px 0 8px 0;">Evidence</h3>
         <table style="border-collapse:collapse;width:100%;font-size:12.5px;">
           {ev_rows}
@@ -217,25 +449,99 @@ def diagnose_and_draft(
     next_steps: List[str],
     vulnerability: Dict[str, Any] | None = None,
     style: str = "concise",
+    use_cache: bool = True,
 ) -> Dict[str, str]:
     """
     Returns dict:
       - email_subject
       - email_body_html (CLEAN HTML, same tabular format, severity color badges, includes CWE mapping)
       - diagnosis (1-2 lines)
+      - recommendations (short next steps suggested by the model)
+      - fallback (True when Gemini's output was unusable and the template was used)
+
+    Diagnoses are cached by incident fingerprint (see llm/diagnosis_cache.py);
+    identical incidents in flight at the same time share one Gemini call.
+    Only the diagnosis fields are cached: on a hit (or when another caller's
+    call was shared) the subject and body are rendered from this incident,
+    so numbers from the incident that filled the cache never leak into it.
+    Raises LLMUnavailableError when the breaker is open, no slot frees up in
+    time or the call fails, so callers can go straight to the template.
     """
-    api_key = os.getenv("GOOGLE_API_KEY")
-    model = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+    if not use_cache:
+        return _generate_draft(incident, evidence, attempts, status, next_steps, vulnerability, style)[0]
 
-    if not api_key:
-        raise RuntimeError("GOOGLE_API_KEY is not set")
+    fresh: Dict[str, Dict[str, Any]] = {}
+
+    def compute() -> Tuple[Dict[str, Any], bool]:
+        draft, cacheable = _generate_draft(incident, evidence, attempts, status, next_steps, vulnerability, style)
+        fresh["draft"] = draft
+        return _diagnosis_fields(draft), cacheable
 
-    client = genai.Client(api_key=api_key)
+    key = diagnosis_fingerprint(incident, evidence, status, vulnerability, style)
+    fields = get_diagnosis_cache().get_or_compute(key, compute)
+    if "draft" in fresh:
+        return fresh["draft"]  # generated for this very incident
+    return _render_draft(incident, evidence, attempts, status, next_steps, vulnerability, fields)
+
+
+def _diagnosis_fields(draft: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "diagnosis": draft.get("diagnosis", ""),
+        "recommendations": list(draft.get("recommendations") or []),
+        "fallback": bool(draft.get("fallback")),
+    }
+
+
+def _render_draft(
+    incident: Dict[str, Any],
+    evidence: Dict[str, Any],
+    attempts: List[Any],
+    status: str,
+    next_steps: List[str],
+    vulnerability: Optional[Dict[str, Any]],
+    fields: Dict[str, Any],
+) -> Dict[str, Any]:
+    """Draft for this incident from cached diagnosis fields, using the template body."""
+    recommendations = [r for r in fields.get("recommendations") or [] if r not in (next_steps or [])]
+    diagnosis = fields.get("diagnosis", "")
+    return {
+        "email_subject": f"[SRE-AI] {incident.get('type', 'Incident')} - {str(status).upper()}",
+        "email_body_html": _build_fallback_html(
+            incident=incident,
+            evidence=evidence,
+            attempts=attempts,
+            status=status,
+            next_steps=list(next_steps or []) + recommendations,
+            vulnerability=vulnerability,
+            diagnosis=diagnosis,
+        ),
+        "diagnosis": diagnosis,
+        "recommendations": recommendations,
+        "fallback": bool(fields.get("fallback")),
+    }
+
+
+def _generate_draft(
+    incident: Dict[str, Any],
+    evidence: Dict[str, Any],
+    attempts: List[Any],
+    status: str,
+    next_steps: List[str],
+    vulnerability: Optional[Dict[str, Any]],
+    style: str,
+) -> Tuple[Dict[str, str], bool]:
+    """One Gemini round trip. Returns (draft, cacheable); template fallbacks are not cacheable."""
+    model = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
 
     # Precompute badges so Gemini doesn't invent random colors/HTML
     severity = incident.get("severity", "INFO")
     inc_type = incident.get("type", "Incident")
 
+    # Compact JSON, with evidence summarized in priority order to fit the budget
+    input_block, budget_info = build_input_block(
+        incident, evidence, attempts, status, next_steps, vulnerability, GEMINI_PROMPT_TOKEN_BUDGET
+    )
+
     # We will FORCE Gemini to output strict JSON only (no markdown, no code fences)
     prompt = f"""
 You are an SRE assistant.
@@ -243,20 +549,17 @@ You are an SRE assistant.
 You MUST return ONLY valid JSON (no markdown, no triple backticks, no extra text).
 
 Goal:
-- Generate a short diagnosis (1-2 lines)
+- Generate a short diagnosis (1-2 lines) and 1-4 short recommendations
+- diagnosis and recommendations are reused for similar incidents: do not quote
+  specific numbers, hosts, ports or timestamps in them
 - Generate HTML email body in the EXACT TABLE-BASED FORMAT described below
 - Include severity badge and status badge (use the exact HTML snippets provided)
 - Include Vulnerability Mapping section as an HTML table (CWE, Title, Meaning, Example CVEs) if vulnerability is provided
 
 STYLE: {style}
 
-INPUT DATA (use these facts only; do not hallucinate):
-incident = { _escape_json_safe(incident) }
-evidence = { _escape_json_safe(evidence) }
-attempts = { _escape_json_safe(attempts) }
-status = { _escape_json_safe(status) }
-next_steps = { _escape_json_safe(next_steps) }
-vulnerability = { _escape_json_safe(vulnerability) }
+INPUT DATA (use these facts only; do not hallucinate; "…" marks summarized values):
+{input_block}
 
 BADGE HTML (use exactly as-is):
 severity_badge_html = {json.dumps(_severity_badge(severity))}
@@ -276,14 +579,19 @@ Return STRICT JSON with keys:
 {{
   "email_subject": "...",
   "email_body_html": "...",
-  "diagnosis": "..."
+  "diagnosis": "...",
+  "recommendations": ["..."]
 }}
 """
 
-    resp = client.models.generate_content(model=model, contents=prompt)
-    raw = (resp.text or "").strip()
-
-    parsed = _extract_json(raw)
+    compacted = bool(budget_info["trimmed"] or budget_info["dropped"])
+    if GEMINI_STRUCTURED_OUTPUT:
+        structured = _generate_structured(model, prompt, DraftResponse, compacted=compacted)
+        parsed = structured.model_dump() if structured is not None else None
+    else:
+        resp = _generate(model, prompt, compacted=compacted)
+        parsed = _extract_json((resp.text or "").strip())
+        LLM_METRICS.record_parse("text", bool(parsed) and "email_body_html" in parsed)
 
     # If Gemini output isn't valid JSON, fall back to our deterministic HTML template
     if not parsed or "email_body_html" not in parsed:
@@ -300,7 +608,9 @@ Return STRICT JSON with keys:
             "email_subject": fallback_subject,
             "email_body_html": fallback_html,
             "diagnosis": f"{inc_type}: {str(status).upper()} (Gemini output could not be parsed as JSON).",
-        }
+            "recommendations": [],
+            "fallback": True,
+        }, False
 
     # Clean + safe defaults if keys missing
     email_subject = parsed.get("email_subject") or f"[SRE-AI] {inc_type} - {str(status).upper()}"
@@ -313,6 +623,9 @@ Return STRICT JSON with keys:
         vulnerability=vulnerability,
     )
     diagnosis = parsed.get("diagnosis") or ""
+    recommendations = parsed.get("recommendations") or []
+    if not isinstance(recommendations, list):
+        recommendations = [recommendations]
 
     # Final guard: if model accidentally returns markdown fences, strip them
     email_body_html = re.sub(r"```.*?```", "", email_body_html, flags=re.DOTALL).strip()
@@ -322,4 +635,26 @@ Return STRICT JSON with keys:
         "email_subject": email_subject,
         "email_body_html": email_body_html,
         "diagnosis": diagnosis[:600],
+        "recommendations": [str(r)[:200] for r in recommendations[:4]],
+        "fallback": False,
+    }, True
+
+
+def llm_status() -> Dict[str, Any]:
+    """Breaker, limiter, cache and call metrics plus the effective settings (GET /llm/status)."""
+    with _LIMITER_LOCK:
+        limiter = {
+            "max_concurrency": GEMINI_MAX_CONCURRENCY,
+            "in_flight": _IN_FLIGHT,
+            "rejected": _SLOT_REJECTIONS,
+            "queue_timeout_s": GEMINI_QUEUE_TIMEOUT_SECONDS,
+        }
+    return {
+        "breaker": BREAKER.stats(),
+        "limiter": limiter,
+        "cache": get_diagnosis_cache().stats(),
+        "timeout_s": GEMINI_TIMEOUT_SECONDS,
+        "prompt_token_budget": GEMINI_PROMPT_TOKEN_BUDGET,
+        "structured_output": GEMINI_STRUCTURED_OUTPUT,
+        "calls": LLM_METRICS.stats(),
     }
@@ -0,0 +1,99 @@
+# llm/metrics.py
+import threading
+from collections import deque
+from typing import Deque, Dict, Optional
+
+
+def percentile(values: list, pct: float) -> Optional[float]:
+    """Nearest-rank percentile of values, rounded to 3 places; None when empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return round(ordered[idx], 3)
+
+
+class LLMMetrics:
+    """
+    Per-call LLM instrumentation: wall time, prompt and output tokens (as
+    reported by the API's usage metadata, or estimated when it is missing)
+    how often prompt compaction had to trim the inputs, and how often the
+    response could not be parsed (per output mode). Keeps running totals
+    plus the last `window` calls for percentiles.
+    """
+
+    def __init__(self, window: int = 500):
+        self._wall_ms: Deque[float] = deque(maxlen=window)
+        self._prompt_tokens: Deque[int] = deque(maxlen=window)
+        self._output_tokens: Deque[int] = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+        self.compacted = 0
+        self.total_prompt_tokens = 0
+        self.total_output_tokens = 0
+        self.parsed: Dict[str, int] = {}
+        self.parse_failures: Dict[str, int] = {}
+
+    def record(
+        self,
+        wall_ms: float,
+        prompt_tokens: Optional[int] = None,
+        output_tokens: Optional[int] = None,
+        ok: bool = True,
+        compacted: bool = False,
+    ) -> None:
+        with self._lock:
+            self.calls += 1
+            if not ok:
+                self.failures += 1
+            if compacted:
+                self.compacted += 1
+            self._wall_ms.append(wall_ms)
+            if prompt_tokens is not None:
+                self._prompt_tokens.append(prompt_tokens)
+                self.total_prompt_tokens += prompt_tokens
+            if output_tokens is not None:
+                self._output_tokens.append(output_tokens)
+                self.total_output_tokens += output_tokens
+
+    def record_parse(self, mode: str, ok: bool) -> None:
+        """Count one response parse attempt for `mode` ("structured" or "text")."""
+        with self._lock:
+            counts = self.parsed if ok else self.parse_failures
+            counts[mode] = counts.get(mode, 0) + 1
+
+    def _parse_stats(self) -> dict:
+        out = {}
+        for mode in sorted(set(self.parsed) | set(self.parse_failures)):
+            ok, failed = self.parsed.get(mode, 0), self.parse_failures.get(mode, 0)
+            out[mode] = {
+                "parsed": ok,
+                "failures": failed,
+                "failure_rate": round(failed / (ok + failed), 4),
+            }
+        return out
+
+    def stats(self) -> dict:
+        with self._lock:
+            wall = list(self._wall_ms)
+            prompt = list(self._prompt_tokens)
+            output = list(self._output_tokens)
+            return {
+                "calls": self.calls,
+                "failures": self.failures,
+                "compacted_prompts": self.compacted,
+                "prompt_tokens_total": self.total_prompt_tokens,
+                "output_tokens_total": self.total_output_tokens,
+                "prompt_tokens_p50": percentile(prompt, 50),
+                "prompt_tokens_p95": percentile(prompt, 95),
+                "output_tokens_p50": percentile(output, 50),
+                "output_tokens_p95": percentile(output, 95),
+                "wall_ms_p50": percentile(wall, 50),
+                "wall_ms_p95": percentile(wall, 95),
+                "wall_ms_max": round(max(wall), 3) if wall else None,
+                "parsing": self._parse_stats(),
+            }
+
+
+LLM_METRICS = LLMMetrics()
@@ -0,0 +1,118 @@
+# llm/prompt_builder.py
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+# Rough chars-per-token for English/JSON; close enough for budgeting
+CHARS_PER_TOKEN = 4
+
+# Progressively harsher (max string chars, max list/dict items) caps
+_LEVELS = [(2000, 50), (600, 20), (200, 8), (80, 4), (40, 2)]
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def compact_json(obj: Any) -> str:
+    """Single-line JSON: no indentation or spaces after separators."""
+    try:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str)
+    except Exception:
+        return str(obj)
+
+
+def summarize(value: Any, max_chars: int, max_items: int) -> Any:
+    """
+    Shrink a value while keeping its structure readable: long strings keep
+    their head and tail, long lists/dicts keep their first items and say
+    how many were dropped.
+    """
+    if isinstance(value, str):
+        if len(value) <= max_chars:
+            return value
+        head = value[: max_chars * 2 // 3]
+        tail = value[-(max_chars // 3):] if max_chars >= 3 else ""
+        return f"{head} …[{len(value) - len(head) - len(tail)} chars omitted]… {tail}"
+    if isinstance(value, (list, tuple)):
+        items = [summarize(v, max_chars, max_items) for v in value[:max_items]]
+        if len(value) > max_items:
+            items.append(f"…(+{len(value) - max_items} more)")
+        return items
+    if isinstance(value, dict):
+        keys = list(value)
+        out = {str(k): summarize(value[k], max_chars, max_items) for k in keys[: max_items * 2]}
+        if len(keys) > max_items * 2:
+            out["…"] = f"+{len(keys) - max_items * 2} more keys"
+        return out
+    return value
+
+
+def _render(fields: Dict[str, Any]) -> str:
+    return "\n".join(f"{name} = {compact_json(value)}" for name, value in fields.items())
+
+
+def build_input_block(
+    incident: Dict[str, Any],
+    evidence: Dict[str, Any],
+    attempts: List[Any],
+    status: str,
+    next_steps: List[str],
+    vulnerability: Optional[Dict[str, Any]],
+    budget_tokens: int,
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Render the prompt's INPUT DATA block within budget_tokens.
+
+    Fields are trimmed in priority order, evidence first (largest field
+    first), then attempts, vulnerability, next steps and finally the
+    incident itself; status is never trimmed. Each pass applies a harsher
+    cap, and evidence fields are dropped outright as a last resort.
+    Returns (block, info) where info has the token estimates and what was cut.
+    """
+    evidence = dict(evidence or {})
+    fields: Dict[str, Any] = {
+        "incident": incident,
+        "evidence": evidence,
+        "attempts": attempts,
+        "status": status,
+        "next_steps": next_steps,
+        "vulnerability": vulnerability,
+    }
+    block = _render(fields)
+    info: Dict[str, Any] = {
+        "original_tokens": estimate_tokens(block),
+        "budget_tokens": budget_tokens,
+        "trimmed": [],
+        "dropped": [],
+    }
+    if info["original_tokens"] <= budget_tokens:
+        info["tokens"] = info["original_tokens"]
+        return block, info
+
+    evidence_order = sorted(evidence, key=lambda k: len(compact_json(evidence[k])), reverse=True)
+    trim_order = [("evidence", k) for k in evidence_order] + [
+        ("attempts", None), ("vulnerability", None), ("next_steps", None), ("incident", None),
+    ]
+    for max_chars, max_items in _LEVELS:
+        for field, key in trim_order:
+            container, slot = (evidence, key) if key is not None else (fields, field)
+            before = compact_json(container[slot])
+            container[slot] = summarize(container[slot], max_chars, max_items)
+            if compact_json(container[slot]) == before:
+                continue
+            name = f"evidence.{key}" if key is not None else field
+            if name not in info["trimmed"]:
+                info["trimmed"].append(name)
+            block = _render(fields)
+            if estimate_tokens(block) <= budget_tokens:
+                info["tokens"] = estimate_tokens(block)
+                return block, info
+
+    for key in evidence_order:
+        evidence[key] = "<omitted to fit token budget>"
+        info["dropped"].append(f"evidence.{key}")
+        block = _render(fields)
+        if estimate_tokens(block) <= budget_tokens:
+            break
+    info["tokens"] = estimate_tokens(block)
+    return block, info
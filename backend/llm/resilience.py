@@ -0,0 +1,75 @@
+# llm/resilience.py
+import threading
+import time
+from typing import Optional
+
+
+class LLMUnavailableError(RuntimeError):
+    """The LLM path was skipped (breaker open, no capacity, deadline); use the template instead."""
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after `failure_threshold` consecutive failures, or at once
+    on a rate-limit response. While open, allow() is False for `cooldown`
+    seconds (or the server's Retry-After, if longer). Then one trial call is
+    let through (half-open): success closes the breaker, failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold: int = 3, cooldown: float = 60.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self._failures = 0
+        self._opened_until = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+        self.opens = 0
+        self.rejected = 0
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() >= self._opened_until:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self, rate_limited: bool = False, retry_after: Optional[float] = None) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if rate_limited or self.state == "half_open" or self._failures >= self.failure_threshold:
+                self._open(max(self.cooldown, retry_after or 0.0))
+
+    def release(self) -> None:
+        """Give back a half-open trial that allow() granted but the caller never ran."""
+        with self._lock:
+            if self.state == "half_open":
+                self._trial_in_flight = False
+
+    def _open(self, seconds: float) -> None:
+        if self.state != "open":
+            self.opens += 1
+        self.state = "open"
+        self._opened_until = time.monotonic() + seconds
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self._failures,
+                "open_for_s": round(max(0.0, self._opened_until - time.monotonic()), 1) if self.state == "open" else 0.0,
+                "opens": self.opens,
+                "rejected": self.rejected,
+            }
@@ -0,0 +1,101 @@
+# llm/structured.py
+from typing import Iterable, List, Optional, Type, TypeVar
+
+from pydantic import BaseModel, ValidationError
+
+T = TypeVar("T", bound=BaseModel)
+
+
+class DraftResponse(BaseModel):
+    """Shape Gemini must return for an alert draft (also sent as the response schema)."""
+    email_subject: str
+    email_body_html: str
+    diagnosis: str = ""
+    recommendations: List[str] = []
+
+
+class BatchDiagnosis(BaseModel):
+    id: int  # position of the incident in the batch prompt
+    diagnosis: str
+    next_steps: List[str] = []
+
+
+class BatchResponse(BaseModel):
+    """Shape Gemini must return for a batch of incidents (see llm/batcher.py)."""
+    results: List[BatchDiagnosis] = []
+
+
+class StructuredOutputError(ValueError):
+    """The model's output was not one JSON object matching the expected schema."""
+
+
+class StreamingJSONParser:
+    """
+    Incremental scanner for the first top-level JSON object in a stream of
+    text chunks. Each character is looked at once: it tracks string/escape
+    state and brace depth, so feed() knows the object is complete the moment
+    its closing brace arrives without re-parsing what came before. Anything
+    before the opening brace (stray prose, a code fence) is skipped.
+    """
+
+    def __init__(self):
+        self._parts = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._started = False
+        self.done = False
+        self.chars = 0
+
+    def feed(self, chunk: str) -> Optional[str]:
+        """Consume a chunk; returns the complete object's text once it closes, else None."""
+        if self.done or not chunk:
+            return None
+        self.chars += len(chunk)
+        start = 0
+        if not self._started:
+            start = chunk.find("{")
+            if start < 0:
+                return None
+            self._started = True
+
+        for i in range(start, len(chunk)):
+            ch = chunk[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._parts.append(chunk[start:i + 1])
+                    self.done = True
+                    return "".join(self._parts)
+        self._parts.append(chunk[start:])
+        return None
+
+
+def parse_stream(chunks: Iterable[str], schema: Type[T]) -> T:
+    """
+    Read text chunks until the first JSON object closes, then validate it
+    against `schema`. Stops consuming as soon as the object is complete.
+    Raises StructuredOutputError when the stream ends early or the object
+    doesn't validate.
+    """
+    parser = StreamingJSONParser()
+    for chunk in chunks:
+        text = parser.feed(chunk)
+        if text is not None:
+            try:
+                return schema.model_validate_json(text)
+            except ValidationError as e:
+                raise StructuredOutputError(f"response did not match {schema.__name__}: {e}") from e
+    raise StructuredOutputError(f"stream ended before a complete JSON object ({parser.chars} chars)")
+
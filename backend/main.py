@@ -1,8 +1,54 @@
-from fastapi import FastAPI
-from .agent.agent_manager import start_agent, stop_agent, simulate_incident
-from .services.storage import INCIDENTS
+import asyncio
+import hashlib
+import json
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Optional
 
-app = FastAPI(title="Agent Automation API")
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from .agent.agent_manager import start_agent, stop_agent, simulate_incident, agent_status, agent_metrics, scale_agent
+from .services.storage import SORT_KEYS, get_incident_store
+from .services.tsdb import get_tsdb
+from .services.broadcast import IncidentBroadcaster, RESYNC
+from .llm.gemini_client import llm_status
+from .llm.metrics import LLM_METRICS
+
+MAX_PAGE_SIZE = 500
+STREAM_KEEPALIVE_SECONDS = 15
+
+BROADCASTER = IncidentBroadcaster()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Stores open here rather than at import, so importing the app touches no files
+    store = get_incident_store()
+    store.add_listener(BROADCASTER.publish)
+    yield
+    stop_agent()
+    store.close()
+
+
+app = FastAPI(title="Agent Automation API", lifespan=lifespan)
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
+
+def _parse_time(value: Optional[str]) -> Optional[float]:
+    """Accepts epoch seconds or an ISO-8601 timestamp."""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid time value: {value}")
 
 @app.post("/agent/start")
 def start(payload: dict):
@@ -14,11 +60,162 @@ def stop():
     stop_agent()
     return {"status": "Agent stopped"}
 
+@app.post("/agent/scale")
+def scale(workers: int):
+    return scale_agent(workers)
+
+@app.get("/agent/status")
+def status():
+    return agent_status()
+
+@app.get("/metrics")
+def metrics():
+    return {**agent_metrics(), "stream": BROADCASTER.stats(), "llm": LLM_METRICS.stats()}
+
+@app.get("/llm/status")
+def get_llm_status():
+    return llm_status()
+
+@app.get("/metrics/series")
+def metrics_series():
+    return get_tsdb().list_series()
+
+@app.get("/metrics/query")
+def metrics_query(
+    series: str,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    points: int = 500,
+    method: str = "lttb",
+):
+    """
+    Range query over the embedded time-series store (epoch seconds).
+    Picks raw, 1m or 1h data by range and downsamples to `points` with
+    LTTB or min/max buckets.
+    """
+    if method not in ("lttb", "minmax"):
+        raise HTTPException(status_code=400, detail="method must be 'lttb' or 'minmax'")
+    end = end or time.time()
+    start = start or end - 3600
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    points = max(3, min(points, 5000))
+    return get_tsdb().query(series, start, end, max_points=points, method=method)
+
 @app.post("/agent/simulate")
 def simulate():
     simulate_incident()
     return {"status": "Incident simulated"}
 
 @app.get("/incidents")
-def get_incidents():
-    return INCIDENTS
+def get_incidents(
+    request: Request,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    order: str = "desc",
+    sort: str = "id",
+    host: Optional[str] = None,
+    type: Optional[str] = None,
+    severity: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+):
+    """
+    Cursor-paginated incidents, newest first by default.
+    Pass next_cursor back as `cursor` for the next page. `sort` is one of
+    id, detected_at, severity, type, host. Responses carry an ETag derived
+    from the store version, so unchanged polls get a 304.
+    """
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order must be 'asc' or 'desc'")
+    if sort not in SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {sorted(SORT_KEYS)}")
+    if sort == "id" and cursor is not None and not cursor.isdigit():
+        raise HTTPException(status_code=400, detail="cursor must be an incident id when sort=id")
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    since_ts, until_ts = _parse_time(since), _parse_time(until)
+
+    store = get_incident_store()
+    store.flush()
+    query_key = json.dumps([limit, cursor, order, sort, host, type, severity, since_ts, until_ts])
+    etag = 'W/"{}-{}-{}"'.format(
+        store.epoch, store.version, hashlib.sha1(query_key.encode()).hexdigest()[:12]
+    )
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [t.strip() for t in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+
+    try:
+        bodies, next_cursor = store.page(
+            limit=limit, cursor=cursor, order=order, sort=sort,
+            host=host, type=type, severity=severity, since=since_ts, until=until_ts,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # Stored bodies are already JSON; splice them instead of re-serializing
+    content = '{"items":[' + ",".join(bodies) + '],"next_cursor":' + json.dumps(next_cursor) + "}"
+    return Response(content=content, media_type="application/json", headers=headers)
+
+
+def _sse(event: str, data: str, event_id: Optional[int] = None) -> str:
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {data}\n\n"
+
+@app.get("/incidents/stream")
+async def stream_incidents(request: Request, cursor: Optional[int] = None):
+    """
+    Server-sent events: `incident` for new incidents (id = incident id) and
+    `update` for changes to existing ones. Reconnect with Last-Event-ID (or
+    ?cursor=) to replay everything missed from the store before going live.
+    """
+    last_event_id = request.headers.get("last-event-id")
+    resume_from = int(last_event_id) if last_event_id and last_event_id.isdigit() else cursor
+    # Subscribe before replaying so nothing lands in the gap between the two
+    queue = BROADCASTER.subscribe()
+
+    async def events():
+        sent = resume_from or 0
+        try:
+            yield "retry: 2000\n\n"
+            if resume_from is not None:
+                page_cursor = resume_from
+                while True:
+                    bodies, next_cursor = await run_in_threadpool(
+                        get_incident_store().page, limit=MAX_PAGE_SIZE, cursor=page_cursor, order="asc"
+                    )
+                    for body in bodies:
+                        incident_id = json.loads(body)["id"]
+                        sent = max(sent, incident_id)
+                        yield _sse("incident", body, incident_id)
+                    if next_cursor is None:
+                        break
+                    page_cursor = next_cursor
+
+            while True:
+                if await request.is_disconnected():
+                    break
+                try:
+                    kind, incident = await asyncio.wait_for(queue.get(), timeout=STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if (kind, incident) == RESYNC:
+                    yield _sse("resync", "{}")
+                    break
+                body = json.dumps(incident, default=str)
+                if kind == "incident":
+                    if incident["id"] <= sent:
+                        continue  # already sent during replay
+                    sent = incident["id"]
+                    yield _sse("incident", body, incident["id"])
+                else:
+                    yield _sse(kind, body)
+        finally:
+            BROADCASTER.unsubscribe(queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,11 +1,21 @@
-import requests
+from .http_monitors import run_probes
+
+
+def probe_backend_health(base_url: str, timeout: int = 3) -> dict:
+    """
+    Checks GET {base_url}/health
+    Returns: {"ok": bool, "status_code": int|None, "details": str}
+    """
+    r = run_probes([f"{base_url}/health"], read_body=True, timeout=timeout)[0]
+    if r["status_code"] is None:
+        return {"ok": False, "status_code": None, "details": f"Unreachable: {r.get('error', '')}"}
+    return {"ok": r["status_code"] == 200, "status_code": r["status_code"], "details": r.get("details", "")}
+
 
 def check_backend_health(url: str, timeout: int = 3) -> str:
-    try:
-        r = requests.get(url, timeout=timeout)
-        if r.status_code == 200:
-            return "UP (200 OK)"
-        else:
-            return f"DOWN ({r.status_code})"
-    except Exception as e:
-        return f"UNREACHABLE ({str(e)})"
+    r = run_probes([url], timeout=timeout)[0]
+    if r["status_code"] == 200:
+        return "UP (200 OK)"
+    if r["status_code"] is not None:
+        return f"DOWN ({r['status_code']})"
+    return f"UNREACHABLE ({r.get('error', '')})"
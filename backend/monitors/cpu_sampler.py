@@ -0,0 +1,173 @@
+import threading
+import time
+from array import array
+from typing import Callable, List, Optional, Tuple
+
+import psutil
+
+
+class RingBuffer:
+    """
+    Fixed-size ring of (timestamp, value) pairs backed by two array('d').
+    Appends are O(1) and never allocate; the oldest sample is overwritten.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._ts = array("d", [0.0]) * capacity
+        self._vals = array("d", [0.0]) * capacity
+        self._head = 0  # next write slot
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, ts: float, value: float) -> None:
+        with self._lock:
+            self._ts[self._head] = ts
+            self._vals[self._head] = value
+            self._head = (self._head + 1) % self.capacity
+            if self._size < self.capacity:
+                self._size += 1
+
+    def latest(self) -> Optional[Tuple[float, float]]:
+        with self._lock:
+            if not self._size:
+                return None
+            i = (self._head - 1) % self.capacity
+            return self._ts[i], self._vals[i]
+
+    def iter_newest(self, since: float):
+        """Yield (ts, value) newest-first while ts > since."""
+        with self._lock:
+            head, size = self._head, self._size
+            ts, vals = self._ts, self._vals
+            out = []
+            for k in range(1, size + 1):
+                i = (head - k) % self.capacity
+                if ts[i] <= since:
+                    break
+                out.append((ts[i], vals[i]))
+        return out
+
+    def window(self, seconds: float, now: Optional[float] = None) -> Tuple[List[float], List[float]]:
+        """Samples from the last `seconds`, oldest first."""
+        now = time.time() if now is None else now
+        pairs = self.iter_newest(now - seconds)
+        pairs.reverse()
+        return [p[0] for p in pairs], [p[1] for p in pairs]
+
+
+class CpuSampler:
+    """
+    Background thread sampling system CPU every `period` seconds into a
+    RingBuffer. Window questions ("above X% for Y s", percentiles) are then
+    answered from the buffer without blocking, for any window length up to
+    period * capacity.
+    """
+
+    def __init__(self, period: float = 1.0, capacity: int = 3600):
+        self.period = period
+        self.buffer = RingBuffer(capacity)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._listeners: List[Callable[[float, float], None]] = []
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def add_listener(self, callback: Callable[[float, float], None]) -> None:
+        """callback(ts, cpu_pct) is called on the sampler thread for every sample."""
+        self._listeners.append(callback)
+
+    def start(self) -> "CpuSampler":
+        if self.running:
+            return self
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="cpu-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.period * 2)
+        self._thread = None
+
+    def _run(self) -> None:
+        psutil.cpu_percent(interval=None)  # prime: first reading is meaningless
+        next_tick = time.monotonic()
+        while True:
+            next_tick += self.period
+            if self._stop.wait(max(0.0, next_tick - time.monotonic())):
+                return
+            ts, cpu = time.time(), psutil.cpu_percent(interval=None)
+            self.buffer.append(ts, cpu)
+            for callback in self._listeners:
+                try:
+                    callback(ts, cpu)
+                except Exception as e:
+                    print(f"[CpuSampler] listener failed: {e}")
+
+    # -------------------------
+    # Window evaluation
+    # -------------------------
+    def coverage(self, seconds: float, now: Optional[float] = None) -> float:
+        """How many of the last `seconds` are backed by samples."""
+        now = time.time() if now is None else now
+        ts, _ = self.buffer.window(seconds, now)
+        if not ts:
+            return 0.0
+        # Each sample covers the `period` that precedes it
+        return min(seconds, now - ts[0] + self.period)
+
+    def above_for(self, threshold_pct: float, seconds: float, now: Optional[float] = None) -> bool:
+        """True if every sample in the last `seconds` is >= threshold and the window is fully covered."""
+        now = time.time() if now is None else now
+        samples = self.buffer.iter_newest(now - seconds)
+        if not samples:
+            return False
+        for _, value in samples:
+            if value < threshold_pct:
+                return False
+        oldest_ts = samples[-1][0]
+        return now - oldest_ts + self.period >= seconds - self.period * 0.5
+
+    def percentile(self, pct: float, seconds: float) -> Optional[float]:
+        _, values = self.buffer.window(seconds)
+        if not values:
+            return None
+        values.sort()
+        idx = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+        return values[idx]
+
+    def mean(self, seconds: float) -> Optional[float]:
+        _, values = self.buffer.window(seconds)
+        return sum(values) / len(values) if values else None
+
+    def wait_for_coverage(self, seconds: float, timeout: Optional[float] = None) -> bool:
+        """
+        Block until the buffer covers `seconds` of history. Only meant for
+        one-shot callers that start the sampler right before evaluating.
+        """
+        deadline = time.monotonic() + (timeout if timeout is not None else seconds + self.period * 2)
+        while self.coverage(seconds) < seconds - self.period * 0.5:
+            if time.monotonic() >= deadline or not self.running:
+                return False
+            time.sleep(min(self.period, 0.25))
+        return True
+
+
+_SAMPLER: Optional[CpuSampler] = None
+_SAMPLER_LOCK = threading.Lock()
+
+
+def get_cpu_sampler(period: float = 1.0, capacity: int = 3600) -> CpuSampler:
+    """Process-wide sampler, started on first use."""
+    global _SAMPLER
+    with _SAMPLER_LOCK:
+        if _SAMPLER is None:
+            _SAMPLER = CpuSampler(period=period, capacity=capacity)
+        return _SAMPLER.start()
@@ -1,35 +1,154 @@
-import requests
+import asyncio
+import time
 from datetime import datetime
+from typing import Iterable, List, Optional
 
-def check_http_endpoint(url: str) -> dict:
+import aiohttp
+
+
+class ProbeEngine:
     """
-    Check if an HTTP endpoint is healthy.
-    Returns dict with status, response_time, error if any.
+    Concurrent HTTP prober sharing one keep-alive connection pool.
+
+    `limit` caps open connections overall and `limit_per_host` caps them per
+    host, so a large fleet is probed in parallel without hammering any one
+    target. The session is created lazily inside the running event loop.
     """
-    try:
-        start = datetime.now()
-        response = requests.get(url, timeout=10)
-        response_time = (datetime.now() - start).total_seconds() * 1000  # ms
-        if response.status_code == 200:
-            return {"status": "healthy", "response_time": response_time}
-        else:
-            return {"status": "unhealthy", "response_time": response_time, "error": f"Status {response.status_code}"}
-    except Exception as e:
-        return {"status": "unhealthy", "error": str(e)}
 
-def monitor_endpoints(endpoints: list) -> list:
+    def __init__(
+        self,
+        timeout: float = 10.0,
+        connect_timeout: float = 3.0,
+        limit: int = 256,
+        limit_per_host: int = 8,
+        keepalive_timeout: float = 30.0,
+    ):
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout, sock_connect=self.connect_timeout),
+                headers={"User-Agent": "sre-agent-probe/1.0"},
+            )
+        return self._session
+
+    async def probe(self, url: str, read_body: bool = False, timeout: Optional[float] = None) -> dict:
+        """
+        Probe a single URL.
+        Returns dict with url, status, status_code, response_time (ms), error
+        and, when read_body is set, the response body as details.
+        """
+        session = await self._get_session()
+        kwargs = {}
+        if timeout is not None:
+            kwargs["timeout"] = aiohttp.ClientTimeout(total=timeout, sock_connect=min(timeout, self.connect_timeout))
+
+        start = time.perf_counter()
+        try:
+            async with session.get(url, **kwargs) as response:
+                # Always drain the body so the connection goes back to the pool
+                body = await response.text(errors="replace") if read_body else await response.read()
+                response_time = (time.perf_counter() - start) * 1000  # ms
+                result = {
+                    "url": url,
+                    "status": "healthy" if response.status == 200 else "unhealthy",
+                    "status_code": response.status,
+                    "response_time": response_time,
+                }
+                if response.status != 200:
+                    result["error"] = f"Status {response.status}"
+                if read_body:
+                    result["details"] = body
+                return result
+        except asyncio.TimeoutError:
+            return {"url": url, "status": "unhealthy", "status_code": None, "error": "Timed out"}
+        except Exception as e:
+            return {"url": url, "status": "unhealthy", "status_code": None, "error": str(e)}
+
+    async def probe_many(self, urls: Iterable[str], read_body: bool = False) -> List[dict]:
+        """Probe all URLs concurrently; results keep the input order."""
+        return list(await asyncio.gather(*(self.probe(u, read_body=read_body) for u in urls)))
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+def run_probes(urls: Iterable[str], read_body: bool = False, **engine_kwargs) -> List[dict]:
     """
-    Monitor a list of endpoints.
-    Returns list of incidents if any are unhealthy.
+    Blocking entry point for callers without an event loop.
+    Uses a short-lived engine so the pool never outlives the loop.
     """
+    async def _run():
+        engine = ProbeEngine(**engine_kwargs)
+        try:
+            return await engine.probe_many(urls, read_body=read_body)
+        finally:
+            await engine.close()
+
+    return asyncio.run(_run())
+
+
+def _to_incidents(results: List[dict]) -> list:
     incidents = []
-    for url in endpoints:
-        result = check_http_endpoint(url)
+    for result in results:
         if result["status"] != "healthy":
             incidents.append({
                 "type": "HTTP Endpoint Down",
-                "details": f"Endpoint {url} is {result['status']}: {result.get('error', '')}",
+                "target": result["url"],
+                "details": f"Endpoint {result['url']} is {result['status']}: {result.get('error', '')}",
                 "severity": "HIGH",
                 "timestamp": datetime.now()
             })
-    return incidents
\ No newline at end of file
+    return incidents
+
+
+def check_http_endpoint(url: str) -> dict:
+    """
+    Check if an HTTP endpoint is healthy.
+    Returns dict with status, response_time, error if any.
+    """
+    return run_probes([url])[0]
+
+
+def monitor_endpoints(endpoints: list) -> list:
+    """
+    Monitor a list of endpoints.
+    Returns list of incidents if any are unhealthy.
+    """
+    return _to_incidents(run_probes(endpoints))
+
+
+async def monitor_endpoints_async(endpoints: list, engine: ProbeEngine, on_probe=None) -> list:
+    """
+    Same as monitor_endpoints, but probes through a shared engine on the
+    caller's event loop so keep-alive connections are reused across cycles.
+    on_probe(result) is called for every probe result, healthy or not. It
+    usually writes to disk, so it runs on the loop's executor, not the loop.
+    """
+    results = await engine.probe_many(endpoints)
+    if on_probe is not None:
+        await asyncio.get_running_loop().run_in_executor(None, _report_probes, on_probe, results)
+    return _to_incidents(results)
+
+
+def _report_probes(on_probe, results: list) -> None:
+    for result in results:
+        try:
+            on_probe(result)
+        except Exception as e:
+            print(f"[Probe] on_probe failed for {result.get('url')}: {e}")
@@ -0,0 +1,122 @@
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+import psutil
+
+
+class ProcessCpuCollector:
+    """
+    Per-process CPU from two cpu_times() snapshots of the whole process
+    table, instead of a blocking cpu_percent(interval) call per process.
+
+    psutil.Process objects are cached across cycles (keyed by pid and
+    checked for pid reuse), and every cycle's share is kept in a short
+    per-pid history so a spike can be traced back to the process behind it.
+    """
+
+    def __init__(self, history_len: int = 120, min_interval: float = 0.5):
+        self.history_len = history_len
+        self.min_interval = min_interval
+        self._procs: Dict[int, psutil.Process] = {}
+        self._names: Dict[int, str] = {}
+        self._prev: Dict[int, float] = {}
+        self._prev_ts: Optional[float] = None
+        self._history: Dict[int, Deque[Tuple[float, float]]] = {}
+        self._lock = threading.Lock()
+
+    def _snapshot(self) -> Dict[int, float]:
+        """Total (user + system) CPU seconds per live pid."""
+        pids = set(psutil.pids())
+        for gone in set(self._procs) - pids:
+            self._forget(gone)
+
+        totals: Dict[int, float] = {}
+        for pid in pids:
+            proc = self._procs.get(pid)
+            try:
+                if proc is None or not proc.is_running():
+                    # New pid, or the old process exited and its pid was reused
+                    self._forget(pid)
+                    proc = psutil.Process(pid)
+                    self._procs[pid] = proc
+                with proc.oneshot():
+                    if pid not in self._names:
+                        self._names[pid] = proc.name()
+                    t = proc.cpu_times()
+                totals[pid] = t.user + t.system
+            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                self._forget(pid)
+            except Exception:
+                continue
+        return totals
+
+    def _forget(self, pid: int) -> None:
+        self._procs.pop(pid, None)
+        self._names.pop(pid, None)
+        self._prev.pop(pid, None)
+        self._history.pop(pid, None)
+
+    def sample(self) -> List[Tuple[float, int, str]]:
+        """
+        One collection cycle. Returns [(cpu_pct, pid, name), ...] for every
+        process, computed from the delta against the previous cycle. The very
+        first call takes a baseline and waits min_interval for the second.
+        """
+        with self._lock:
+            if self._prev_ts is None or time.monotonic() - self._prev_ts < self.min_interval:
+                if self._prev_ts is None:
+                    self._prev = self._snapshot()
+                    self._prev_ts = time.monotonic()
+                time.sleep(max(0.0, self.min_interval - (time.monotonic() - self._prev_ts)))
+
+            current = self._snapshot()
+            now = time.monotonic()
+            wall = max(now - self._prev_ts, 1e-6)
+            stamp = time.time()
+
+            results = []
+            for pid, total in current.items():
+                before = self._prev.get(pid)
+                # Processes born this cycle have no baseline; count from zero
+                pct = max(0.0, (total - before) if before is not None else total) / wall * 100.0
+                results.append((round(pct, 1), pid, self._names.get(pid, "?")))
+                hist = self._history.get(pid)
+                if hist is None:
+                    hist = self._history[pid] = deque(maxlen=self.history_len)
+                hist.append((stamp, pct))
+
+            self._prev, self._prev_ts = current, now
+            return results
+
+    def top(self, n: int = 5) -> List[Tuple[float, int, str]]:
+        procs = self.sample()
+        procs.sort(reverse=True, key=lambda x: x[0])
+        return procs[:n]
+
+    def history(self, pid: int) -> List[Tuple[float, float]]:
+        with self._lock:
+            return list(self._history.get(pid, ()))
+
+    def top_contributors(self, seconds: float, n: int = 5) -> List[Tuple[float, int, str]]:
+        """Average CPU share per process over the last `seconds` of recorded cycles."""
+        cutoff = time.time() - seconds
+        out = []
+        with self._lock:
+            for pid, hist in self._history.items():
+                vals = [pct for ts, pct in hist if ts >= cutoff]
+                if vals:
+                    out.append((round(sum(vals) / len(vals), 1), pid, self._names.get(pid, "?")))
+        out.sort(reverse=True, key=lambda x: x[0])
+        return out[:n]
+
+
+_COLLECTOR: Optional[ProcessCpuCollector] = None
+
+
+def get_process_collector() -> ProcessCpuCollector:
+    global _COLLECTOR
+    if _COLLECTOR is None:
+        _COLLECTOR = ProcessCpuCollector()
+    return _COLLECTOR
@@ -1,6 +1,8 @@
-import time
 import psutil
 
+from .cpu_sampler import get_cpu_sampler
+from .process_cpu import get_process_collector
+
 def cpu_high_for(duration_seconds: int, threshold_pct: float) -> bool:
     """
     Returns True if CPU stays above threshold for duration_seconds.
@@ -14,30 +16,24 @@ def cpu_high_for(duration_seconds: int, threshold_pct: float) -> bool:
         - NetBSD
         - Sun Solaris
         - AIX
+
+    Answered instantly from the background sampler's history; returns False
+    while the sampler has not yet covered duration_seconds.
     """
+    sampler = get_cpu_sampler()
+    latest = sampler.buffer.latest()
     print(f"[Monitor] Checking CPU > {threshold_pct}% for {duration_seconds}s")
-
-    start = time.time()
-    while time.time() - start < duration_seconds:
-        cpu = psutil.cpu_percent(interval=1)
-        print(f"[Monitor] CPU usage: {cpu}%")
-
-        if cpu < threshold_pct:
-            return False
-
-    return True
+    if latest:
+        print(f"[Monitor] CPU usage: {latest[1]}% (p95 over window: {sampler.percentile(95, duration_seconds)}%)")
+    return sampler.above_for(threshold_pct, duration_seconds)
 
 def disk_usage_pct(drive: str = "C:\\") -> float:
     usage = psutil.disk_usage(drive)
     return usage.percent
 
 def top_cpu_processes(n: int = 5):
-    procs = []
-    for p in psutil.process_iter(attrs=["pid", "name"]):
-        try:
-            cpu = p.cpu_percent(interval=0.1)
-            procs.append((cpu, p.info["pid"], p.info["name"]))
-        except Exception:
-            continue
-    procs.sort(reverse=True, key=lambda x: x[0])
-    return procs[:n]
+    """
+    Top n processes by CPU as (cpu_pct, pid, name), from a whole-table
+    cpu_times snapshot diff. Per-process history stays on the collector.
+    """
+    return get_process_collector().top(n)
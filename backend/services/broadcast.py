@@ -0,0 +1,65 @@
+import asyncio
+import threading
+from typing import Dict, Tuple
+
+RESYNC = ("resync", None)
+
+
+class IncidentBroadcaster:
+    """
+    Fans incident events out to any number of async subscribers.
+
+    publish() may be called from any thread; each subscriber has its own
+    bounded queue on its own loop. A subscriber that falls behind gets a
+    RESYNC event and is dropped, so one slow client never blocks the rest —
+    it reconnects with Last-Event-ID and catches up from the store.
+    """
+
+    def __init__(self, queue_size: int = 1000):
+        self.queue_size = queue_size
+        self._subscribers: Dict[asyncio.Queue, asyncio.AbstractEventLoop] = {}
+        self._lock = threading.Lock()
+        self.published = 0
+        self.dropped_subscribers = 0
+
+    def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers[queue] = asyncio.get_running_loop()
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        with self._lock:
+            self._subscribers.pop(queue, None)
+
+    def publish(self, kind: str, incident: dict) -> None:
+        event: Tuple[str, dict] = (kind, dict(incident))
+        with self._lock:
+            subscribers = list(self._subscribers.items())
+            self.published += 1
+        for queue, loop in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._offer, queue, event)
+            except RuntimeError:  # loop already closed
+                self.unsubscribe(queue)
+
+    def _offer(self, queue: asyncio.Queue, event: tuple) -> None:
+        with self._lock:
+            if queue not in self._subscribers:
+                return  # already dropped; events scheduled before that are moot
+        if queue.full():
+            self.unsubscribe(queue)
+            self.dropped_subscribers += 1
+            # Make room for the marker so the stream can tell the client
+            queue.get_nowait()
+            queue.put_nowait(RESYNC)
+            return
+        queue.put_nowait(event)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "subscribers": len(self._subscribers),
+                "published": self.published,
+                "dropped_subscribers": self.dropped_subscribers,
+            }
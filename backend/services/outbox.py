@@ -0,0 +1,276 @@
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from typing import List, Optional
+
+import requests
+
+from .paths import data_path
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id              INTEGER PRIMARY KEY AUTOINCREMENT,
+    key             TEXT NOT NULL UNIQUE,
+    url             TEXT NOT NULL,
+    payload         TEXT NOT NULL,
+    created_ts      REAL NOT NULL,
+    next_attempt_ts REAL NOT NULL,
+    attempts        INTEGER NOT NULL DEFAULT 0,
+    dead            INTEGER NOT NULL DEFAULT 0,
+    last_error      TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(dead, next_attempt_ts);
+"""
+
+# Client errors that will never succeed on retry; everything else is retried
+_PERMANENT_STATUSES = set(range(400, 500)) - {408, 409, 425, 429}
+
+
+class WebhookOutbox:
+    """
+    Disk-backed store-and-forward queue for outbound webhooks.
+
+    enqueue() only writes a row to SQLite, so a slow or dead receiver never
+    touches the detection path. A background thread delivers due rows,
+    deleting them on 2xx and rescheduling with capped exponential backoff
+    (honouring Retry-After) otherwise. Each event carries an idempotency key
+    that survives restarts, so a retry after a crash can be de-duplicated
+    by the receiver. Requests rejected with a permanent 4xx are kept as
+    dead letters for dead_letter_days, then purged.
+
+    By default (batch_size == 1) each payload is posted as-is, one event per
+    request, which is what the Power Automate flow expects. batch_size > 1 is
+    only for receivers that accept the batch envelope:
+        {"events": [{"idempotency_key": "<key>", "payload": {...}}, ...]}
+    posted with an Idempotency-Key header derived from the event keys.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        batch_size: int = 1,
+        timeout: float = 10.0,
+        base_backoff: float = 2.0,
+        max_backoff: float = 300.0,
+        poll_interval: float = 5.0,
+        dead_letter_days: float = 7.0,
+    ):
+        self.path = path
+        self.batch_size = max(1, batch_size)
+        self.timeout = timeout
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.poll_interval = poll_interval
+        self.dead_letter_days = dead_letter_days
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._session = requests.Session()
+        self.delivered = 0
+        self.failed_attempts = 0
+        self.dead_lettered = 0
+        self.purged = 0
+        self._last_purge = 0.0
+
+    # -------------------------
+    # Producer side
+    # -------------------------
+    def enqueue(self, url: str, payload: dict, key: Optional[str] = None) -> str:
+        """Persist an event for delivery and return its idempotency key."""
+        key = key or uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            # Re-enqueueing a pending key is a no-op, so producers may retry freely;
+            # a key left behind by a dead letter is reused for the new event
+            self._conn.execute(
+                "INSERT INTO outbox (key, url, payload, created_ts, next_attempt_ts) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET url = excluded.url, payload = excluded.payload, "
+                "created_ts = excluded.created_ts, next_attempt_ts = excluded.next_attempt_ts, "
+                "attempts = 0, dead = 0, last_error = NULL WHERE outbox.dead = 1",
+                (key, url, json.dumps(payload, default=str), now, now),
+            )
+        self.start()
+        self._wake.set()
+        return key
+
+    # -------------------------
+    # Delivery
+    # -------------------------
+    def start(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="webhook-outbox", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if time.time() - self._last_purge > 3600:
+                    self.purge_dead_letters()
+                sent = self.deliver_due()
+            except Exception as e:
+                print(f"[Outbox] delivery loop failed: {e}")
+                sent = 0
+            if sent:
+                continue  # more may be due; drain before sleeping
+            self._wake.wait(self._sleep_for())
+            self._wake.clear()
+
+    def _sleep_for(self) -> float:
+        with self._lock:
+            row = self._conn.execute("SELECT MIN(next_attempt_ts) FROM outbox WHERE dead = 0").fetchone()
+        if row[0] is None:
+            return self.poll_interval
+        return min(self.poll_interval, max(0.05, row[0] - time.time()))
+
+    def _due(self) -> List[tuple]:
+        with self._lock:
+            first = self._conn.execute(
+                "SELECT url FROM outbox WHERE dead = 0 AND next_attempt_ts <= ? ORDER BY id LIMIT 1",
+                (time.time(),),
+            ).fetchone()
+            if first is None:
+                return []
+            return self._conn.execute(
+                "SELECT id, key, url, payload, attempts FROM outbox "
+                "WHERE dead = 0 AND next_attempt_ts <= ? AND url = ? ORDER BY id LIMIT ?",
+                (time.time(), first[0], self.batch_size),
+            ).fetchall()
+
+    def deliver_due(self) -> int:
+        """Attempt one batch of due events. Returns how many were delivered."""
+        rows = self._due()
+        if not rows:
+            return 0
+        url = rows[0][2]
+        keys = [r[1] for r in rows]
+        if len(rows) == 1:
+            body = json.loads(rows[0][3])
+            batch_key = keys[0]
+        else:
+            body = {"events": [{"idempotency_key": r[1], "payload": json.loads(r[3])} for r in rows]}
+            batch_key = hashlib.sha1("|".join(keys).encode("utf-8")).hexdigest()
+
+        retry_after = None
+        try:
+            response = self._session.post(
+                url, json=body, timeout=self.timeout, headers={"Idempotency-Key": batch_key}
+            )
+            status = response.status_code
+            if 200 <= status < 300:
+                self._delete(rows)
+                return len(rows)
+            error = f"HTTP {status}"
+            retry_after = response.headers.get("Retry-After")
+            if status in _PERMANENT_STATUSES:
+                self._dead_letter(rows, error)
+                return 0
+        except requests.exceptions.RequestException as e:
+            error = str(e)
+        self._reschedule(rows, error, retry_after)
+        return 0
+
+    def _delete(self, rows: List[tuple]) -> None:
+        with self._lock:
+            self._conn.executemany("DELETE FROM outbox WHERE id = ?", [(r[0],) for r in rows])
+        self.delivered += len(rows)
+
+    def _dead_letter(self, rows: List[tuple], error: str) -> None:
+        # next_attempt_ts is unused once dead, so it records when the row died
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE outbox SET dead = 1, attempts = attempts + 1, next_attempt_ts = ?, last_error = ? WHERE id = ?",
+                [(now, error, r[0]) for r in rows],
+            )
+        self.dead_lettered += len(rows)
+        print(f"[Outbox] {len(rows)} event(s) rejected permanently: {error}")
+
+    def _reschedule(self, rows: List[tuple], error: str, retry_after: Optional[str]) -> None:
+        attempts = max(r[4] for r in rows) + 1
+        delay = min(self.max_backoff, self.base_backoff * 2 ** (attempts - 1)) * random.uniform(0.8, 1.2)
+        try:
+            delay = max(delay, float(retry_after)) if retry_after else delay
+        except ValueError:
+            pass
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE outbox SET attempts = attempts + 1, next_attempt_ts = ?, last_error = ? WHERE id = ?",
+                [(time.time() + delay, error, r[0]) for r in rows],
+            )
+        self.failed_attempts += 1
+        print(f"[Outbox] delivery of {len(rows)} event(s) failed ({error}); retrying in {delay:.0f}s")
+
+    def purge_dead_letters(self) -> int:
+        """Delete dead letters older than dead_letter_days. Returns rows deleted."""
+        cutoff = time.time() - self.dead_letter_days * 86400
+        with self._lock:
+            purged = self._conn.execute(
+                "DELETE FROM outbox WHERE dead = 1 AND next_attempt_ts < ?", (cutoff,)
+            ).rowcount
+        self._last_purge = time.time()
+        self.purged += purged
+        return purged
+
+    # -------------------------
+    # Introspection
+    # -------------------------
+    def stats(self) -> dict:
+        with self._lock:
+            pending, dead, oldest = self._conn.execute(
+                "SELECT SUM(dead = 0), SUM(dead = 1), MIN(CASE WHEN dead = 0 THEN created_ts END) FROM outbox"
+            ).fetchone()
+        return {
+            "pending": pending or 0,
+            "dead_letters": dead or 0,
+            "oldest_pending_age_s": round(time.time() - oldest, 1) if oldest else 0.0,
+            "delivered": self.delivered,
+            "failed_attempts": self.failed_attempts,
+            "dead_lettered": self.dead_lettered,
+            "dead_letters_purged": self.purged,
+        }
+
+
+_OUTBOX: Optional[WebhookOutbox] = None
+_OUTBOX_LOCK = threading.Lock()
+
+
+def get_outbox() -> WebhookOutbox:
+    """Process-wide outbox at WEBHOOK_OUTBOX_PATH (default DATA_DIR/outbox.db), opened on first use."""
+    global _OUTBOX
+    with _OUTBOX_LOCK:
+        if _OUTBOX is None:
+            _OUTBOX = WebhookOutbox(
+                os.getenv("WEBHOOK_OUTBOX_PATH") or data_path("outbox.db"),
+                dead_letter_days=float(os.getenv("WEBHOOK_DEAD_LETTER_DAYS", "7")),
+            )
+        return _OUTBOX
+
+
+def stop_outbox(timeout: float = 5.0) -> None:
+    """Stop the delivery worker if the outbox was ever opened; pending rows stay for the next start()."""
+    with _OUTBOX_LOCK:
+        outbox = _OUTBOX
+    if outbox is not None:
+        outbox.stop(timeout=timeout)
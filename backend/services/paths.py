@@ -0,0 +1,14 @@
+import os
+
+# Root for every on-disk store (incidents, outbox, LLM cache, metrics, KB cache)
+DEFAULT_DATA_DIR = ".data"
+
+
+def data_dir() -> str:
+    """Data root from DATA_DIR (default .data); read on each call so tests and scripts can repoint it."""
+    return os.getenv("DATA_DIR", "").strip() or DEFAULT_DATA_DIR
+
+
+def data_path(*parts: str) -> str:
+    """Path under the data root; per-store env overrides (INCIDENT_DB_PATH etc.) still take precedence."""
+    return os.path.join(data_dir(), *parts)
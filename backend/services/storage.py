@@ -1,2 +1,392 @@
-INCIDENTS = []
+import base64
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from .paths import data_path
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS incidents (
+    id          INTEGER PRIMARY KEY,
+    host        TEXT,
+    type        TEXT,
+    severity    TEXT,
+    detected_at TEXT,
+    detected_ts REAL,
+    fingerprint TEXT,
+    status      TEXT,
+    body        TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_incidents_host        ON incidents(host, detected_ts);
+CREATE INDEX IF NOT EXISTS idx_incidents_type        ON incidents(type, detected_ts);
+CREATE INDEX IF NOT EXISTS idx_incidents_severity    ON incidents(severity, detected_ts);
+CREATE INDEX IF NOT EXISTS idx_incidents_detected_ts ON incidents(detected_ts);
+"""
+
+# Columns added after the first release; older databases get them on open
+_MIGRATIONS = {
+    "fingerprint": "ALTER TABLE incidents ADD COLUMN fingerprint TEXT",
+    "status": "ALTER TABLE incidents ADD COLUMN status TEXT",
+}
+_POST_MIGRATION = """
+CREATE INDEX IF NOT EXISTS idx_incidents_open ON incidents(fingerprint, status);
+"""
+
+# Sortable columns for page(); NULLs are folded so row-value comparisons work.
+# Severity sorts by rank, so desc puts Critical first.
+SORT_KEYS = {
+    "id": "id",
+    "detected_at": "detected_ts",
+    "host": "COALESCE(host, '')",
+    "type": "COALESCE(type, '')",
+    "severity": (
+        "CASE UPPER(COALESCE(severity, '')) WHEN 'CRITICAL' THEN 4 WHEN 'HIGH' THEN 3 "
+        "WHEN 'MEDIUM' THEN 2 WHEN 'LOW' THEN 1 ELSE 0 END"
+    ),
+}
+
+
+def _encode_cursor(value, last_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([value, last_id]).encode()).decode().rstrip("=")
+
+
+def _decode_cursor(token: str) -> Tuple[object, int]:
+    try:
+        value, last_id = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        return value, int(last_id)
+    except Exception:
+        raise ValueError(f"Invalid cursor: {token}")
+
+
+def _to_ts(detected_at) -> float:
+    try:
+        return datetime.fromisoformat(str(detected_at)).timestamp()
+    except (TypeError, ValueError):
+        return time.time()
+
+
+class IncidentStore:
+    """
+    Durable incident store on SQLite in WAL mode.
+
+    Writes are buffered and inserted in batches (on batch_size or every
+    flush_interval seconds); reads flush first, so callers always see their
+    own writes. Ids are assigned at append time so they can be handed out
+    before the batch lands. Retention trims by age and row count, then
+    reclaims pages with an incremental vacuum, keeping disk and memory flat.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        batch_size: int = 100,
+        flush_interval: float = 1.0,
+        retention_days: float = 90,
+        max_rows: int = 500_000,
+    ):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        self.max_rows = max_rows
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._write_lock = threading.RLock()
+        self._local = threading.local()
+        self._writer = self._connect()
+        # auto_vacuum must be set before the first table is created
+        self._writer.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self._writer.executescript(_SCHEMA)
+        columns = {row[1] for row in self._writer.execute("PRAGMA table_info(incidents)")}
+        for column, ddl in _MIGRATIONS.items():
+            if column not in columns:
+                self._writer.execute(ddl)
+        self._writer.executescript(_POST_MIGRATION)
+        self._next_id = (self._writer.execute("SELECT MAX(id) FROM incidents").fetchone()[0] or 0) + 1
+        self._pending: List[tuple] = []
+        # epoch + version identify the store contents for cheap ETags
+        self.epoch = secrets.token_hex(4)
+        self.version = 0
+        self._listeners: List[Callable[[str, dict], None]] = []
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def add_listener(self, callback: Callable[[str, dict], None]) -> None:
+        """callback(kind, incident) runs after every append ("incident") and update ("update")."""
+        self._listeners.append(callback)
+
+    def _notify(self, kind: str, incident: dict) -> None:
+        for callback in self._listeners:
+            try:
+                callback(kind, incident)
+            except Exception as e:
+                print(f"[IncidentStore] listener failed: {e}")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    # -------------------------
+    # Lifecycle
+    # -------------------------
+    def start(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="incident-store", daemon=True)
+            self._thread.start()
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self.flush()
+
+    def _run(self) -> None:
+        last_retention = 0.0
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+                if time.time() - last_retention > 3600:
+                    self.enforce_retention()
+                    last_retention = time.time()
+            except Exception as e:
+                print(f"[IncidentStore] background flush failed: {e}")
+
+    # -------------------------
+    # Writes
+    # -------------------------
+    def append(self, incident: dict) -> int:
+        """Queue an incident for insert. Sets and returns incident['id']."""
+        self.start()
+        with self._write_lock:
+            incident_id = self._next_id
+            self._next_id += 1
+            incident["id"] = incident_id
+            self._pending.append(self._row(incident))
+            if len(self._pending) >= self.batch_size:
+                self.flush()
+        self._notify("incident", incident)
+        return incident_id
+
+    def extend(self, incidents: Iterable[dict]) -> None:
+        for incident in incidents:
+            self.append(incident)
+
+    @staticmethod
+    def _row(incident: dict) -> tuple:
+        return (
+            incident["id"],
+            incident.get("host"),
+            incident.get("type"),
+            incident.get("severity"),
+            incident.get("detected_at"),
+            _to_ts(incident.get("detected_at")),
+            incident.get("fingerprint"),
+            incident.get("status"),
+            json.dumps(incident, default=str),
+        )
+
+    def flush(self) -> None:
+        with self._write_lock:
+            if not self._pending:
+                return
+            rows, self._pending = self._pending, []
+            self._writer.execute("BEGIN")
+            try:
+                self._writer.executemany(
+                    "INSERT OR REPLACE INTO incidents "
+                    "(id, host, type, severity, detected_at, detected_ts, fingerprint, status, body) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+                self._writer.execute("COMMIT")
+                self.version += 1
+            except Exception:
+                self._writer.execute("ROLLBACK")
+                self._pending = rows + self._pending
+                raise
+
+    def update(self, incident_id: int, **fields) -> Optional[dict]:
+        """Merge fields into a stored incident and return the new version."""
+        with self._write_lock:
+            self.flush()
+            current = self.get(incident_id)
+            if current is None:
+                return None
+            current.update(fields)
+            row = self._row(current)
+            self._writer.execute(
+                "UPDATE incidents SET host=?, type=?, severity=?, detected_at=?, detected_ts=?, "
+                "fingerprint=?, status=?, body=? WHERE id=?",
+                row[1:] + (incident_id,),
+            )
+            self.version += 1
+        self._notify("update", current)
+        return current
+
+    def enforce_retention(self) -> int:
+        """Drop incidents past retention_days or beyond max_rows, then reclaim space."""
+        self.flush()
+        with self._write_lock:
+            cutoff = time.time() - self.retention_days * 86400
+            removed = self._writer.execute("DELETE FROM incidents WHERE detected_ts < ?", (cutoff,)).rowcount
+            overflow = self.count() - self.max_rows
+            if overflow > 0:
+                removed += self._writer.execute(
+                    "DELETE FROM incidents WHERE id IN (SELECT id FROM incidents ORDER BY id LIMIT ?)",
+                    (overflow,),
+                ).rowcount
+            if removed:
+                self.version += 1
+                self._writer.execute("PRAGMA incremental_vacuum")
+            self._writer.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            return removed
+
+    # -------------------------
+    # Reads
+    # -------------------------
+    def get(self, incident_id: int) -> Optional[dict]:
+        self.flush()
+        row = self._reader().execute("SELECT body FROM incidents WHERE id = ?", (incident_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def open_fingerprints(self) -> Dict[str, int]:
+        """fingerprint -> id of every incident still open."""
+        self.flush()
+        rows = self._reader().execute(
+            "SELECT fingerprint, MAX(id) FROM incidents WHERE status = 'open' GROUP BY fingerprint"
+        ).fetchall()
+        return {fp: incident_id for fp, incident_id in rows if fp}
+
+    def count(self) -> int:
+        self.flush()
+        return self._reader().execute("SELECT COUNT(*) FROM incidents").fetchone()[0]
+
+    @staticmethod
+    def _filters(host, type, severity, since, until) -> Tuple[List[str], list]:
+        clauses, params = [], []
+        for column, value in (("host", host), ("type", type), ("severity", severity)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            clauses.append("detected_ts >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("detected_ts < ?")
+            params.append(until)
+        return clauses, params
+
+    def list(
+        self,
+        limit: Optional[int] = None,
+        host: Optional[str] = None,
+        type: Optional[str] = None,
+        severity: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+    ) -> List[dict]:
+        """Incidents oldest first, optionally filtered; with limit, the newest `limit` of them."""
+        self.flush()
+        clauses, params = self._filters(host, type, severity, since, until)
+        sql = "SELECT body FROM incidents"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        rows = self._reader().execute(sql, params).fetchall()
+        return [json.loads(r[0]) for r in reversed(rows)]
+
+    def page(
+        self,
+        limit: int = 100,
+        cursor: Union[int, str, None] = None,
+        order: str = "desc",
+        sort: str = "id",
+        host: Optional[str] = None,
+        type: Optional[str] = None,
+        severity: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+    ) -> Tuple[List[str], Union[int, str, None]]:
+        """
+        Keyset page of incidents. Returns (raw JSON bodies, next_cursor);
+        bodies are left encoded so the API can emit them without a
+        decode/encode round trip.
+
+        With sort="id" the cursor is the last id of the previous page. Other
+        sort keys (see SORT_KEYS) page on (sort value, id) and use an opaque
+        string cursor.
+        """
+        if sort not in SORT_KEYS:
+            raise ValueError(f"sort must be one of {sorted(SORT_KEYS)}")
+        self.flush()
+        clauses, params = self._filters(host, type, severity, since, until)
+        ascending = order == "asc"
+        op, direction = (">", "ASC") if ascending else ("<", "DESC")
+        expr = SORT_KEYS[sort]
+
+        if cursor is not None:
+            if sort == "id":
+                clauses.append(f"id {op} ?")
+                params.append(int(cursor))
+            else:
+                value, last_id = _decode_cursor(str(cursor))
+                clauses.append(f"({expr}, id) {op} (?, ?)")
+                params.extend([value, last_id])
+
+        sql = f"SELECT id, body, {expr} FROM incidents"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        if sort == "id":
+            sql += f" ORDER BY id {direction} LIMIT ?"
+        else:
+            sql += f" ORDER BY {expr} {direction}, id {direction} LIMIT ?"
+        params.append(int(limit) + 1)
+
+        rows = self._reader().execute(sql, params).fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = None
+        if has_more and rows:
+            last = rows[-1]
+            next_cursor = last[0] if sort == "id" else _encode_cursor(last[2], last[0])
+        return [r[1] for r in rows], next_cursor
+
+    def __len__(self) -> int:
+        return self.count()
+
+
+_INCIDENTS: Optional[IncidentStore] = None
+_INCIDENTS_LOCK = threading.Lock()
+
+
+def get_incident_store() -> IncidentStore:
+    """Process-wide store at INCIDENT_DB_PATH (default DATA_DIR/incidents.db), opened and started on first use."""
+    global _INCIDENTS
+    with _INCIDENTS_LOCK:
+        if _INCIDENTS is None:
+            _INCIDENTS = IncidentStore(os.getenv("INCIDENT_DB_PATH") or data_path("incidents.db"))
+            _INCIDENTS.start()
+        return _INCIDENTS
+
+
 AGENT_RUNNING = False
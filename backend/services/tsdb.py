@@ -0,0 +1,413 @@
+import hashlib
+import itertools
+import json
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .paths import data_path
+
+# (name, bucket seconds); "raw" keeps points as recorded
+RESOLUTIONS = (("raw", 1), ("1m", 60), ("1h", 3600))
+
+DEFAULT_RETENTION = {
+    "raw": 2 * 86400,
+    "1m": 30 * 86400,
+    "1h": 730 * 86400,
+}
+
+# magic, ncols, count, start_ts, end_ts, payload_len
+_HEADER = struct.Struct("<4sBIddI")
+_MAGIC = b"TSC1"
+
+
+def _encode(rows: List[tuple], ncols: int) -> bytes:
+    """Timestamps as delta-encoded int64 ms, other columns as float64, zlib-compressed."""
+    ts_col = array("q")
+    prev = 0
+    for r in rows:
+        ms = int(round(r[0] * 1000))
+        ts_col.append(ms - prev)
+        prev = ms
+    cols = [array("d", (r[i] for r in rows)) for i in range(1, ncols)]
+    return zlib.compress(ts_col.tobytes() + b"".join(c.tobytes() for c in cols), 6)
+
+
+def _decode(payload: bytes, ncols: int, count: int) -> List[tuple]:
+    raw = zlib.decompress(payload)
+    split = count * 8
+    ts_col = array("q")
+    ts_col.frombytes(raw[:split])
+    values = array("d")
+    values.frombytes(raw[split:])
+    ts = [ms / 1000.0 for ms in itertools.accumulate(ts_col)]
+    cols = [values[i * count:(i + 1) * count] for i in range(ncols - 1)]
+    return list(zip(ts, *cols))
+
+
+class _ChunkFile:
+    """Append-only file of compressed chunks with an in-memory chunk index."""
+
+    def __init__(self, path: str, ncols: int):
+        self.path = path
+        self.ncols = ncols
+        self._index: Optional[List[Tuple[float, float, int, int]]] = None
+
+    def index(self) -> List[Tuple[float, float, int, int]]:
+        if self._index is None:
+            self._index = []
+            if os.path.exists(self.path):
+                file_size = os.path.getsize(self.path)
+                offset = 0
+                with open(self.path, "rb") as f:
+                    while offset + _HEADER.size <= file_size:
+                        f.seek(offset)
+                        magic, _, _, start, end, size = _HEADER.unpack(f.read(_HEADER.size))
+                        if magic != _MAGIC or offset + _HEADER.size + size > file_size:
+                            break
+                        self._index.append((start, end, offset, _HEADER.size + size))
+                        offset += _HEADER.size + size
+                if offset < file_size:
+                    # Torn tail from a crash mid-append: cut it so new chunks stay reachable
+                    with open(self.path, "r+b") as f:
+                        f.truncate(offset)
+        return self._index
+
+    def append(self, rows: List[tuple]) -> None:
+        if not rows:
+            return
+        payload = _encode(rows, self.ncols)
+        header = _HEADER.pack(_MAGIC, self.ncols, len(rows), rows[0][0], rows[-1][0], len(payload))
+        index = self.index()
+        with open(self.path, "ab") as f:
+            offset = f.tell()
+            f.write(header + payload)
+        index.append((rows[0][0], rows[-1][0], offset, len(header) + len(payload)))
+
+    def read(self, start: float, end: float) -> List[tuple]:
+        f, hits = self.open_chunks(start, end)
+        return self.read_chunks(f, hits, start, end)
+
+    def open_chunks(self, start: float, end: float):
+        """
+        The chunks overlapping [start, end] plus an open handle on the file.
+        Cheap enough to call under the store lock; the handle keeps the
+        chunks readable even if retention swaps the file out afterwards.
+        """
+        hits = [c for c in self.index() if c[1] >= start and c[0] <= end]
+        if not hits:
+            return None, []
+        return open(self.path, "rb"), hits
+
+    @staticmethod
+    def read_chunks(f, hits: List[Tuple[float, float, int, int]], start: float, end: float) -> List[tuple]:
+        """Read and decode chunks from open_chunks(); closes the handle."""
+        if f is None:
+            return []
+        out = []
+        with f:
+            for _, _, offset, size in hits:
+                f.seek(offset)
+                blob = f.read(size)
+                _, ncols, count, _, _, _ = _HEADER.unpack(blob[:_HEADER.size])
+                out.extend(r for r in _decode(blob[_HEADER.size:], ncols, count) if start <= r[0] <= end)
+        return out
+
+    def drop_before(self, cutoff: float) -> int:
+        """Rewrite the file without chunks that ended before cutoff. Returns chunks dropped."""
+        index = self.index()
+        keep = [c for c in index if c[1] >= cutoff]
+        dropped = len(index) - len(keep)
+        if not dropped:
+            return 0
+        tmp = self.path + ".tmp"
+        new_index = []
+        with open(self.path, "rb") as src, open(tmp, "wb") as dst:
+            for start, end, offset, size in keep:
+                src.seek(offset)
+                new_index.append((start, end, dst.tell(), size))
+                dst.write(src.read(size))
+        os.replace(tmp, self.path)
+        self._index = new_index
+        return dropped
+
+
+class _Series:
+    def __init__(self, directory: str, name: str):
+        self.name = name
+        os.makedirs(directory, exist_ok=True)
+        meta = os.path.join(directory, "meta.json")
+        if not os.path.exists(meta):
+            with open(meta, "w", encoding="utf-8") as f:
+                json.dump({"name": name}, f)
+        # raw rows: (ts, value); rollup rows: (ts, min, max, mean, count)
+        self.files = {
+            res: _ChunkFile(os.path.join(directory, f"{res}.log"), 2 if res == "raw" else 5)
+            for res, _ in RESOLUTIONS
+        }
+        self.head: Dict[str, List[tuple]] = {res: [] for res, _ in RESOLUTIONS}
+        self.buckets: Dict[str, Optional[list]] = {res: None for res, _ in RESOLUTIONS[1:]}
+
+    def rollup(self, res: str, step: int, ts: float, value: float) -> None:
+        start = ts - (ts % step)
+        b = self.buckets[res]
+        if b is not None and b[0] != start:
+            self.head[res].append(self._bucket_row(b))
+            b = None
+        if b is None:
+            self.buckets[res] = [start, value, value, value, 1]
+            return
+        b[1] = min(b[1], value)
+        b[2] = max(b[2], value)
+        b[3] += value
+        b[4] += 1
+
+    @staticmethod
+    def _bucket_row(b: list) -> tuple:
+        return (b[0], b[1], b[2], b[3] / b[4], float(b[4]))
+
+
+class TimeSeriesStore:
+    """
+    Embedded append-only time-series store.
+
+    Points land in a per-series head buffer and are written as compressed
+    chunks once `chunk_points` accumulate (or on the periodic flush). Each
+    point also feeds 1m and 1h rollups (min/max/mean/count), so long ranges
+    are served from coarse files. Expired chunks are compacted away per
+    resolution retention.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        chunk_points: int = 256,
+        flush_interval: float = 30.0,
+        retention: Optional[Dict[str, float]] = None,
+    ):
+        self.root = root
+        self.chunk_points = chunk_points
+        self.flush_interval = flush_interval
+        self.retention = dict(DEFAULT_RETENTION, **(retention or {}))
+        self._series: Dict[str, _Series] = {}
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        os.makedirs(root, exist_ok=True)
+
+    # -------------------------
+    # Lifecycle
+    # -------------------------
+    def start(self) -> "TimeSeriesStore":
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="tsdb-flush", daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self.flush()
+
+    def _run(self) -> None:
+        last_retention = 0.0
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+                if time.time() - last_retention > 3600:
+                    self.enforce_retention()
+                    last_retention = time.time()
+            except Exception as e:
+                print(f"[TSDB] background flush failed: {e}")
+
+    # -------------------------
+    # Write path
+    # -------------------------
+    def _dir_for(self, name: str) -> str:
+        slug = re.sub(r"[^A-Za-z0-9._-]+", "_", name)[:80]
+        digest = hashlib.sha1(name.encode("utf-8")).hexdigest()[:10]
+        return os.path.join(self.root, f"{slug}-{digest}")
+
+    def _get(self, name: str) -> _Series:
+        s = self._series.get(name)
+        if s is None:
+            s = self._series[name] = _Series(self._dir_for(name), name)
+        return s
+
+    def append(self, series: str, ts: float, value: float) -> None:
+        with self._lock:
+            self._append(series, ts, float(value))
+
+    def append_many(self, points: Iterable[Tuple[str, float, float]]) -> None:
+        """Append (series, ts, value) points under one lock acquisition."""
+        points = [(series, ts, float(value)) for series, ts, value in points]
+        with self._lock:
+            for series, ts, value in points:
+                self._append(series, ts, value)
+
+    def _append(self, series: str, ts: float, value: float) -> None:
+        s = self._get(series)
+        s.head["raw"].append((ts, value))
+        for res, step in RESOLUTIONS[1:]:
+            s.rollup(res, step, ts, value)
+        for res, _ in RESOLUTIONS:
+            if len(s.head[res]) >= self.chunk_points:
+                s.files[res].append(s.head[res])
+                s.head[res] = []
+
+    def flush(self) -> None:
+        """Write out every head buffer. Open rollup buckets stay in memory until they close."""
+        with self._lock:
+            for s in self._series.values():
+                for res, rows in s.head.items():
+                    if rows:
+                        s.files[res].append(rows)
+                        s.head[res] = []
+
+    def enforce_retention(self) -> int:
+        now = time.time()
+        dropped = 0
+        with self._lock:
+            self._load_all()
+            for s in self._series.values():
+                for res, f in s.files.items():
+                    dropped += f.drop_before(now - self.retention[res])
+        return dropped
+
+    # -------------------------
+    # Read path
+    # -------------------------
+    def _load_all(self) -> None:
+        for entry in os.scandir(self.root):
+            meta = os.path.join(entry.path, "meta.json")
+            if entry.is_dir() and os.path.exists(meta):
+                try:
+                    with open(meta, encoding="utf-8") as f:
+                        self._get(json.load(f)["name"])
+                except Exception:
+                    continue
+
+    def list_series(self) -> List[str]:
+        with self._lock:
+            self._load_all()
+            return sorted(self._series)
+
+    def pick_resolution(self, start: float, end: float, max_points: int) -> str:
+        """Finest resolution that still has data for start and keeps the read bounded."""
+        now = time.time()
+        for res, step in RESOLUTIONS:
+            if start < now - self.retention[res]:
+                continue
+            if (end - start) / step <= max_points * 20:
+                return res
+        return RESOLUTIONS[-1][0]
+
+    def read(self, series: str, start: float, end: float, res: str) -> List[tuple]:
+        """Rows as (ts, value, min, max) at the given resolution, oldest first."""
+        # Only the chunk list and in-memory rows are taken under the lock;
+        # disk reads and decompression happen after it so appends don't wait.
+        with self._lock:
+            if series not in self._series and not os.path.isdir(self._dir_for(series)):
+                return []
+            s = self._get(series)
+            f, hits = s.files[res].open_chunks(start, end)
+            recent = [r for r in s.head[res] if start <= r[0] <= end]
+            if res != "raw" and s.buckets[res] is not None:
+                open_row = _Series._bucket_row(s.buckets[res])
+                if start <= open_row[0] <= end:
+                    recent.append(open_row)
+        rows = _ChunkFile.read_chunks(f, hits, start, end)
+        rows.extend(recent)
+        if res == "raw":
+            return [(r[0], r[1], r[1], r[1]) for r in rows]
+        return [(r[0], r[3], r[1], r[2]) for r in rows]
+
+    def query(
+        self,
+        series: str,
+        start: float,
+        end: float,
+        max_points: int = 500,
+        method: str = "lttb",
+    ) -> dict:
+        res = self.pick_resolution(start, end, max_points)
+        rows = self.read(series, start, end, res)
+        if method == "minmax":
+            points = minmax_downsample(rows, max_points)
+        else:
+            points = lttb([(r[0], r[1]) for r in rows], max_points)
+        return {
+            "series": series,
+            "resolution": res,
+            "method": method,
+            "source_points": len(rows),
+            "points": [[round(t, 3), v] for t, v in points],
+        }
+
+
+def lttb(points: List[Tuple[float, float]], threshold: int) -> List[Tuple[float, float]]:
+    """Largest-Triangle-Three-Buckets downsampling; keeps first and last points."""
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return list(points)
+
+    sampled = [points[0]]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, n)
+        span = max(avg_end - avg_start, 1)
+        avg_x = sum(p[0] for p in points[avg_start:avg_end]) / span
+        avg_y = sum(p[1] for p in points[avg_start:avg_end]) / span
+
+        range_start = int(i * every) + 1
+        range_end = int((i + 1) * every) + 1
+        ax, ay = points[a]
+        best_area, best = -1.0, range_start
+        for j in range(range_start, range_end):
+            area = abs((ax - avg_x) * (points[j][1] - ay) - (ax - points[j][0]) * (avg_y - ay))
+            if area > best_area:
+                best_area, best = area, j
+        sampled.append(points[best])
+        a = best
+    sampled.append(points[-1])
+    return sampled
+
+
+def minmax_downsample(rows: List[tuple], threshold: int) -> List[Tuple[float, float]]:
+    """Per bucket, emit the min and max (in time order) so spikes survive downsampling."""
+    if len(rows) <= threshold:
+        return [(r[0], r[1]) for r in rows]
+    buckets = max(1, threshold // 2)
+    size = len(rows) / buckets
+    out = []
+    for b in range(buckets):
+        chunk = rows[int(b * size):int((b + 1) * size)]
+        if not chunk:
+            continue
+        lo = min(chunk, key=lambda r: r[2])
+        hi = max(chunk, key=lambda r: r[3])
+        pair = sorted([(lo[0], lo[2]), (hi[0], hi[3])])
+        out.extend(pair if lo is not hi else pair[:1])
+    return out
+
+
+_STORE: Optional[TimeSeriesStore] = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_tsdb() -> TimeSeriesStore:
+    """Process-wide store under METRICS_DIR (default DATA_DIR/metrics), started on first use."""
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            _STORE = TimeSeriesStore(os.getenv("METRICS_DIR") or data_path("metrics")).start()
+        return _STORE
@@ -55,6 +55,15 @@ def _table_row(label: str, value: str) -> str:
     """
 
 
+def _severity_badge(severity: Optional[str]) -> str:
+    sev = (severity or "").upper()
+    if sev in ("HIGH", "CRITICAL"):
+        return _badge(sev, "red")
+    if sev in ("MEDIUM", "WARN", "WARNING"):
+        return _badge(sev, "yellow")
+    return _badge(sev or "INFO", "gray")
+
+
 def _render_attempts(attempts: List[Any]) -> str:
     if not attempts:
         return "<p style='margin:0;color:#6b7280;'>None</p>"
@@ -151,14 +160,7 @@ def build_email(
     else:
         status_badge = _badge(status_upper or "UNKNOWN", "gray")
 
-    # severity badge tone
-    sev = (severity or "").upper()
-    if sev in ("HIGH", "CRITICAL"):
-        sev_badge = _badge(sev, "red")
-    elif sev in ("MEDIUM", "WARN", "WARNING"):
-        sev_badge = _badge(sev, "yellow")
-    else:
-        sev_badge = _badge(sev or "INFO", "gray")
+    sev_badge = _severity_badge(severity)
 
     subject = f"{subject_prefix} {incident_type} | {host} | {status_upper}"
 
@@ -215,3 +217,78 @@ def build_email(
     """
 
     return subject, body
+
+
+def _digest_cell(value: str, header: bool = False) -> str:
+    tag = "th" if header else "td"
+    bg = "background:#f9fafb; text-align:left;" if header else ""
+    return f'<{tag} style="padding:8px 10px; border:1px solid #e5e7eb; color:#111827; {bg}">{value}</{tag}>'
+
+
+def build_digest_email(
+    subject_prefix: str,
+    incidents: List[Dict[str, Any]],
+    window_start: str,
+    window_end: str,
+) -> Tuple[str, str]:
+    """
+    Returns (subject, html_body) summarising several incidents in one table.
+
+    Used for non-critical alerts batched over a time window; each incident
+    is one row (time, host, type, severity, occurrences, details).
+    """
+    hosts = sorted({str(i.get("host", "unknown")) for i in incidents})
+    types: Dict[str, int] = {}
+    for i in incidents:
+        types[i.get("type", "Unknown")] = types.get(i.get("type", "Unknown"), 0) + 1
+
+    subject = f"{subject_prefix} Digest: {len(incidents)} incident(s) on {len(hosts)} host(s)"
+
+    header = "".join(
+        _digest_cell(f"<strong>{h}</strong>", header=True)
+        for h in ("Detected", "Host", "Incident Type", "Severity", "Count", "Details")
+    )
+    rows = []
+    for i in incidents:
+        rows.append(
+            "<tr>"
+            + _digest_cell(_escape_html(i.get("detected_at", "")))
+            + _digest_cell(_escape_html(i.get("host", "")))
+            + _digest_cell(f"<strong>{_escape_html(i.get('type', 'Unknown'))}</strong>")
+            + _digest_cell(_severity_badge(i.get("severity")))
+            + _digest_cell(_escape_html(i.get("occurrences", 1)))
+            + _digest_cell(f"<div style='white-space:pre-wrap; color:#374151;'>{_escape_html(i.get('details', ''))}</div>")
+            + "</tr>"
+        )
+
+    summary = "".join(_badge(f"{t} × {n}", "gray") for t, n in sorted(types.items()))
+
+    body = f"""
+    <div style="font-family:Segoe UI, Arial, sans-serif; color:#111827; line-height:1.45; max-width:960px;">
+      <div style="padding:16px 18px; border:1px solid #e5e7eb; border-radius:14px; background:#ffffff;">
+        <div style="font-size:16px; font-weight:800; margin-bottom:2px;">
+          SRE AI Agent Digest
+        </div>
+        <div style="font-size:13px; color:#6b7280;">
+          {_escape_html(window_start)} – {_escape_html(window_end)} · Hosts: <strong style="color:#111827;">{_escape_html(", ".join(hosts))}</strong>
+        </div>
+        <div style="display:flex; flex-wrap:wrap; gap:6px; margin-top:10px;">
+          {summary}
+        </div>
+
+        <hr style="border:none; border-top:1px solid #e5e7eb; margin:14px 0;" />
+
+        <table style="border-collapse:collapse; width:100%; font-size:13px;">
+          <tr>{header}</tr>
+          {"".join(rows)}
+        </table>
+
+        <hr style="border:none; border-top:1px solid #e5e7eb; margin:16px 0 10px;" />
+        <div style="font-size:12px; color:#6b7280;">
+          Non-critical alerts are batched into this digest; critical incidents are emailed immediately.
+        </div>
+      </div>
+    </div>
+    """
+
+    return subject, body
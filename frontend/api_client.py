@@ -1,18 +1,290 @@
+import asyncio
+import json
+import random
+import threading
+import time
+from collections import deque
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+try:
+    import aiohttp  # only needed for AsyncApiClient
+except ImportError:
+    aiohttp = None
 
 BASE_URL = "http://localhost:8000"
 
+CONNECT_TIMEOUT = 3
+READ_TIMEOUT = 10
+MAX_RETRIES = 2
+RETRY_STATUSES = {502, 503, 504}
+
+
+class RetryBudget:
+    """
+    Caps retries to a fraction of recent traffic so a struggling backend is
+    not hit with a retry storm. Every request deposits `ratio` tokens, every
+    retry withdraws one; `min_per_sec` keeps a trickle of retries available
+    when traffic is low. Deposits expire after `ttl` seconds.
+    """
+
+    def __init__(self, ratio=0.2, min_per_sec=1.0, ttl=10.0):
+        self.ratio = ratio
+        self.min_per_sec = min_per_sec
+        self.ttl = ttl
+        self._requests = deque()
+        self._retries = deque()
+        self._lock = threading.Lock()
+
+    def _trim(self, now):
+        cutoff = now - self.ttl
+        while self._requests and self._requests[0] < cutoff:
+            self._requests.popleft()
+        while self._retries and self._retries[0] < cutoff:
+            self._retries.popleft()
+
+    def record_request(self):
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            self._requests.append(now)
+
+    def can_retry(self):
+        """Withdraw one retry if the budget allows it."""
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            allowed = self.min_per_sec * self.ttl + self.ratio * len(self._requests)
+            if len(self._retries) >= allowed:
+                return False
+            self._retries.append(now)
+            return True
+
+
+RETRY_BUDGET = RetryBudget()
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """One pooled keep-alive session per process, shared by every Streamlit session."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                # Retries are handled by _request so they can respect the budget
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=0)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+
+def _never_sent(exc):
+    """True when the request failed before reaching the server, so a retry cannot duplicate it."""
+    if isinstance(exc, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(exc.args[0], "reason", None) if exc.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+def _backoff(attempt):
+    return min(2.0, 0.1 * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+
+def _request(method, path, timeout=None, idempotent=True, retries=MAX_RETRIES, **kwargs):
+    """
+    Send a request through the shared session with (connect, read) timeouts.
+    Idempotent calls are retried on connection errors, timeouts and 502/503/504;
+    others only when the request never left the client.
+    """
+    session = get_session()
+    timeout = timeout or (CONNECT_TIMEOUT, READ_TIMEOUT)
+    RETRY_BUDGET.record_request()
+    attempt = 0
+    while True:
+        try:
+            response = session.request(method, f"{BASE_URL}{path}", timeout=timeout, **kwargs)
+            if not (idempotent and response.status_code in RETRY_STATUSES):
+                return response
+            if attempt >= retries or not RETRY_BUDGET.can_retry():
+                return response
+            response.close()
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            retryable = idempotent or _never_sent(e)
+            if not retryable or attempt >= retries or not RETRY_BUDGET.can_retry():
+                raise
+        time.sleep(_backoff(attempt))
+        attempt += 1
+
+
+# Start/stop change server state, so they are only retried if they never reached it
 def start_agent(payload):
-    return requests.post(f"{BASE_URL}/agent/start", json=payload)
+    return _request("POST", "/agent/start", json=payload, idempotent=False)
 
 def stop_agent():
-    return requests.post(f"{BASE_URL}/agent/stop")
+    return _request("POST", "/agent/stop", idempotent=False)
 
 def simulate_incident():
-    return requests.post(f"{BASE_URL}/agent/simulate")
+    # Each call creates an incident, so never retry once it may have been sent
+    return _request("POST", "/agent/simulate", idempotent=False)
+
+def fetch_incidents(limit=100, **filters):
+    """Newest `limit` incidents, oldest first (filters: host, type, severity, since, until)."""
+    try:
+        page = fetch_incident_page(limit=limit, **filters)
+        return list(reversed(page.get("items", [])))
+    except requests.exceptions.RequestException:
+        return []
+
+def _incident_params(limit, cursor, order, sort, filters):
+    params = {"limit": limit, "order": order, "sort": sort}
+    if cursor is not None:
+        params["cursor"] = cursor
+    params.update({k: v for k, v in filters.items() if v is not None})
+    return params
+
+def fetch_incident_page(limit=100, cursor=None, order="desc", sort="id", **filters):
+    """
+    One page from GET /incidents: {"items": [...], "next_cursor": ...}.
+    sort is one of id, detected_at, host, type, severity; the cursor is an
+    int for id and an opaque string for the others.
+    """
+    params = _incident_params(limit, cursor, order, sort, filters)
+    return _request("GET", "/incidents", params=params, timeout=(CONNECT_TIMEOUT, 5)).json()
+
+def stream_incidents(cursor=None, read_timeout=30):
+    """
+    Generator over GET /incidents/stream (server-sent events).
+    Yields (event, event_id, data_dict); resumes after `cursor` if given.
+    Raises requests exceptions on disconnect so callers can reconnect.
+    """
+    headers = {"Accept": "text/event-stream", "Accept-Encoding": "identity"}
+    if cursor is not None:
+        headers["Last-Event-ID"] = str(cursor)
+    # The caller owns reconnects, so a single attempt here
+    with _request("GET", "/incidents/stream", retries=0, headers=headers, stream=True,
+                  timeout=(CONNECT_TIMEOUT, read_timeout)) as r:
+        r.raise_for_status()
+        event, event_id, data = "message", None, []
+        for line in r.iter_lines(decode_unicode=True):
+            if line is None:
+                continue
+            if line == "":
+                if data:
+                    yield event, event_id, json.loads("\n".join(data))
+                event, event_id, data = "message", None, []
+            elif line.startswith(":"):
+                continue
+            elif line.startswith("event:"):
+                event = line[6:].strip()
+            elif line.startswith("id:"):
+                event_id = int(line[3:].strip())
+            elif line.startswith("data:"):
+                data.append(line[5:].lstrip())
+
+def fetch_metric_series():
+    try:
+        return _request("GET", "/metrics/series", timeout=(CONNECT_TIMEOUT, 5)).json()
+    except requests.exceptions.RequestException:
+        return []
+
+def _metric_params(series, start, end, points, method):
+    params = {"series": series, "points": points, "method": method}
+    if start is not None:
+        params["start"] = start
+    if end is not None:
+        params["end"] = end
+    return params
 
-def fetch_incidents():
+def query_metrics(series, start=None, end=None, points=500, method="lttb"):
+    params = _metric_params(series, start, end, points, method)
     try:
-        return requests.get(f"{BASE_URL}/incidents", timeout=2).json()
+        return _request("GET", "/metrics/query", params=params).json()
     except requests.exceptions.RequestException:
-        return []
\ No newline at end of file
+        return {"series": series, "points": []}
+
+
+class AsyncApiClient:
+    """
+    asyncio variant of the functions above over one pooled aiohttp session,
+    for fetching several things concurrently (e.g. a batch of metric series).
+    Shares the module retry budget; use as `async with AsyncApiClient() as api:`.
+    """
+
+    def __init__(self, base_url=BASE_URL, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 limit=16, retries=MAX_RETRIES):
+        if aiohttp is None:
+            raise RuntimeError("aiohttp is required for AsyncApiClient. Install with: pip install aiohttp")
+        self.base_url = base_url
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.limit = limit
+        self.retries = retries
+        self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.limit, keepalive_timeout=30),
+                timeout=aiohttp.ClientTimeout(sock_connect=self.connect_timeout, sock_read=self.read_timeout),
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def request(self, method, path, idempotent=True, **kwargs):
+        """Return the decoded JSON body; raises aiohttp errors once retries are exhausted."""
+        session = self._get_session()
+        RETRY_BUDGET.record_request()
+        attempt = 0
+        while True:
+            try:
+                async with session.request(method, f"{self.base_url}{path}", **kwargs) as response:
+                    retry = idempotent and response.status in RETRY_STATUSES
+                    if not retry or attempt >= self.retries or not RETRY_BUDGET.can_retry():
+                        response.raise_for_status()
+                        return await response.json()
+            except (aiohttp.ClientConnectorError, aiohttp.ServerTimeoutError, aiohttp.ServerDisconnectedError) as e:
+                retryable = idempotent or isinstance(e, aiohttp.ClientConnectorError)
+                if not retryable or attempt >= self.retries or not RETRY_BUDGET.can_retry():
+                    raise
+            await asyncio.sleep(_backoff(attempt))
+            attempt += 1
+
+    async def start_agent(self, payload):
+        return await self.request("POST", "/agent/start", json=payload, idempotent=False)
+
+    async def stop_agent(self):
+        return await self.request("POST", "/agent/stop", idempotent=False)
+
+    async def simulate_incident(self):
+        return await self.request("POST", "/agent/simulate", idempotent=False)
+
+    async def fetch_incident_page(self, limit=100, cursor=None, order="desc", sort="id", **filters):
+        return await self.request("GET", "/incidents", params=_incident_params(limit, cursor, order, sort, filters))
+
+    async def fetch_metric_series(self):
+        return await self.request("GET", "/metrics/series")
+
+    async def query_metrics(self, series, start=None, end=None, points=500, method="lttb"):
+        return await self.request("GET", "/metrics/query", params=_metric_params(series, start, end, points, method))
+
+    async def query_many(self, series_names, start=None, end=None, points=500, method="lttb"):
+        """Query several series concurrently over the shared pool."""
+        return await asyncio.gather(
+            *(self.query_metrics(s, start, end, points, method) for s in series_names)
+        )
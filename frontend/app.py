@@ -3,7 +3,9 @@ import random
 import streamlit as st
 import pandas as pd
 import requests
-from api_client import start_agent, stop_agent, simulate_incident, fetch_incidents
+from api_client import start_agent, stop_agent, simulate_incident, fetch_incidents, fetch_incident_page, fetch_metric_series, query_metrics
+from incident_feed import IncidentFeed
+from kb_search import KBSearchIndex
 # --------- ADDITIONAL IMPORTS (safe, no backend dependency) ----------
 from datetime import datetime, timezone, time
 import json
@@ -40,6 +42,32 @@ def external_search_fallback(query):
 def generate_commit_hash(length=40):
     return ''.join(random.choices('0123456789abcdef', k=length))
 
+@st.cache_resource
+def get_incident_feed():
+    # One SSE subscription per Streamlit process, shared across sessions
+    return IncidentFeed()
+
+FEED_SORT_KEYS = ["id", "detected_at", "severity", "host", "type"]
+FEED_POLL_MAX_BACKOFF = 30
+
+def incident_rows(items):
+    """Flatten incidents into table rows; the full record stays available via the inspector."""
+    return [
+        {
+            "id": inc.get("id"),
+            "detected_at": inc.get("detected_at"),
+            "severity": inc.get("severity"),
+            "type": inc.get("type"),
+            "host": inc.get("host"),
+            "decision": inc.get("decision"),
+            "details": str(inc.get("details", ""))[:200],
+        }
+        for inc in items
+    ]
+
+# st.fragment is the stable name from Streamlit 1.37; older builds only have the experimental one
+fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment")
+
 @st.cache_data
 def load_vulnerability_kb(EXCEL_URL):
     try:
@@ -52,7 +80,20 @@ def load_vulnerability_kb(EXCEL_URL):
     except Exception as e:
         return None
 
-def chatbot_answer_engine(user_query, ui_context, vuln_df=None):
+@st.cache_resource
+def _build_kb_search_index(EXCEL_URL, _vuln_df):
+    # Built once per KB (per URL) and shared by every session, with its query cache
+    return KBSearchIndex(_vuln_df)
+
+def get_kb_search_index(EXCEL_URL):
+    vuln_df = load_vulnerability_kb(EXCEL_URL)
+    if vuln_df is None:
+        # Don't let a failed download stick in the cache; the next rerun retries it
+        load_vulnerability_kb.clear()
+        return None
+    return _build_kb_search_index(EXCEL_URL, vuln_df)
+
+def chatbot_answer_engine(user_query, ui_context, vuln_df=None, kb_index=None):
     query = user_query.lower()
 
     # -------- CERTIFICATES --------
@@ -82,16 +123,13 @@ def chatbot_answer_engine(user_query, ui_context, vuln_df=None):
         return ui_context.get("disk_issues", "No disk issues recorded.")
 
     # ---------- EXCEL KB LOOKUP ----------
-    if vuln_df is not None:
-        matches = vuln_df[
-            vuln_df.apply(
-                lambda row: query in str(row).lower(),
-                axis=1
-            )
-        ]
+    if kb_index is None and vuln_df is not None:
+        kb_index = KBSearchIndex(vuln_df)
+    if kb_index is not None:
+        matches = kb_index.search(query, k=3)
 
-        if not matches.empty:
-            return matches.head(3).to_dict(orient="records")
+        if matches:
+            return matches
 
     # -------- FALLBACK --------
     return "NOT_FOUND"
@@ -280,8 +318,10 @@ def main_app():
    # ---------------- Excel Vulnerability KB ----------------
     EXCEL_URL = "https://raw.githubusercontent.com/abhigyanpal1/sre-agent-kb-demo/main/CWE_Knowledge_Base.xlsx"
 
-    if "vuln_df" not in st.session_state:
-        st.session_state.vuln_df = load_vulnerability_kb(EXCEL_URL)
+    kb_index = get_kb_search_index(EXCEL_URL)
+    if st.session_state.get("vuln_df") is None:
+        # Cached frame when the index built; None (retried next rerun) when the download failed
+        st.session_state.vuln_df = load_vulnerability_kb(EXCEL_URL) if kb_index is not None else None
 
 
 
@@ -339,20 +379,30 @@ def main_app():
             st.text_input("Recipients")
 
         col1, col2, col3 = st.columns(3)
+        # Calls time out instead of hanging the script when the backend is unresponsive
         with col1:
             if st.button("▶ Start Agent"):
-                start_agent({"env": env})
-                st.success("Agent started")
+                try:
+                    start_agent({"env": env})
+                    st.success("Agent started")
+                except requests.exceptions.RequestException as e:
+                    st.error(f"Backend unreachable: {e}")
 
         with col2:
             if st.button("⚠ Simulate Incident"):
-                simulate_incident()
-                st.warning("Incident simulated")
+                try:
+                    simulate_incident()
+                    st.warning("Incident simulated")
+                except requests.exceptions.RequestException as e:
+                    st.error(f"Backend unreachable: {e}")
 
         with col3:
             if st.button("⏹ Stop Agent"):
-                stop_agent()
-                st.info("Agent stopped")
+                try:
+                    stop_agent()
+                    st.info("Agent stopped")
+                except requests.exceptions.RequestException as e:
+                    st.error(f"Backend unreachable: {e}")
 
         # ===================== ADD-ON: AUTOSYS + DEPLOYMENTS (UI ONLY) =====================
         st.divider()
@@ -1131,16 +1181,135 @@ def main_app():
     with tabs[1]:
         st.header("Live Feed &amp; Evidence")
 
-        try:
-            incidents = fetch_incidents()
-            st.session_state.ui_context["incidents"] = incidents
-        except Exception as e:
-            st.warning("⚠ Backend not running. Showing empty incident list.")
-            incidents = []
+        feed = get_incident_feed()
+        incidents = feed.snapshot()
+
+        ss = st.session_state
+        ss.setdefault("feed_cursor", feed.last_id)
+        ss.setdefault("feed_new", [])
+        ss.setdefault("feed_backoff", 1)
+        ss.setdefault("feed_next_poll", 0.0)
+        ss.setdefault("feed_page_cursors", [None])
+        ss.setdefault("feed_page_key", None)
+        ss.setdefault("feed_page", {"items": [], "next_cursor": None})
+
+        @fragment(run_every=1)
+        def live_incidents():
+            # Only this block reruns every second; it pulls incidents newer than
+            # feed_cursor and touches the backend only when something changed.
+            if ss.feed_cursor is None and feed.last_id is not None:
+                # Baseline: anything already in the feed is history, not news
+                ss.feed_cursor = feed.last_id
+            if feed.connected:
+                fresh = feed.since(ss.feed_cursor)
+                ss.feed_backoff = 1
+            elif pytime.time() >= ss.feed_next_poll:
+                # Stream is down: poll the cursor endpoint, backing off while the API is unreachable
+                try:
+                    if ss.feed_cursor is None:
+                        page = fetch_incident_page(limit=1)
+                        items = page.get("items", [])
+                        ss.feed_cursor = items[0].get("id") if items else 0
+                        fresh = []
+                    else:
+                        page = fetch_incident_page(limit=200, cursor=ss.feed_cursor, order="asc")
+                        fresh = page.get("items", [])
+                    ss.feed_backoff = 1
+                except (requests.exceptions.RequestException, ValueError):
+                    fresh = []
+                    ss.feed_backoff = min(ss.feed_backoff * 2, FEED_POLL_MAX_BACKOFF)
+                ss.feed_next_poll = pytime.time() + ss.feed_backoff
+            else:
+                fresh = []
+
+            if fresh:
+                ss.feed_cursor = max(ss.feed_cursor or 0, max(inc.get("id") or 0 for inc in fresh))
+                ss.feed_new = (ss.feed_new + fresh)[-50:]
+
+            if not feed.connected:
+                st.warning(f"⚠ Live stream disconnected. Polling every {ss.feed_backoff}s…")
+
+            if ss.feed_new:
+                st.markdown(f"### 🚨 {len(ss.feed_new)} new incident(s)")
+                st.dataframe(incident_rows(reversed(ss.feed_new)), hide_index=True, use_container_width=True)
+
+            # -------- Paginated history (sorted server-side) --------
+            c1, c2, c3 = st.columns([2, 1, 1])
+            with c1:
+                sort = st.selectbox("Sort by", FEED_SORT_KEYS, key="feed_sort")
+            with c2:
+                order = st.selectbox("Order", ["desc", "asc"], key="feed_order")
+            with c3:
+                page_size = st.selectbox("Page size", [25, 50, 100, 250], index=1, key="feed_page_size")
+
+            view = (sort, order, page_size)
+            if ss.feed_page_key is None or ss.feed_page_key[0] != view:
+                ss.feed_page_cursors = [None]
+            cursor = ss.feed_page_cursors[-1]
+            # Page 1 follows new arrivals; deeper pages are stable keyset slices
+            page_key = (view, cursor, ss.feed_cursor if cursor is None else None)
+            if page_key != ss.feed_page_key:
+                try:
+                    ss.feed_page = fetch_incident_page(limit=page_size, cursor=cursor, order=order, sort=sort)
+                    ss.feed_page_key = page_key
+                except (requests.exceptions.RequestException, ValueError) as e:
+                    st.error(f"Could not load incidents: {e}")
+
+            items = ss.feed_page.get("items", [])
+            if items:
+                # st.dataframe virtualizes rows, so only the visible slice is drawn
+                st.dataframe(incident_rows(items), hide_index=True, use_container_width=True, height=400)
+            else:
+                st.info("No incidents yet.")
+
+            # on_click runs before the fragment re-renders, so the new page loads in the same pass
+            p1, p2, p3 = st.columns([1, 2, 1])
+            with p1:
+                st.button("◀ Prev", disabled=len(ss.feed_page_cursors) == 1, key="feed_prev",
+                          on_click=lambda: ss.feed_page_cursors.pop())
+            with p2:
+                st.caption(f"Page {len(ss.feed_page_cursors)} · sorted by {sort} ({order})")
+            with p3:
+                st.button("Next ▶", disabled=ss.feed_page.get("next_cursor") is None, key="feed_next",
+                          on_click=lambda: ss.feed_page_cursors.append(ss.feed_page["next_cursor"]))
 
-        for inc in reversed(incidents):
-            st.markdown("### 🚨 Incident")
-            st.json(inc)
+            if items:
+                by_id = {inc.get("id"): inc for inc in items}
+                selected = st.selectbox("Inspect incident", list(by_id), key="feed_inspect")
+                if selected is not None:
+                    st.json(by_id[selected], expanded=False)
+
+        live_incidents()
+
+        # -------- Metrics history (downsampled server-side) --------
+        st.divider()
+        st.subheader("📈 Metrics History")
+        metric_series = fetch_metric_series()
+        if metric_series:
+            m1, m2, m3 = st.columns([3, 1, 1])
+            with m1:
+                series_name = st.selectbox("Series", metric_series, key="metric_series")
+            with m2:
+                range_label = st.selectbox("Range", ["1h", "24h", "7d", "30d"], index=1, key="metric_range")
+            with m3:
+                ds_method = st.selectbox("Downsample", ["lttb", "minmax"], key="metric_method")
+
+            range_seconds = {"1h": 3600, "24h": 86400, "7d": 7 * 86400, "30d": 30 * 86400}[range_label]
+            end_ts = pytime.time()
+            result = query_metrics(series_name, start=end_ts - range_seconds, end=end_ts, points=600, method=ds_method)
+            points = result.get("points", [])
+            if points:
+                chart_df = pd.DataFrame(points, columns=["time", "value"])
+                chart_df["time"] = pd.to_datetime(chart_df["time"], unit="s")
+                st.line_chart(chart_df.set_index("time"))
+                st.caption(
+                    f"{len(points)} points from {result.get('source_points', 0)} "
+                    f"({result.get('resolution')} resolution, {result.get('method')})"
+                )
+            else:
+                st.info("No data points in this range yet.")
+        else:
+            st.info("No metrics recorded yet. Start the agent to collect CPU and endpoint latency.")
 
         # ===================== ADD-ON: AUTOSYS + DEPLOYMENTS LIVE PANELS =====================
         st.divider()
@@ -1398,7 +1567,8 @@ def main_app():
                     raw_answer = chatbot_answer_engine(
                         q,
                         st.session_state.ui_state,
-                        st.session_state.vuln_df
+                        st.session_state.vuln_df,
+                        kb_index
                     )
 
                     if raw_answer == "NOT_FOUND":
@@ -1440,7 +1610,8 @@ def main_app():
                     raw_answer = chatbot_answer_engine(
                         user_query,
                         st.session_state.ui_state,
-                        st.session_state.vuln_df
+                        st.session_state.vuln_df,
+                        kb_index
                     )
 
                     if raw_answer == "NOT_FOUND":
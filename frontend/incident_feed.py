@@ -0,0 +1,82 @@
+import threading
+import time
+from collections import deque
+
+import requests
+
+from api_client import fetch_incidents, stream_incidents
+
+
+class IncidentFeed:
+    """
+    One background SSE subscription shared by every Streamlit session in
+    this process. Keeps the newest `maxlen` incidents in memory and
+    reconnects with backoff, resuming from the last incident id it saw.
+    """
+
+    def __init__(self, maxlen=500):
+        self.incidents = deque(maxlen=maxlen)
+        self.last_id = None
+        self.connected = False
+        self.last_error = None
+        self._by_id = {}
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="incident-feed", daemon=True)
+        self._thread.start()
+
+    def _add(self, incident, update=False):
+        with self._lock:
+            existing = self._by_id.get(incident.get("id"))
+            if existing is not None:
+                existing.clear()
+                existing.update(incident)
+                return
+            # Updates only patch held incidents; appending one would break id order for since()
+            if update:
+                return
+            if len(self.incidents) == self.incidents.maxlen:
+                self._by_id.pop(self.incidents[0].get("id"), None)
+            self.incidents.append(incident)
+            self._by_id[incident.get("id")] = incident
+
+    def _run(self):
+        # Seed with the newest page, then follow the stream from there
+        for inc in fetch_incidents(limit=self.incidents.maxlen):
+            self._add(inc)
+            self.last_id = max(self.last_id or 0, inc.get("id") or 0)
+
+        backoff = 1
+        while True:
+            try:
+                for event, event_id, data in stream_incidents(cursor=self.last_id):
+                    self.connected = True
+                    backoff = 1
+                    if event == "incident":
+                        self._add(data)
+                        self.last_id = event_id
+                    elif event == "update":
+                        self._add(data, update=True)
+                    elif event == "resync":
+                        break
+            except (requests.exceptions.RequestException, ValueError) as e:
+                self.last_error = str(e)
+            self.connected = False
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+    def since(self, cursor):
+        """Incidents with id greater than cursor, oldest first (all of them if cursor is None)."""
+        with self._lock:
+            if cursor is None:
+                return [dict(i) for i in self.incidents]
+            out = []
+            for inc in reversed(self.incidents):
+                if (inc.get("id") or 0) <= cursor:
+                    break
+                out.append(dict(inc))
+            return out[::-1]
+
+    def snapshot(self):
+        """Incidents oldest first."""
+        with self._lock:
+            return [dict(i) for i in self.incidents]
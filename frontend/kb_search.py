@@ -0,0 +1,107 @@
+import bisect
+import math
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+# Question words that carry no meaning for a KB lookup
+STOPWORDS = frozenset(
+    "a an and any are as at be by can do does for from how i in is it me my of on or "
+    "related show tell the to what which with about list find give".split()
+)
+MAX_PREFIX_EXPANSIONS = 20
+
+
+def normalize_query(query):
+    return " ".join((query or "").lower().split())
+
+
+def query_tokens(query):
+    return [t for t in TOKEN_RE.findall(query.lower()) if t not in STOPWORDS]
+
+
+class KBSearchIndex:
+    """
+    Search index over the vulnerability KB DataFrame, built once per KB.
+
+    Every row is flattened into one lowercase text column; an inverted index
+    maps each token to the rows containing it. search() ranks rows by the
+    IDF weight of matched query tokens (a token with no exact hit matches
+    vocabulary words it prefixes, e.g. "vuln" -> "vulnerability"), with a
+    bonus when the whole query appears verbatim. Results are cached per
+    normalized query, and the cache is shared by every session.
+    """
+
+    def __init__(self, df, cache_size=1024):
+        self.df = df.reset_index(drop=True)
+        columns = [self.df[c].fillna("").astype(str) for c in self.df.columns]
+        self.text = columns[0].str.cat(columns[1:], sep=" | ").str.lower().tolist() if columns else []
+        postings = {}
+        for row, text in enumerate(self.text):
+            for token in set(TOKEN_RE.findall(text)):
+                postings.setdefault(token, []).append(row)
+        self.postings = {t: np.asarray(rows, dtype=np.int32) for t, rows in postings.items()}
+        self.vocabulary = sorted(postings)
+        total = max(1, len(self.text))
+        self.idf = {t: math.log(1 + total / len(rows)) for t, rows in postings.items()}
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _expand(self, token):
+        if token in self.postings:
+            return [token]
+        start = bisect.bisect_left(self.vocabulary, token)
+        out = []
+        for word in self.vocabulary[start:start + MAX_PREFIX_EXPANSIONS]:
+            if not word.startswith(token):
+                break
+            out.append(word)
+        return out
+
+    def _rank(self, query, k):
+        tokens = query_tokens(query)
+        if not tokens or not self.text:
+            return []
+        scores = np.zeros(len(self.text), dtype=np.float32)
+        for token in set(tokens):
+            words = self._expand(token)
+            if not words:
+                continue
+            rows = self.postings[words[0]] if len(words) == 1 else np.unique(
+                np.concatenate([self.postings[w] for w in words])
+            )
+            scores[rows] += max(self.idf[w] for w in words)
+        candidates = np.flatnonzero(scores)
+        if not candidates.size:
+            return []
+        # Shortlist by token score, then favour rows containing the whole query verbatim
+        shortlist = candidates[np.argsort(-scores[candidates], kind="stable")[: k * 20]]
+        ranked = [
+            (float(scores[row]) + (10.0 if query in self.text[row] else 0.0), int(row))
+            for row in shortlist
+        ]
+        ranked.sort(key=lambda item: (-item[0], item[1]))
+        return [row for _, row in ranked[:k]]
+
+    def search(self, query, k=3):
+        """Top-k KB rows (as record dicts) for the query, best first."""
+        key = (normalize_query(query), k)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return list(self._cache[key])
+        rows = self._rank(key[0], k)
+        records = self.df.iloc[rows].to_dict(orient="records") if rows else []
+        with self._lock:
+            self.misses += 1
+            self._cache[key] = records
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return list(records)